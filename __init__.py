@@ -1,19 +1,51 @@
 import sys
+import asyncio
 from importlib import reload
 import socket
+import selectors
 import re
-from os import environ
+import errno
+import logging
+from os import environ, strerror
 from time import sleep as pause
 from time import ctime as now
+from time import monotonic, perf_counter, strftime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from traceback import print_tb, print_exc
-from . import hooks, threads, parse
-from .parse import Parser
-from threading import Thread, Timer
+from . import hooks, threads, parse, state, stats, profiler, log
+from .parse import Parser, Message
+from threading import Thread, Timer, Lock, RLock, current_thread
 from typing import TypeVar, Optional, Any, NoReturn, Union, Callable, List, Tuple, Pattern
 
 action_regex = re.compile(r"^ACTION (.*)")
 
-T_Parser = TypeVar('T_Parser', bound=Parser)
+T_Parser = TypeVar('T_Parser', bound=Message)
+
+
+def _split_text(text: str, limit: int, encoding: str='utf-8') -> List[str]:
+    """
+    Splits text into parts of at most `limit` encoded bytes, at the last
+    space that fits or else on a character boundary.
+    """
+    data = text.encode(encoding)
+    parts = []
+    while len(data) > limit:
+        cut = data.rfind(b' ', 0, limit + 1)
+        if cut > 0:
+            parts.append(data[:cut].decode(encoding))
+            data = data[cut + 1:]
+            continue
+        cut = limit
+        while True:
+            try:
+                parts.append(data[:cut].decode(encoding))
+                break
+            except UnicodeDecodeError:
+                cut -= 1  # inside a multibyte character
+        data = data[cut:]
+    parts.append(data.decode(encoding))
+    return parts
 
 
 class Base(object):
@@ -36,6 +68,9 @@ class Base(object):
             # Port to connect.
             'port': 6667,
 
+            # Seconds to wait for the server to accept the connection
+            'connect_timeout': 30,
+
             # The 'nick' part of 'nick!user@host * name'
             'nick': nick,
 
@@ -60,35 +95,134 @@ class Base(object):
             # determines whether multiple matches are allowed per recieved line/msg
             'break_on_match': True,
 
-            # Extremely detailed output for logging
+            # Extremely detailed output for logging: sets the bot's logger
+            # (see log.py) to DEBUG, printed to stdout on a background thread
             'verbose': True,
 
             # Dictionary of keywords that get replaced by its value
             # or result of the value if the value is callable
             # Keywords searched for in the form of :keyword:
+            # (hook patterns are substituted once and cached until a
+            # value changes)
             'replace': {},
 
             # Automatically reconnect
-            'reconnect': True
+            'reconnect': True,
+
+            # Encoding used for the connection, and the one incoming lines
+            # fall back to when they aren't valid in it
+            'encoding': 'utf-8',
+            'fallback_encoding': 'latin-1',
+
+            # Initial size of the receive buffer, in bytes, and so the most
+            # read from the socket at once
+            'recv_size': 4096,
+
+            # Flood control for outgoing lines: up to `flood_burst` lines are
+            # sent at once, then `flood_rate` lines per second. A rate of 0
+            # or None turns it off.
+            'flood_burst': 5,
+            'flood_rate': 1.0,
+
+            # Seconds quit() waits for the lines held back by flood control
+            # to go out before the QUIT; any left after are dropped
+            'quit_timeout': 10,
+
+            # Bytes of outgoing lines buffered before they are written out
+            # ahead of the end of the current batch of received lines
+            'send_buffer': 4096,
+
+            # Joins messages sent with pack=True into a single line
+            'pack_separator': ' | ',
+
+            # Threads running matched hooks off the socket thread, one call
+            # at a time per channel or user. 0 runs hooks inline.
+            'workers': 0,
+
+            # Threads taking turns running the bot's interval hooks, so a
+            # slow one doesn't hold up the rest. Unused in a BotGroup,
+            # whose bots share its scheduler.
+            'interval_workers': 1,
+
+            # Seconds a hook may run on a worker before it is given up on,
+            # unless the hook sets its own timeout
+            'hook_timeout': None,
+
+            # Processes in the pool shared by hooks declared with
+            # executor='process'; None for one per CPU. The pool has the
+            # most any bot asked for. Its processes are started fresh
+            # (forkserver or spawn), so a script using them must start its
+            # bots under `if __name__ == '__main__':`
+            'processes': None,
+
+            # Record call counts and times of every hook and listener, but
+            # for pIRC's own (see hook_stats)
+            'hook_stats': True,
+
+            # Milliseconds after which a hook or listener call is logged
+            # as slow, with the line that triggered it; None to turn off
+            'slow_hook': None,
+
+            # File every line received and sent is recorded to, for
+            # replaying later (see capture.py); None to turn off
+            'capture': None
         }
 
         # update with passed config values
         self.config.update(kwargs)
         self.config['replace'].setdefault('command', self.config['command'])
 
-        self._inbuffer = ""
+        self._inbuffer = bytearray(self.config['recv_size'])
+        self._inlength = 0
         self.socket = None
         self.listeners = []
+        self._dispatch = {}
         self.queued = []
         self.ERROR = 0
-        self.ulist = {}
+        self.state = state.State()
         self.channels = {}
         self.isupport = {}
+        self._replace_cache = {}
+        self._replace_values = ()
+        self._userhost = None
+        self._outbound = deque()
+        self._outlock = RLock()
+        self._wbuffer = bytearray()
+        # held while writing to the socket, which is done outside _outlock
+        self._sendlock = Lock()
+        self._not_before = 0.0
+        self._tokens = float(self.config['flood_burst'])
+        self._refilled = monotonic()
+        self._sender = None
+        # runs interval hooks; a BotGroup hands every bot the same one
+        self.scheduler = None
+        # runs matched hooks when config['workers'] is set
+        self.pool = None
+        # process hooks the shared process pool hasn't been readied for yet
+        self._process_hooks = []
+        self.stats = stats.Stats()
+        # set while profile() runs: (profiler, path, timer)
+        self._profiler = None
+        self._capture = None
+        # set when a loop shared with other bots drives this one,
+        # which must then never sleep or block on its own
+        self._shared_loop = False
+        self._wakeup = None
         self._quitting = False
+        # when quit() stops waiting for the held back lines, and its message
+        self._quit_by = None
+        self._quit_message = None
         self._running = False
         self._registered = False
+        # see log.py; verbose bots log everything, to stdout by default
+        # once they connect (see _start_log)
+        self.log = log.for_bot(self.config['name'], host)
+        if self.config['verbose']:
+            self.log.setLevel(logging.DEBUG)
 
         # init funcs
+        if self.config['capture']:
+            self.start_capture(self.config['capture'])
         self._add_listeners()
         if self.__class__ == Base:
             self.load_hooks()
@@ -103,19 +237,66 @@ class Base(object):
         self._hooks = {}
         for func in access.__dict__.values():
             if callable(func) and hasattr(func, '_type'):
-                self._hooks.setdefault(func._type.lower(), [])
-                if hasattr(func, '_thread'):
-                    self._hooks[func._type.lower()].append(
-                        func._thread(func, self))
-                else:
-                    self._hooks[func._type.lower()].append(func)
+                self._hooks.setdefault(func._type.lower(), []).append(func)
+        # the process pool is readied for these on connect() or their first call
+        self._process_hooks = [func for funcs in self._hooks.values() for func in funcs
+                               if getattr(func, '_executor', None) == 'process']
+        self._clear_replace_cache()
         self._run_hooks('load')
 
+    def _clear_replace_cache(self) -> None:
+        """
+        Drops the cached hook patterns built from config['replace'] so they
+        are rebuilt on next use, eg. for hooks just (re)loaded. Changed
+        token values are noticed without it.
+        """
+        self._replace_cache.clear()
+
     def trigger(self, match: Union[dict, bool], func: Callable, temp: bool=False) -> None:
         """ 
         TODO: Documentation 
         """
-        self.listeners.append({'match': match, 'func': func, 'temp': temp})
+        verb = None
+        rest = match
+        if isinstance(match, dict) and isinstance(match.get('verb'), str):
+            # exact verbs are indexed, so only the remaining fields need comparing
+            verb = match['verb']
+            rest = {k: v for k, v in match.items() if k != 'verb'} or True
+        self.listeners.append({
+            'match': match,
+            'func': func,
+            'temp': temp,
+            'verb': verb,
+            'rest': rest,
+            # pIRC's own dispatch, called without timing: the hooks it runs
+            # are timed themselves
+            'own': getattr(func, '__module__', None) == __name__
+        })
+        self._dispatch.clear()
+
+    def _listeners_for(self, verb: str) -> list:
+        """
+        Returns the listeners, in registration order, that could match a line
+        with the given verb: those indexed under that exact verb plus those
+        matching on a regex verb or on anything at all.
+        Results are cached per verb until the listeners change.
+        """
+        if verb not in self._dispatch:
+            self._dispatch[verb] = [
+                x for x in self.listeners
+                if x['match'] is not False and x['verb'] in (None, verb)
+            ]
+        return self._dispatch[verb]
+
+    def _remove_listener(self, listener: dict) -> None:
+        """
+        Removes a listener from the registry and drops the dispatch cache.
+        """
+        for i, x in enumerate(self.listeners):
+            if x is listener:
+                del self.listeners[i]
+                self._dispatch.clear()
+                break
 
     def on_verb(self, verb: str, func: Callable, temp: bool=False) -> None:
         """ 
@@ -179,6 +360,8 @@ class Base(object):
         # Default code commands for bot state management
         self.on_code(5, self._005_compile_isupport)
         self.on_code(353, self._353_compile_ulist)
+        self.on_code(366, self._366_commit_ulist)
+        self.on_code(433, self._443_alt_nick)
         self.on_code(443, self._443_alt_nick)
         # Listener for code command hooks
         self.on_verb(re.compile(r'^\d{3}$'), self._run_CODES)
@@ -194,6 +377,7 @@ class Base(object):
         self.on_verb('PART', self._on_part)
         self.on_verb('NICK', self._on_nick)
         self.on_verb('QUIT', self._on_quit)
+        self.on_verb('KICK', self._on_kick)
 
         self.on_verb('MODE', self._on_mode)
         self.on_verb('PING', self._on_ping)
@@ -220,92 +404,394 @@ class Base(object):
         A new line is defined as ending in \r\n in the RFC, but some servers
         separate by \n. This script takes care of both.
         """
-        while True:
-            if not self._quitting:
-                try:
-                    self._inbuffer += self.socket.recv(2048).decode()
-                except socket.timeout:
-                    pass
-                # Some IRC daemons disregard the RFC and split lines by \n rather than \r\n.
-                temp = self._inbuffer.split("\n")
-                self._inbuffer = temp.pop()
-
-                for line in temp:
-                    # Strip \r from \r\n for RFC-compliant IRC servers.
-                    line = line.rstrip('\r')
-                    if len(line) == 0:
-                        continue  # skip empty lines
-                    if self.config['verbose']:
-                        print("({0}: {1}) << {2}".format(
-                            self.config['name'],
-                            self.config['host'],
-                            line
-                        ))
-                    self._running = True
-                    self._run_listeners(line)
-                if self.queue:
-                    self._running = True
-                    while len(self.queued) > 0:
-                        func, args, kwargs = self.queued.pop(0)
-                        func(*args, **kwargs)
-                self._running = False
+        # functions queued from other threads (eg. hooks run on workers)
+        # wake the thread instead of waiting out the socket timeout
+        selector = selectors.DefaultSelector()
+        wake_r, wake_w = socket.socketpair()
+        wake_r.setblocking(False)
+        wake_w.setblocking(False)
+        selector.register(wake_r, selectors.EVENT_READ, None)
+        selector.register(self.socket, selectors.EVENT_READ, True)
+
+        def wakeup():
+            try:
+                wake_w.send(b'\0')
+            except OSError:
+                pass  # already pending
+
+        self._wakeup = wakeup
+        try:
+            while self.socket and not self._quitting:
+                for key, _ in selector.select(self.socket.gettimeout()):
+                    if key.data is None:
+                        wake_r.recv(4096)
+                        continue
+                    try:
+                        self._process(self._recv())
+                    except socket.timeout:
+                        pass
+                self._run_queued()
+        finally:
+            self._wakeup = None
+            selector.close()
+            wake_r.close()
+            wake_w.close()
+
+    def _process(self, messages: List[Message]) -> None:
+        """
+        Runs the listeners for each received message in order, then writes
+        out every line they sent at once.
+        """
+        self._running = True
+        try:
+            debug = self.log.isEnabledFor(logging.DEBUG)
+            for info in messages:
+                if debug:
+                    log.traffic(self.log, "(%s: %s) << %s", self.config['name'], self.config['host'], info.raw)
+                self._run_listeners(info)
+        finally:
+            self._running = False
+        self._flush_writes()
+        capture = self._capture  # read once, stop_capture may run meanwhile
+        if capture is not None:
+            capture.flush(False)
+
+    def _recv_view(self) -> memoryview:
+        """
+        Returns a view of the free end of the receive buffer, growing the
+        buffer first if a single line has filled it.
+        """
+        if self._inlength == len(self._inbuffer):
+            self._inbuffer.extend(bytes(len(self._inbuffer)))
+        return memoryview(self._inbuffer)[self._inlength:]
+
+    def _recv(self) -> List[Message]:
+        """
+        Reads from the socket straight into the receive buffer and returns
+        the messages for every line completed by the read.
+        """
+        with self._recv_view() as view:
+            received = self.socket.recv_into(view)
+        if not received:
+            raise ConnectionResetError("Connection closed by the server.")
+        return self._frame(received)
+
+    def _frame(self, received: int) -> List[Message]:
+        """
+        Splits the complete lines off the front of the receive buffer after
+        `received` new bytes were written to it, keeping the partial line.
+
+        Framing is done on bytes, so a multibyte character split across reads
+        is only decoded once its line is complete.
+        """
+        start = self._inlength
+        self._inlength += received
+        end = self._inbuffer.rfind(b'\n', start, self._inlength) + 1
+        if not end:
+            return []
+        with memoryview(self._inbuffer) as view:
+            capture = self._capture
+            if capture is not None:
+                capture.inbound(view[:end])
+            text = parse.decode(
+                view[:end],
+                self.config['encoding'],
+                self.config['fallback_encoding']
+            )
+            rest = bytes(view[end:self._inlength])
+        self._inbuffer[:len(rest)] = rest
+        self._inlength = len(rest)
+        return parse.parse_many(text)[0]
 
     def _run_hooks(self, key: str, info: Optional[T_Parser] = None, once: Optional[bool] = None) -> bool:
         """ 
         TODO: Documentation 
         """
         if key in self._hooks:
-            for n, func in enumerate(self._hooks[key]):
+            funcs = self._hooks[key]
+            scanned = {}
+            if info is not None:
+                hooks._check_replace(self)
+            if key == 'raw' and info is not None:
+                # raw patterns are all checked in one pass over the line
+                scanned = hooks._raw_scan(self, funcs, info['raw'])
+            for func in list(funcs):
                 if info is None:
-                    func(self)
-                    if hasattr(func, '_once') and func._once is True:
-                        del self._hooks[key][n]
-                    if self.config['break_on_match']:
-                        return False
-
-                elif not hasattr(func, '_match') or info.compare(func._match):
-                    func(self, info.data)
-                    if hasattr(func, '_once') and func._once is True:
-                        del self._hooks[key][n]
-                    if self.config['break_on_match']:
-                        return False
+                    self._call(func, self)
+                else:
+                    if func in scanned:
+                        if scanned[func] is None:
+                            continue
+                        # taken by the hook instead of matching its pattern again
+                        info['match'] = scanned[func]
+                    elif hasattr(func, '_match') \
+                            and not info.compare(hooks._replace_fields(self, func), self.state.fold):
+                        continue
+                    if getattr(func, '_executor', None) == 'process':
+                        self._submit_process(func, info)
+                    elif self.config['workers']:
+                        self._submit(func, info)
+                    else:
+                        self._call(func, self, info)
+                if hasattr(func, '_once') and func._once is True:
+                    funcs.remove(func)
+                if self.config['break_on_match']:
+                    return False
         return True
 
+    def _call(self, func: Callable, *args) -> Any:
+        """
+        Calls a hook or listener, recording how long it took if
+        config['hook_stats'] is set and logging it with the triggering line
+        if it took over config['slow_hook'] milliseconds
+        """
+        config = self.config
+        record = config['hook_stats']
+        slow = config['slow_hook']
+        if not record and slow is None:
+            return func(*args)
+        failed = True
+        start = perf_counter()
+        try:
+            result = func(*args)
+            failed = False
+            return result
+        finally:
+            elapsed = perf_counter() - start
+            if record:
+                self.stats.record(func, elapsed, failed)
+            if slow is not None and elapsed*1000 >= slow:
+                self._log_slow(func, elapsed, args[-1] if args else None)
+
+    def _log_slow(self, func: Callable, elapsed: float, info: Any) -> None:
+        self.log.warning(
+            "(%s: %s) Slow hook %s took %.1f ms%s",
+            self.config['name'],
+            self.config['host'],
+            stats.name(func),
+            elapsed*1000,
+            " on: " + info['raw'] if isinstance(info, Message) else ""
+        )
+
+    def hook_stats(self, reset: bool=False) -> dict:
+        """
+        Call counts, errors and times in milliseconds (total, mean, p50,
+        p90, p99, max) of every hook and listener called so far, by name,
+        slowest in total first. pIRC's own listeners, which dispatch to the
+        hooks, aren't timed. With `reset`, counting starts over.
+        """
+        return stats.report([self.stats.timings(reset)])
+
+    def profile(self, seconds: Optional[float]=10, path: Optional[str]=None,
+                mode: str='sample', interval: float=0.005) -> str:
+        """
+        Profiles the thread the bot listens on (which runs its listeners
+        and inline hooks) for `seconds`, or until stop_profile() if None.
+        Returns the file the results are written to when it stops.
+
+        mode = 'sample' takes the thread's stack every `interval` seconds
+            and writes collapsed stacks, with hook and listener names;
+            cheap enough for a busy connection.
+            'cprofile' traces every call and writes pstats, at a cost.
+        """
+        if mode == 'sample':
+            suffix = 'folded'
+        elif mode == 'cprofile':
+            suffix = 'prof'
+        else:
+            raise Exception("mode must be 'sample' or 'cprofile'")
+        if self._profiler is not None:
+            raise Exception('Already profiling, see stop_profile()')
+        if path is None:
+            path = '{0}-{1}-{2}.{3}'.format(
+                self.config['name'], self.config['host'], strftime('%Y%m%d-%H%M%S'), suffix)
+        timer = None
+        if seconds is not None:
+            timer = Timer(seconds, self.stop_profile)
+            timer.daemon = True
+        self._profiler = (None, path, timer)
+        # started from the listening thread itself, whichever it is
+        self.queue(self._start_profile, mode, interval)
+        return path
+
+    def _start_profile(self, mode: str, interval: float) -> None:
+        if self._profiler is None or self._profiler[0] is not None:
+            return  # stopped before it started
+        _, path, timer = self._profiler
+        if mode == 'sample':
+            prof = profiler.Sampler(interval=interval)
+        else:
+            prof = profiler.Tracer()
+        self._profiler = (prof, path, timer)
+        prof.start()
+        if timer is not None:
+            timer.start()
+
+    def stop_profile(self) -> None:
+        """
+        Stops profile() early and writes out the results
+        """
+        if self._profiler is not None:
+            # a cProfile can only be stopped by the thread it runs on
+            self.queue(self._stop_profile)
+
+    def _stop_profile(self) -> None:
+        if self._profiler is None:
+            return
+        prof, path, timer = self._profiler
+        self._profiler = None
+        if timer is not None:
+            timer.cancel()
+        if prof is not None:
+            prof.stop()
+            prof.dump(path)
+            self.log.info("(%s: %s) Profile written to %s",
+                          self.config['name'], self.config['host'], path)
+
+    def start_capture(self, path: str) -> None:
+        """
+        Records every line received and sent from now on to a capture
+        file, appending to it if it exists. See capture.replay.
+        """
+        # not imported with the package, so `python -m pIRC.capture` runs cleanly
+        from . import capture
+        self.stop_capture()
+        self._capture = capture.Capture(
+            path, "{0} {1}".format(self.config['name'], self.config['host']))
+
+    def stop_capture(self) -> None:
+        """
+        Stops recording lines and closes the capture file
+        """
+        if self._capture is not None:
+            prev, self._capture = self._capture, None
+            prev.close()
+
+    def _submit(self, func: Callable, info: T_Parser) -> None:
+        """
+        Hands a matched hook to the worker pool, behind the calls for the
+        same channel (or the sending user, for anything else)
+        """
+        if self.pool is None:
+            self.pool = threads.WorkerPool(
+                self, self.config['workers'], self.config['hook_timeout'])
+        key = self._reply_target(info)
+        self.pool.submit(func, (self, info.copy()), key and self.state.fold(key),
+                         getattr(func, '_timeout', None))
+
+    def _process_pool(self) -> 'threads.ProcessPoolExecutor':
+        """
+        The shared process pool, (re)started if need be to run the bot's
+        process hooks the first time after they were loaded, so the hook
+        modules are imported into it once (see threads.start_process_pool)
+        """
+        if self._process_hooks:
+            remote, self._process_hooks = self._process_hooks, []
+            return threads.start_process_pool(
+                self.config['processes'],
+                {func.__module__ for func in remote} - {'__main__'},
+                remote
+            )
+        return threads.process_pool()
+
+    def _submit_process(self, func: Callable, info: T_Parser) -> None:
+        """
+        Ships a matched hook to the shared process pool, with a stand-in
+        for the bot. Whatever the hook returns is sent back where the line
+        came from once it's done.
+        """
+        config = {k: v for k, v in self.config.items()
+                  if isinstance(v, (str, int, float, bool, list, tuple, type(None)))}
+        config['replace'] = {
+            k: str(v(self)) if callable(v) else str(v)
+            for k, v in self.config['replace'].items()
+        }
+        info = info.copy()
+        for key in ('tags', 'source', 'args'):
+            info[key]  # parse the lazy fields before pickling
+        info.pop('match', None)
+        remote = threads.Remote(config, dict(self.isupport))
+        start = perf_counter()
+        future = self._process_pool().submit(
+            threads._run_remote, func, remote, info)
+        future.add_done_callback(lambda future: self.queue(
+            self._process_done, func, info, future, perf_counter() - start))
+
+    def _process_done(self, func: Callable, info: T_Parser, future, elapsed: float) -> None:
+        """
+        Makes the calls recorded by a hook run on the process pool and
+        sends what it returned. Its time is recorded from when it was
+        submitted, so it includes any wait for a free process.
+        """
+        if self.config['hook_stats']:
+            self.stats.record(func, elapsed, future.exception() is not None)
+        slow = self.config['slow_hook']
+        if slow is not None and elapsed*1000 >= slow:
+            self._log_slow(func, elapsed, info)
+        try:
+            result, calls = future.result()
+        except Exception:
+            self._log_exception()
+            return
+        for name, args, kwargs in calls:
+            getattr(self, name)(*args, **kwargs)
+        target = self._reply_target(info)
+        if result is not None and target:
+            self.message(target, result)
+
+    def _reply_target(self, info: T_Parser) -> Optional[str]:
+        """
+        The channel a line was sent to, or else the user who sent it
+        """
+        target = info.get('target')
+        if not target and info['args']:
+            target = info['args'][0]
+        if not self._is_channel(target):
+            target = info['source']['nick'] if info['source'] else None
+        return target
+
+    def _is_channel(self, name: Optional[str]) -> bool:
+        """
+        Whether name is a channel, going by ISUPPORT CHANTYPES
+        """
+        return bool(name) and name[0] in self.isupport.get('CHANTYPES', '#&')
+
+    def _is_self(self, nick: Optional[str]) -> bool:
+        """
+        Whether nick is the bot's own, under the server's CASEMAPPING
+        """
+        return nick is not None and self.state.fold(nick) == self.state.fold(self.config['nick'])
+
     def _run_threads(self) -> True:
-        """ 
-        TODO: Documentation 
         """
-        if 'thread' in self._hooks:
-            for n, thread in enumerate(self._hooks['thread']):
-                if thread.is_shutdown() or thread.is_alive():
-                    self._hooks[n] = thread.copy()
-                    self._hooks[n].start()
-                else:
-                    thread.start()
-            else:
-                return True
+        (Re)schedules the interval hooks on the bot's scheduler, which is
+        shared by every bot of a BotGroup (see threads.Scheduler for how
+        many may run at once)
+        """
+        if self.scheduler is None:
+            self.scheduler = threads.Scheduler(self.config['interval_workers'])
+        self.scheduler.schedule(self, self._hooks.get('interval', []))
+        return True
 
-    def _run_listeners(self, line: str) -> None:
+    def _run_listeners(self, line: Union[str, Message]) -> None:
         """
         Each listener's associated regular expression is matched against raw IRC
         input. If there is a match, the listener's associated function is called
         with all the regular expression's matched subgroups.
+        Accepts either a raw line or an already parsed Message.
         """
-        info = Parser(line)
-
-        for i, listener in enumerate(self.listeners):
-            temp = listener['temp'] is True
-            callback = listener['func']
+        info = line if isinstance(line, Message) else Message(line)
 
-            if listener['match'] is True:
-                pass
-            elif listener['match'] is False:
-                continue
-            elif not info.compare(listener['match']):
+        for listener in self._listeners_for(info['verb']):
+            if listener['rest'] is not True and not info.compare(listener['rest'], self.state.fold):
                 continue
 
-            callback(info)
-            if temp: del self.listeners[i]
+            if listener['own']:
+                listener['func'](info)
+            else:
+                self._call(listener['func'], info)
+            if listener['temp'] is True:
+                self._remove_listener(listener)
 
         self._run_hooks('once', info, True)
 
@@ -324,7 +810,7 @@ class Base(object):
         else:
             if info['message'].startswith(self.config['command']):
                 info['message'] = info['message'][len(self.config['command']):]
-                if info['target'].startswith('#'):
+                if self._is_channel(info['target']):
                     if not self._run_hooks('chancommand', info):
                         return
                 else:
@@ -332,12 +818,11 @@ class Base(object):
                         return
                 if not self._run_hooks('command', info):
                     return
-            if info['target'].startswith('#'):
+            if self._is_channel(info['target']):
                 if not self._run_hooks('channel', info):
                     return
-                else:
-                    if not self._run_hooks('private', info):
-                        return
+            elif not self._run_hooks('private', info):
+                return
             if not self._run_hooks('privmsg', info):
                 return
 
@@ -450,7 +935,7 @@ class Base(object):
         """ 
         TODO: Documentation 
         """
-        self._cmd('PONG', info['args'][-1])
+        self._cmd('PONG', info['args'][-1], priority=True)
 
     def _on_pong(self, info: T_Parser) -> None:
         """ 
@@ -475,34 +960,61 @@ class Base(object):
                 self.isupport['PREFIX'] = []
             match = re.match(r'\((\w+)\)(\S+)', isupport['PREFIX'])
             self.isupport['PREFIX'].extend(zip(match.group(1), match.group(2)))
+            self.state.prefix(self.isupport['PREFIX'])
+        if 'TARGMAX' in isupport:
+            # eg. TARGMAX=PRIVMSG:4,NOTICE:4,JOIN: (no value means no limit)
+            self.isupport['TARGMAX'] = {}
+            for x in (isupport['TARGMAX'] or '').split(','):
+                cmd, _, limit = x.partition(':')
+                if cmd:
+                    self.isupport['TARGMAX'][cmd.upper()] = int(limit) if limit else None
+        if 'MAXTARGETS' in isupport and isupport['MAXTARGETS']:
+            self.isupport['MAXTARGETS'] = int(isupport['MAXTARGETS'])
+        if 'CHANMODES' in isupport and isupport['CHANMODES']:
+            self.isupport['CHANMODES'] = (isupport['CHANMODES'].split(',') + ['']*4)[:4]
+        if 'CASEMAPPING' in isupport:
+            self.isupport['CASEMAPPING'] = isupport['CASEMAPPING']
+            self.state.casemapping(isupport['CASEMAPPING'])
+        if 'CHANTYPES' in isupport:
+            self.isupport['CHANTYPES'] = isupport['CHANTYPES'] or ''
+        for x in ('USERLEN', 'HOSTLEN'):
+            if x in isupport and isupport[x]:
+                self.isupport[x] = int(isupport[x])
+
+    def _pack_targets(self, cmd: str, targets: List[str]) -> List[str]:
+        """
+        Joins targets into comma separated lists as long as the server
+        allows for the command, going by ISUPPORT TARGMAX (or the older
+        MAXTARGETS for PRIVMSG/NOTICE). Without either one target is sent
+        per line.
+        """
+        if 'TARGMAX' in self.isupport and cmd in self.isupport['TARGMAX']:
+            limit = self.isupport['TARGMAX'][cmd]
+        elif cmd in ('PRIVMSG', 'NOTICE'):
+            limit = self.isupport.get('MAXTARGETS', 1)
+        else:
+            limit = 1
+        if limit is None:
+            limit = len(targets)
+        if limit <= 1:
+            return list(targets)
+        return [','.join(targets[i:i+limit]) for i in range(0, len(targets), limit)]
 
     def _353_compile_ulist(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        if info['args'][0] == '=': # TODO: implement type properly
-            info['args'].pop(0)
-        channel, args, *rest = info['args']
-        rest = rest 
-        for user in args.split():
-            if 'PREFIX' in self.isupport:
-                u = list(user)
-                m = modes = ''
-                while u[0] in [y for x, y in self.isupport['PREFIX']]:
-                    m += u.pop(0)
-                user = ''.join(u)
-                for mode, prefix in self.isupport['PREFIX']:
-                    if prefix in m:
-                        modes += mode
-                self.ulist.setdefault(user, {})
-                if modes:
-                    self.ulist[user].update({channel: modes})
-                else:
-                    self.ulist[user].update({channel: ''})
-            else:
-                self.ulist[user].update({channel: ''})
+        Collects the members listed in a NAMES reply
+        """
+        *_, channel, names = info['args']
+        self.state.names(channel, names)
+
+    def _366_commit_ulist(self, info: T_Parser) -> None:
+        """
+        Ends a NAMES reply, replacing the channel's members with those listed
+        """
+        if len(info['args']) > 1:
+            self.state.commit(info['args'][1], self.config['nick'])
 
-    def _443_alt_nick(self) -> None:
+    def _443_alt_nick(self, info: T_Parser) -> None:
         """ 
         TODO: Documentation 
         """
@@ -510,103 +1022,91 @@ class Base(object):
         self.nick(self.config['nick'])
 
     def _on_mode(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        pass
-        # self._ulist_modes(info)  # placeholder
-
-    def _ulist_modes(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
+        Tracks the prefix modes (op, voice, ...) of channel members
         """
-        user, modes, *args = info['args']
-        state = None
-        offset = 0
-        modes = list(modes)
-        for n, mode in enumerate(modes):
+        target, *args = info['args']
+        if not args or not self._is_channel(target):
+            return  # user modes
+        prefixes = self.state.modebits
+        listed, key, limit, _ = self.isupport.get('CHANMODES', ['beI', 'k', 'l', 'imnpst'])
+        params = iter(args[1:])
+        add = True
+        for mode in args[0]:
             if mode in '+-':
-                state = mode
-                offset += 1
-            else:
-                if not state:
-                    continue
-                elif state == '+':
-                    self.ulist[args[n-offset]].update(
-                        {user: self.ulist[args[n-offset]][user]+mode}
-                    )
-                elif state == '-':
-                    self.ulist[args[n-offset]].update(
-                        {user: self.ulist[args[n-offset]]
-                            [user].replace(mode, '')}
-                    )
+                add = mode == '+'
+            elif mode in prefixes:
+                nick = next(params, None)
+                if nick:
+                    self.state.mode(target, nick, mode, add)
+            elif mode in listed or mode in key or add and mode in limit:
+                next(params, None)
 
     def _on_join(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        self._manage_ulist(info)  # placeholder
-        pass
+        Adds the joining user to the channel state
+        """
+        source = info['source']
+        if not source:
+            return
+        if self._is_self(source['nick']) and source['host']:
+            # the server's echo of our own JOIN tells what it relays us as
+            self._userhost = '{}@{}'.format(source['user'], source['host'])
+        self.state.join(info['args'][0], source['nick'], source['user'], source['host'])
 
     def _on_part(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        # self._manage_ulist(info)  # placeholder
-        pass
+        Removes the parting user from the channel state, or the whole
+        channel if it's the bot leaving
+        """
+        if info['source']:
+            self._leave(info['args'][0], info['source']['nick'])
+
+    def _on_kick(self, info: T_Parser) -> None:
+        """
+        Removes the kicked user from the channel state, or the whole
+        channel if it's the bot
+        """
+        if len(info['args']) > 1:
+            self._leave(info['args'][0], info['args'][1])
+
+    def _leave(self, channel: str, nick: str) -> None:
+        if self._is_self(nick):
+            self.state.drop(channel)
+        else:
+            self.state.part(channel, nick)
 
     def _on_nick(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        # self._manage_ulist(info)  # placeholder
-        pass
+        Renames the user in the channel state, and updates the bot's own
+        nick when it's the one changing
+        """
+        if not info['source']:
+            return
+        self.state.nick(info['source']['nick'], info['args'][0])
+        if self._is_self(info['source']['nick']):
+            self.config['nick'] = info['args'][0]
 
     def _on_quit(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
         """
-        # self._manage_ulist(info)  # placeholder
-        pass
+        Removes the quitting user from every channel
+        """
+        if info['source']:
+            self.state.quit(info['source']['nick'])
 
-    def _manage_ulist(self, info: T_Parser) -> None:
-        """ 
-        TODO: Documentation 
+    @property
+    def ulist(self) -> dict:
+        """
+        Nicks mapped to {channel: modes}, built from `state`. Kept for hooks
+        written against the old ulist; use `state` for lookups.
         """
-        u = info['source']['user']
-        args = info['args'][0]
-        if info['verb'] == 'JOIN':
-            self.ulist.setdefault(u, {})
-            self.ulist[u].update({'args': ''})
-
-        elif info['verb'] == 'NICK':
-            if u in self.ulist:
-                self.ulist[args] = self.ulist[u]  # TODO: update args
-                del self.ulist[u]
-            if self.config['nick'] == u:
-                self.config['nick'] = args
-
-        elif info['verb'] == 'PART':
-            if u == self.config['nick']:
-                for u in self.ulist.keys():
-                    del self.ulist[u][args]
-                    if not len(self.ulist[u]):
-                        del self.ulist[u]
-            elif u in self.ulist:
-                del self.ulist[u][args]
-                if not len(self.ulist[u]):
-                    del self.ulist[u]
-
-        elif info['verb'] == 'QUIT':
-            if u in self.ulist:
-                del self.ulist[u]
-
-        # self.listeners.insert(0, {
-        #     'temp': True,
-        #     'func': self._init,
-        #     'match': {'command': 'PONG', 'args': ['_init_']} # verify
-        # })
-        # self.ping('_init_')
+        state = self.state
+        with state._lock:
+            return {
+                user.nick: {state.channels[ckey].name: state.letters(state.channels[ckey].members[nkey])
+                            for ckey in user.channels}
+                for nkey, user in state.users.items()
+            }
 
     def _init(self) -> None:
         """ 
@@ -632,85 +1132,288 @@ class Base(object):
         TODO: Documentation 
         """
         self.queued.append((func, args, kwargs))
+        if self._wakeup:
+            self._wakeup()
 
-    def _cmd(self, cmd: str, *args) -> None:
+    def _run_queued(self) -> None:
+        """
+        Runs the functions queued with @hooks.queue, in order.
+        """
+        self._running = True
+        try:
+            while len(self.queued) > 0:
+                func, args, kwargs = self.queued.pop(0)
+                func(*args, **kwargs)
+        finally:
+            self._running = False
+        self._flush_writes()
+
+    def _cmd(self, cmd: str, *args, priority: bool=False) -> None:
         usecolon = False
         for x in args:
-            if x.find(' ') > -1 or len(x) == 0:
+            if x.find(' ') > -1 or len(x) == 0 or x.startswith(':'):
                 usecolon = True
             if not usecolon:
                 cmd += ' {0}'.format(x)
             else:
                 cmd += ' :{0}'.format(x)
-        self._raw_cmd(cmd)
-
-    def _raw_cmd(self, raw_line: str) -> None:
-        if self.config['verbose']:
-            # prints to console, does not support UTF8. Convert to \u style output?
-            print("({0}: {1}) >> {2}".format(
-                self.config['name'],
-                self.config['host'],
-                raw_line
-                # "".join([x if ord(x) < 128 else '?' for x in raw_line])
-            ))
+        self._raw_cmd(cmd, priority)
+
+    def _raw_cmd(self, raw_line: str, priority: bool=False) -> None:
+        if self.log.isEnabledFor(logging.DEBUG):
+            log.traffic(self.log, "(%s: %s) >> %s", self.config['name'], self.config['host'], raw_line)
+        self._send((raw_line+"\r\n").encode(self.config['encoding']), priority)
+
+    def _send(self, data: bytes, priority: bool=False) -> None:
+        """
+        Writes an encoded line if flood control allows, otherwise queues it
+        for the outbound scheduler and returns straight away.
+
+        Lines go out in order, no sooner than the time set by _delay.
+        Priority lines (PONG) skip the queue and the wait, and use up no
+        token, so answering the server's PINGs can't starve the queue.
+        """
+        with self._outlock:
+            now = monotonic()
+            if priority or not self._outbound and self._not_before <= now \
+                    and not self._take_token(now):
+                # written out straight away when not sent while handling
+                # received lines or queued functions, as there's no batch
+                # to wait for
+                flush = self._write(data) or not self._running
+            else:
+                self._outbound.append((max(now, self._not_before), data))
+                flush = None
+        if flush is None:
+            self._schedule_flush()
+        elif flush:
+            self._flush_writes()
+
+    def _take_token(self, now: float) -> float:
+        """
+        Takes a token from the flood control bucket. Returns 0 if one was
+        taken, or else the seconds until one is available.
+        """
+        rate = self.config['flood_rate']
+        if not rate:
+            return 0.0
+        self._tokens = min(
+            float(self.config['flood_burst']),
+            self._tokens + (now - self._refilled)*rate
+        )
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens)/rate
+
+    def _write(self, data: bytes) -> bool:
+        """
+        Buffers an encoded line. Returns whether the buffer has grown past
+        `send_buffer`, in which case the caller should write it out (with
+        _flush_writes, once it has let go of _outlock).
+        """
+        with self._outlock:
+            capture = self._capture
+            if capture is not None:
+                capture.outbound(data)
+            self._wbuffer += data
+            return len(self._wbuffer) >= self.config['send_buffer']
+
+    def _flush_writes(self) -> None:
+        """
+        Writes out the buffered lines, without holding _outlock, so other
+        threads can go on sending (and PONGs buffering) meanwhile. If
+        another thread is already writing, it writes these lines as well
+        and this returns straight away.
+        """
+        while self._wbuffer and self.socket:
+            if not self._sendlock.acquire(False):
+                return
+            try:
+                if not self._send_buffered():
+                    return
+            finally:
+                self._sendlock.release()
+
+    def _send_buffered(self) -> bool:
+        """
+        Takes the buffered lines and writes them to the socket, with
+        _sendlock held. Short writes are continued, and whatever is left
+        after a timeout (or that a non-blocking socket can't take yet) is
+        put back in front of the buffer for the next call. Returns whether
+        everything was written.
+        """
+        sock = self.socket
+        if sock is None:
+            return False
+        with self._outlock:
+            data, self._wbuffer = self._wbuffer, bytearray()
+        sent = 0
         try:
-            print
-            self.socket.send(str.encode(raw_line+"\r\n"))
+            with memoryview(data) as view:
+                while sent < len(view):
+                    sent += sock.send(view[sent:])
+            return True
         except socket.timeout:
-            print(">>>Socket timed out.")
+            self.log.warning("(%s: %s) Socket timed out.", self.config['name'], self.config['host'])
+        except BlockingIOError:
+            pass  # a non-blocking socket is full, see BotGroup._multiplex
+        finally:
+            if sent < len(data):
+                with self._outlock:
+                    self._wbuffer[:0] = data[sent:]
+        return False
+
+    def _schedule_flush(self) -> None:
+        """
+        Called when a line is queued, so that _flush gets called in time for
+        it; by the bot's sender thread, or by the loop driving it.
+        """
+        if self._sender:
+            self._sender.wake()
+        elif self._wakeup:
+            self._wakeup()
+
+    def _flush(self) -> Optional[float]:
+        """
+        Writes the queued lines that are due and allowed by flood control.
+        Returns when the next one is due, if any remain. Once quit() is
+        waiting on them, it's called again when none remain or it's given
+        up waiting.
+        """
+        while True:
+            with self._outlock:
+                now = monotonic()
+                due = full = None
+                while self._outbound and not full:
+                    when = self._outbound[0][0]
+                    if when > now:
+                        due = when
+                        break
+                    wait = self._take_token(now)
+                    if wait:
+                        due = now + wait
+                        break
+                    full = self._write(self._outbound.popleft()[1])
+            # written outside the lock, going on once a full buffer is out
+            self._flush_writes()
+            if not full:
+                quit_by = self._quit_by
+                if quit_by:
+                    if due is None or monotonic() >= quit_by:
+                        # queued once, it quits straight away
+                        self._quit_by = 0.0
+                        self.quit(self._quit_message)
+                        return None
+                    due = min(due, quit_by)
+                return due
+
+    def _drain(self) -> None:
+        """
+        Writes the held back lines flood control allows straight away and
+        drops the rest with a warning, so closing the connection doesn't
+        flood the server. quit() waits for them first (see quit_timeout).
+        """
+        with self._outlock:
+            now = monotonic()
+            while self._outbound and not self._take_token(now):
+                self._write(self._outbound.popleft()[1])
+            dropped = len(self._outbound)
+            self._outbound.clear()
+        if dropped:
+            self.log.warning("(%s: %s) Dropped %d held back lines on closing",
+                             self.config['name'], self.config['host'], dropped)
 
     # Functions that are common use case for sending commands to the server
 
-    @hooks.queue()
-    def message(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str]) -> None:
-        """ 
-        TODO: Documentation 
+    def _deliver(self, cmd: str, targets: Union[List[str], str],
+                 messages: Union[List[Tuple[str, int]], List[str], str],
+                 pack: bool=False, action: bool=False) -> None:
+        """
+        Sends each message to every target, split to fit the server's line
+        length. A (message, seconds) tuple holds back the following lines.
+        With `pack`, consecutive messages are joined by `pack_separator`
+        into as few lines as will fit.
         """
         if isinstance(targets, str):
             targets = [targets]
         if isinstance(messages, str):
             messages = [messages]
+        prefix = "ACTION " if action else ""
+        packed = self._pack_targets(cmd, targets)
+        if not packed:
+            return
+        limit = min(self._line_budget(cmd, x) for x in packed) - len(prefix)
+        if pack:
+            messages = self._pack_messages(messages, limit)
         for y in messages:
-            z = 1
+            z = 0
             if isinstance(y, tuple) and len(y) == 2:
                 y, z = y
-            for x in targets:
-                self._cmd("PRIVMSG", x, str(y))
-            pause(z)
+            for part in _split_text(str(y), limit, self.config['encoding']):
+                for x in packed:
+                    self._cmd(cmd, x, prefix + part)
+            if z:
+                self._delay(z)
+
+    def _line_budget(self, cmd: str, target: str) -> int:
+        """
+        Bytes left for the text of a `cmd target :text` line once the server
+        relays it with the bot's nick!user@host in front, within the 512
+        bytes (with CR-LF) allowed for a line.
+        Until the bot has seen its own user@host, the longest allowed is assumed.
+        """
+        userhost = self._userhost or '~{}@{}'.format(
+            self.config['ident'][:int(self.isupport.get('USERLEN') or 10)],
+            'x' * int(self.isupport.get('HOSTLEN') or 63)
+        )
+        overhead = ':{}!{} {} {} :\r\n'.format(self.config['nick'], userhost, cmd, target)
+        return max(512 - len(overhead.encode(self.config['encoding'])), 16)
+
+    def _pack_messages(self, messages: list, limit: int) -> list:
+        """
+        Joins consecutive messages that fit in one line of `limit` bytes.
+        Messages with a delay end a run.
+        """
+        packed = []
+        joinable = False
+        separator = self.config['pack_separator']
+        encode = lambda x: len(x.encode(self.config['encoding']))
+        for y in messages:
+            if isinstance(y, tuple) and len(y) == 2:
+                if joinable and encode(packed[-1] + separator + str(y[0])) <= limit:
+                    packed[-1] = (packed[-1] + separator + str(y[0]), y[1])
+                else:
+                    packed.append((str(y[0]), y[1]))
+                joinable = False
+            elif joinable and encode(packed[-1] + separator + str(y)) <= limit:
+                packed[-1] += separator + str(y)
+            else:
+                packed.append(str(y))
+                joinable = True
+        return packed
 
     @hooks.queue()
-    def notice(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str]) -> None:
+    def message(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str], pack: bool=False) -> None:
         """ 
         TODO: Documentation 
         """
-        if isinstance(targets, str):
-            targets = [targets]
-        if isinstance(messages, str):
-            messages = [messages]
-        for y in messages:
-            z = 1
-            if isinstance(y, tuple) and len(y) == 2:
-                y, z = y
-            for x in targets:
-                self._cmd("NOTICE", x, str(y))
-            pause(z)
+        self._deliver("PRIVMSG", targets, messages, pack)
 
     @hooks.queue()
-    def me(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str]) -> None:
+    def notice(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str], pack: bool=False) -> None:
         """ 
         TODO: Documentation 
         """
-        if isinstance(targets, str):
-            targets = [targets]
-        if isinstance(messages, str):
-            messages = [messages]
-        for y in messages:
-            z = 1
-            if isinstance(y, tuple) and len(y) == 2:
-                y, z = y
-            for x in targets:
-                self._cmd("PRIVMSG", x, "ACTION {}".format(y))
-            pause(z)
+        self._deliver("NOTICE", targets, messages, pack)
+
+    @hooks.queue()
+    def me(self, targets: Union[List[str], str], messages: Union[List[Tuple[str, int]], List[str], str], pack: bool=False) -> None:
+        """ 
+        TODO: Documentation 
+        """
+        self._deliver("PRIVMSG", targets, messages, pack, True)
 
     @hooks.queue()
     def join(self, *channels: Tuple[Union[str, tuple]]) -> None:
@@ -749,21 +1452,39 @@ class Base(object):
 
     @hooks.queue()
     def quit(self, message: str="Connection Closed") -> None:
-        """ 
-        TODO: Documentation 
         """
-        self._cmd("QUIT", message)
+        Quits with message, once the lines held back by flood control have
+        gone out, or config['quit_timeout'] seconds have passed. Calling it
+        again while it waits quits straight away.
+        """
+        if self._outbound and self._quit_by is None and self.config['quit_timeout']:
+            self._quit_by = monotonic() + self.config['quit_timeout']
+            self._quit_message = message
+            # woken to send the QUIT by _flush
+            self._schedule_flush()
+            return
+        self._quit_by = None
         self._quitting = True
+        # any lines left are dropped, as far as flood control allows
+        self._drain()
+        self._cmd("QUIT", message, priority=True)
         self._close()
 
-    # func that makes the bot's thread pasue for a given amount of seconds
+    def _delay(self, time: float) -> None:
+        """
+        Spaces out outgoing messages; holds back the next line for `time` seconds.
+        """
+        with self._outlock:
+            self._not_before = max(monotonic(), self._not_before) + time
+
+    # func that holds back the bot's outgoing lines for a given amount of seconds
 
     @hooks.queue()
     def pause(self, time: int=1) -> None:
         """ 
         TODO: Documentation 
         """
-        pause(time)
+        self._delay(time)
 
     # def color(self, matcher) -> str:
     #     return re.sub(':(\d)(?:,(\d))?:', _color_replace, matcher)
@@ -791,45 +1512,59 @@ class Base(object):
         """
         if self.socket:
             self._close(False)
-            print("--- {0}: {1} ---".format(
-                self.config['name'],
-                self.config['host']
-            ))
-            if self.config['verbose']:
-                print("Connection closed.")
+            self.log.info("(%s: %s) Connection closed.", self.config['name'], self.config['host'])
             self._run_hooks('disconnect')
 
+        if self._shared_loop:
+            # the loop driving this bot opens the new connection
+            return self.config['reconnect'] or None
+
         if self.ERROR >= 10:
-            print("There have been 10 or more failed attempts to reconnect.")
-            print(
-                "Please wait till the bot is able to do so, then press enter to try again.")
+            self.log.error(
+                "(%s: %s) There have been 10 or more failed attempts to reconnect. "
+                "Please wait till the bot is able to do so, then press enter to try again.",
+                self.config['name'], self.config['host'])
             input('Press ENTER to continue')
         elif self.ERROR:
             waittime = 30*self.ERROR+30
-            print(f"Error occurred (see stack trace). Waiting {waittime} seconds to reconnect.")
+            self.log.warning("(%s: %s) Error occurred (see stack trace). Waiting %d seconds to reconnect.",
+                             self.config['name'], self.config['host'], waittime)
             pause(waittime)
         elif self.config['reconnect']:
             # input()
-            if self.config['verbose']:
-                print("Waiting 10 seconds to reconnect...")
+            self.log.info("(%s: %s) Waiting 10 seconds to reconnect...", self.config['name'], self.config['host'])
             pause(8)
 
         if self.config['reconnect']:
             pause(2)
-            if self.config['verbose']:
-                print("Opening new connection...")
+            self.log.info("(%s: %s) Opening new connection...", self.config['name'], self.config['host'])
             return True
         else:
             self.ERROR = 0
 
+    def _reconnect_wait(self) -> int:
+        """
+        Seconds to wait before reconnecting, backing off after errors.
+        """
+        if self.ERROR:
+            return 30*self.ERROR+30
+        return 10
+
     def connect(self) -> None:
         '''
         Connects to the IRC server with the options defined in `config`
         '''
+        self._start_log()
+        if self._process_hooks:
+            self._process_pool()  # warmed up before any line comes in
         while True:
             self.isupport = {}
-            self.ulist = {}
+            self.state.reset()
+            self._inlength = 0
+            self._wbuffer.clear()
             self._connect()
+            self._sender = threads.SendThread(self)
+            self._sender.start()
 
             try:
                 self._listen()
@@ -841,37 +1576,56 @@ class Base(object):
                         "Unexpected socket error. Resetting connection."
                     )
             except:
-                print(" ")
-                print("Exception occured:", sys.exc_info()[1])
-                print(" ")
-                print_tb(sys.exc_info()[2])
-                print(" ")
-                f = open('{0} - BotLog.txt'.format(self.config['name']), 'a')
-                f.write("\r\n")
-                f.write(now())
-                f.write("\r\nConnection: {0}\r\n".format(self.config['host']))
-                print_exc(None, f)
-                f.write("\r\n")
-                f.close()
+                self._log_exception()
                 if self.reconnect() is True:
                     continue
             finally:
                 self._close()
                 break
 
+    def _start_log(self) -> None:
+        """
+        Has a verbose bot's records written out from the background thread
+        of log.start(), which is left alone until a bot first connects
+        """
+        if self.config['verbose']:
+            log.start()
+
+    def _log_exception(self) -> None:
+        """
+        Logs the exception being handled and appends it to the bot's log file.
+        """
+        self.log.error("(%s: %s) Exception occured: %s", self.config['name'],
+                       self.config['host'], sys.exc_info()[1], exc_info=True)
+        f = open('{0} - BotLog.txt'.format(self.config['name']), 'a')
+        f.write("\r\n")
+        f.write(now())
+        f.write("\r\nConnection: {0}\r\n".format(self.config['host']))
+        print_exc(None, f)
+        f.write("\r\n")
+        f.close()
+
     def _connect(self) -> None:
         """
         Sets socket connection and negotiates capabilites and registration
         """
         self.socket = socket.socket()
+        self.socket.settimeout(self.config['connect_timeout'])
         self.socket.connect((self.config['host'], self.config['port']))
         self.socket.settimeout(1.0)
-        if self.config['verbose']:
-            print("({0}: {1}) Connection successful".format(
-                self.config['name'],
-                self.config['host']
-            ))
+        self._connected()
 
+    def _connected(self) -> None:
+        """
+        Starts off a connection the socket has just made
+        """
+        self.log.info("(%s: %s) Connection successful", self.config['name'], self.config['host'])
+        self._register()
+
+    def _register(self) -> None:
+        """
+        Negotiates capabilities and registers on a freshly opened connection
+        """
         # Setup Connection Initialization
 
 
@@ -892,10 +1646,12 @@ class Base(object):
             """Do connection post-negotiation commands"""
             if len(self.config['channels']):
                 self.join(*self.config['channels'])
+            self._run_threads()
 
-        self.trigger({'verb': 'CAP', 'args': ['LS']}, _CAP_REQ, True)
-        self.trigger({'verb': 'CAP', 'args': ['ACK']}, _CAP_END, True)
-        self.on_code(376, _CONNECTED, True) #MOTD end, trigger initial actions
+        self.trigger({'verb': 'CAP', 'args': [None, 'LS']}, _CAP_REQ, True)
+        self.trigger({'verb': 'CAP', 'args': [None, 'ACK']}, _CAP_END, True)
+        # MOTD end, or no MOTD (422), triggers initial actions
+        self.trigger({'verb': ('376', '422')}, _CONNECTED, True)
         
         # Initiate capability negotiation
         self._cmd('CAP LS 302')
@@ -911,13 +1667,28 @@ class Base(object):
         """ 
         TODO: Documentation 
         """
-        if 'thread' in self._hooks:
-            for thread in self._hooks['thread']:
-                thread.shutdown()
+        if self.scheduler:
+            self.scheduler.cancel(self)
+        if self._sender:
+            # stopped before the queue is touched, it may be writing from it
+            self._sender.shutdown()
+            if self._sender is not current_thread():
+                self._sender.join()
+            self._sender = None
         if self.socket:
-            self.socket.shutdown(socket.SHUT_RDWR)
-            self.socket.close()
-            self.socket = None
+            self._drain()
+            # once any write under way on another thread is done
+            with self._sendlock:
+                try:
+                    self._send_buffered()
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass  # already disconnected
+                self.socket.close()
+                self.socket = None
+        capture = self._capture
+        if capture is not None:
+            capture.flush()
         if runhooks:
             self._run_hooks('close')
 
@@ -926,11 +1697,9 @@ class Base(object):
         """ 
         TODO: Documentation 
         """
-        if self.config['verbose']:
-            print("Closing connection and thread for {0}:{1}".format(
-                self.config['name'],
-                self.config['host']
-            ))
+        self.log.info("Closing connection and thread for %s:%s", self.config['name'], self.config['host'])
+        if self.pool:
+            self.pool.shutdown()
         raise SystemExit()
 
 
@@ -942,6 +1711,7 @@ class Bot(Base):
 
     host            (string)    : address to connect to
     port            (integer)   : port to connect with
+    connect_timeout (float)     : seconds to wait for the server to accept the connection
     name            (string)    : bot's original name
     ident           (string)    : the 'user' part of 'nick!user@host * name'
     nick            (string)    : the 'nick' part of 'nick!user@host * name'; bot's temporary name
@@ -950,8 +1720,22 @@ class Bot(Base):
     command         (string)    : a (sequence of) character(s) the bot will respond to for a command
     passphrase      (string)    : passed to nickserv for authentication
     break_on_match  (bool)      : determines whether multiple matches are allowed per recieved line
-    verbose         (bool)      : determines whether debug info is printed to the console
+    verbose         (bool)      : logs every line in and out, to the console unless logging is set up (see log.py)
     reconnect       (bool)      : determines whether to automatically reconnect if an error/exception occurs   
+    flood_burst     (integer)   : number of lines that can be sent at once before flood control kicks in
+    flood_rate      (float)     : lines per second sent under flood control; 0 or None to disable
+    quit_timeout    (float)     : seconds quit() waits for held back lines to go out before quitting
+    pack_separator  (string)    : joins messages sent with pack=True into one line
+    encoding        (string)    : encoding used to send and receive lines
+    fallback_encoding (string)  : encoding used for received lines that aren't valid in `encoding`
+    recv_size       (integer)   : initial size in bytes of the receive buffer
+    workers         (integer)   : threads running matched hooks in order per channel/user; 0 runs them inline
+    interval_workers (integer)  : threads running interval hooks; more than 1 keeps a slow hook from holding up the rest
+    hook_timeout    (float)     : seconds before a hook run on a worker is given up on; None for no limit
+    processes       (integer)   : size of the pool shared by executor='process' hooks; None for one per CPU
+    hook_stats      (bool)      : record call counts and times of hooks and listeners, see hook_stats()
+    slow_hook       (float)     : milliseconds after which a hook call is logged as slow; None to turn off
+    capture         (string)    : file every line received and sent is recorded to for replaying; None to turn off
     replace         (dict)      : dictionary for custom regex variable replacement; form of ':key:';
                                     if key does not exist in the dict, :key: is removed from the regex
     hookscripts     (list)      : a list of module names that contain custom hooks
@@ -972,8 +1756,8 @@ class Bot(Base):
 
         if not self.config['reload_override']:
             self.config.setdefault('reload_regex', re.compile(
-                f":{self.config['command']}reload$"))
-            self.config.setdefault('reload_func', self.load_hooks)
+                f"^{re.escape(self.config['command'])}reload$"))
+            self.config.setdefault('reload_func', lambda info: self.load_hooks())
             self.trigger(
                 {'verb': 'PRIVMSG', 'args': [None ,self.config['reload_regex']]},
                 self.config['reload_func']
@@ -998,28 +1782,15 @@ class Bot(Base):
         old_funcs = [(k, v) for k, v in self.__dict__.items()
                      if hasattr(v, '_type')]
 
-        if len(old_funcs) and self.config['verbose']:
-            print("\n({0}: {1}) Unloading old hooks...".format(
-                self.config['name'],
-                self.config['host']
-            ))
-            print("----------------------")
+        name, host = self.config['name'], self.config['host']
+        if len(old_funcs):
+            self.log.info("(%s: %s) Unloading old hooks...", name, host)
 
         for k, v in old_funcs:
             delattr(self, k)
-            if self.config['verbose']:
-                print("({0}: {1})   -'{2}' successfully removed.".format(
-                    self.config['name'],
-                    self.config['host'],
-                    k
-                ))
+            self.log.info("(%s: %s)   -'%s' successfully removed.", name, host, k)
 
-        if self.config['verbose']:
-            print("\n({0}: {1}) Loading hooks...".format(
-                self.config['name'],
-                self.config['host']
-            ))
-            print("----------------------")
+        self.log.info("(%s: %s) Loading hooks...", name, host)
 
         for script in scripts:
             try:
@@ -1028,36 +1799,16 @@ class Bot(Base):
                 else:
                     sys.modules[script] = __import__(script)
 
-                if self.config['verbose']:
-                    print("\n({0}: {1}) '{2}' successfully imported.".format(
-                        self.config['name'],
-                        self.config['host'],
-                        script
-                    ))
+                self.log.info("(%s: %s) '%s' successfully imported.", name, host, script)
             except:
-                if self.config['verbose']:
-                    print("\n({0}: {1}) Error: >>>{2}".format(
-                        self.config['name'],
-                        self.config['host'],
-                        str(sys.exc_info()[1])
-                    ))
-                    print_tb(sys.exc_info()[2])
-                    print("({0}: {1}) >>>Unable to import '{2}'. Skipping...".format(
-                        self.config['name'],
-                        self.config['host'],
-                        script
-                    ))
+                self.log.warning("(%s: %s) Error: >>>%s", name, host, sys.exc_info()[1],
+                                 exc_info=True)
+                self.log.warning("(%s: %s) >>>Unable to import '%s'. Skipping...", name, host, script)
             else:
                 for k, v in sys.modules[script].__dict__.items():
                     if hasattr(v, '_type'):
                         setattr(self, k, v)
-                        if self.config['verbose']:
-                            print("({0}: {1})   -'{2}' successfully added.".format(
-                                self.config['name'],
-                                self.config['host'],
-                                k
-                            ))
-        print(" ")
+                        self.log.info("(%s: %s)   -'%s' successfully added.", name, host, k)
         super(Bot, self).load_hooks()
 
     def ns(self, message: str) -> None:
@@ -1077,7 +1828,8 @@ T_Base = TypeVar('T_Base', bound=Base)
 
 
 class BotGroup(object):
-    def __init__(self, ref: T_Base=Bot, interval: int=0) -> None:
+    def __init__(self, ref: T_Base=Bot, interval: int=0, multiplex: bool=False,
+                 interval_workers: int=1) -> None:
         """
         Constructor
 
@@ -1085,10 +1837,19 @@ class BotGroup(object):
         interval = time in seconds the bot instance threads are 
             checked for crash recovery. If zero, thread recovery 
             is disabled.
+        multiplex = if True, every bot's socket is served by a single
+            selector thread instead of a thread per bot.
+        interval_workers = threads taking turns running the interval
+            hooks of every bot; more than 1 keeps a slow hook from
+            holding up the rest.
         """
         self._bots = {}
         self.rethread = interval
         self.monitor = None
+        self.loop = None
+        self.io = None
+        self.multiplex = multiplex
+        self.scheduler = threads.Scheduler(interval_workers)
         self.ref = ref
         self._quitting = False
 
@@ -1111,11 +1872,18 @@ class BotGroup(object):
             ref = self.ref
         self._bots[host] = {}
         self._bots[host]['instance'] = ref(host, ref=self, **kwargs)
-        self._bots[host]['thread'] = Thread(
-            None,
-            self._bots[host]['instance'].connect,
-            name=host
-        )
+        self._bots[host]['instance'].scheduler = self.scheduler
+        if asyncio.iscoroutinefunction(self._bots[host]['instance'].connect) \
+                or self.multiplex:
+            # asyncio bots all run on the group's one event loop thread,
+            # multiplexed ones on its one selector thread
+            self._bots[host]['thread'] = None
+        else:
+            self._bots[host]['thread'] = Thread(
+                None,
+                self._bots[host]['instance'].connect,
+                name=host
+            )
 
     def copy_network(self, old: str, new: Optional[str]=None, ref: Optional[T_Base]=None) -> None:
         """
@@ -1129,7 +1897,9 @@ class BotGroup(object):
             kwargs = bot.config
             if (ref is None):
                 ref = bot.__class__
-            return ref(kwargs['host'], ref=self, **kwargs)
+            new_bot = ref(kwargs['host'], ref=self, **kwargs)
+            new_bot.scheduler = self.scheduler
+            return new_bot
 
     def get(self, host: str) -> Optional[T_Base]:
         """ 
@@ -1155,9 +1925,22 @@ class BotGroup(object):
         If True is passed as an argument, the class takes control
                 of the main thread by sending it directly to the console
         """
+        shared = []
+        multiplexed = []
         for bot in self.get_all('bots'):
-            bot['thread'].start()
+            if bot['thread'] is not None:
+                bot['thread'].start()
+            elif asyncio.iscoroutinefunction(bot['instance'].connect):
+                shared.append(bot['instance'])
+            else:
+                multiplexed.append(bot['instance'])
         else:
+            if shared:
+                self.loop = Thread(None, aio.run, name='asyncio', args=shared)
+                self.loop.start()
+            if multiplexed:
+                self.io = Thread(None, self._multiplex, name='selectors', args=(multiplexed,))
+                self.io.start()
             if self.rethread:
                 self.monitor = Timer(
                     self.rethread,
@@ -1174,7 +1957,34 @@ class BotGroup(object):
         """
         for x in self.get_all('bots'):
             x['instance'].load_hooks()
-            x['instance']._runthreads()
+            x['instance']._run_threads()
+
+    def hook_stats(self, reset: bool=False, by_host: bool=False) -> dict:
+        """
+        Hook and listener timings of all bot instances (see
+        Base.hook_stats), merged by name or, with `by_host`, per host.
+        """
+        bots = self.get_all()
+        if by_host:
+            return {host: bot['instance'].hook_stats(reset) for host, bot in bots}
+        return stats.report([bot['instance'].stats.timings(reset) for _, bot in bots])
+
+    def profile(self, seconds: Optional[float]=10, mode: str='sample', interval: float=0.005) -> dict:
+        """
+        Profiles every bot instance (see Base.profile), each to a file of
+        its own. Returns the files by host.
+        """
+        return {
+            host: bot['instance'].profile(seconds, mode=mode, interval=interval)
+            for host, bot in self.get_all()
+        }
+
+    def stop_profile(self) -> None:
+        """
+        Stops profile() early for every bot instance
+        """
+        for bot in self.get_all('bots'):
+            bot['instance'].stop_profile()
 
     def thread_check(self):
         """
@@ -1183,10 +1993,10 @@ class BotGroup(object):
         """
         for host, bot in self.get_all():
             thread = bot['thread']
+            if thread is None:
+                continue  # asyncio bots reconnect on their own
             if not thread.is_alive() and not self._quitting:
-                if (bot['instance'].config['verbose']):
-                    print(
-                        'Bot thread for {0} died (see stack trace). Rebooting...'.format(host))
+                bot['instance'].log.warning('Bot thread for %s died (see stack trace). Rebooting...', host)
                 bot['instance'].close()
                 while bot['instance'].socket:
                     pass
@@ -1209,6 +2019,217 @@ class BotGroup(object):
             if exclude is bot['instance']: continue
             action(bot['instance'], *args)
 
+    def _multiplex(self, bots: List[T_Base]) -> None:
+        """
+        Serves the connections of every given bot from the calling thread.
+
+        All sockets are registered with one selector; lines are framed and
+        dispatched for whichever bot's socket is readable, queued functions
+        are run as soon as they're queued, and held back lines are written
+        when due. Bots are reconnected after their usual wait, and dropped
+        once closed or quit.
+
+        Nothing here blocks, so one slow network can't hold up the others:
+        host names are resolved on helper threads, sockets connect and
+        write without blocking, and whatever a socket can't take yet stays
+        buffered until it's writable.
+        """
+        selector = selectors.DefaultSelector()
+        resolver = ThreadPoolExecutor(4, thread_name_prefix='resolver')
+        wake_r, wake_w = socket.socketpair()
+        wake_r.setblocking(False)
+        wake_w.setblocking(False)
+        selector.register(wake_r, selectors.EVENT_READ, None)
+        # what connect_ex returns for a connection under way
+        underway = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', 0)}
+
+        def wakeup():
+            try:
+                wake_w.send(b'\0')
+            except OSError:
+                pass  # already pending
+
+        # per bot: its registered socket and the events it's registered
+        # for, when to reconnect, and a connection being opened: the host
+        # name being resolved, addresses left to try, the socket
+        # connecting and when to give up on it
+        state = {}
+        for bot in bots:
+            bot._shared_loop = True
+            bot._wakeup = wakeup
+            state[bot] = {'socket': None, 'events': 0, 'retry': 0.0, 'stopped': False,
+                          'resolving': None, 'addresses': [], 'connecting': None, 'deadline': None}
+
+        def step(bot, func):
+            try:
+                func()
+            except (socket.timeout, BlockingIOError):
+                pass
+            except SystemExit:
+                if bot.socket:
+                    bot._close()
+                state[bot]['stopped'] = True
+            except Exception:
+                bot._log_exception()
+                if bot.socket:
+                    bot._close(False)
+                    bot._run_hooks('disconnect')
+
+        def connect(bot):
+            bot._start_log()
+            bot.isupport = {}
+            bot.state.reset()
+            bot._inlength = 0
+            bot._outbound.clear()
+            bot._wbuffer.clear()
+            st = state[bot]
+            st['deadline'] = monotonic() + bot.config['connect_timeout']
+            st['resolving'] = resolver.submit(
+                socket.getaddrinfo, bot.config['host'], bot.config['port'], 0, socket.SOCK_STREAM)
+            st['resolving'].add_done_callback(lambda _: wakeup())
+
+        def resolved(bot):
+            st = state[bot]
+            future, st['resolving'] = st['resolving'], None
+            try:
+                st['addresses'] = future.result()
+            except OSError as e:
+                failed(bot, e)
+                return
+            attempt(bot)
+
+        def attempt(bot):
+            # starts connecting to the next address of the bot's host
+            st = state[bot]
+            error = None
+            while st['addresses']:
+                family, kind, proto, _, address = st['addresses'].pop(0)
+                sock = socket.socket(family, kind, proto)
+                sock.setblocking(False)
+                code = sock.connect_ex(address)
+                if code in underway:
+                    selector.register(sock, selectors.EVENT_WRITE, bot)
+                    st['connecting'] = sock
+                    return
+                sock.close()
+                error = OSError(code, strerror(code))
+            failed(bot, error or OSError('No address to connect to'))
+
+        def opened(bot):
+            # the connecting socket is writable: connected, or refused
+            st = state[bot]
+            sock, st['connecting'] = st['connecting'], None
+            selector.unregister(sock)
+            code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if code:
+                sock.close()
+                if st['addresses']:
+                    attempt(bot)
+                else:
+                    failed(bot, OSError(code, strerror(code)))
+                return
+            st['deadline'] = None
+            bot.socket = sock
+            selector.register(sock, selectors.EVENT_READ, bot)
+            st['socket'] = sock
+            st['events'] = selectors.EVENT_READ
+            step(bot, bot._connected)
+
+        def abandon(bot):
+            # stops opening a connection
+            st = state[bot]
+            if st['resolving'] is not None:
+                st['resolving'].cancel()
+                st['resolving'] = None
+            if st['connecting'] is not None:
+                selector.unregister(st['connecting'])
+                st['connecting'].close()
+                st['connecting'] = None
+            st['addresses'] = []
+            st['deadline'] = None
+
+        def failed(bot, error):
+            abandon(bot)
+            bot.log.error("(%s: %s) Unable to connect: %s", bot.config['name'], bot.config['host'], error)
+            state[bot]['retry'] = monotonic() + bot._reconnect_wait()
+
+        try:
+            while state:
+                now = monotonic()
+                due = []
+                for bot, st in list(state.items()):
+                    if st['socket'] is not None and st['socket'] is not bot.socket:
+                        selector.unregister(st['socket'])
+                        st['socket'] = None
+                    if bot.socket is None:
+                        if st['resolving'] is not None and st['resolving'].done():
+                            resolved(bot)
+                        opening = st['resolving'] is not None or st['connecting'] is not None
+                        if st['stopped'] or not opening and st['retry'] is None and (
+                                bot._quitting or not bot.config['reconnect']):
+                            abandon(bot)
+                            del state[bot]
+                            continue
+                        if opening:
+                            if st['deadline'] <= now:
+                                failed(bot, socket.timeout('Connection timed out'))
+                            else:
+                                due.append(st['deadline'])
+                                continue
+                        if st['retry'] is None:
+                            st['retry'] = now + bot._reconnect_wait()
+                        if st['retry'] <= now:
+                            st['retry'] = None
+                            step(bot, lambda: connect(bot))
+                            if st['deadline'] is not None:
+                                due.append(st['deadline'])
+                            else:
+                                st['retry'] = now + bot._reconnect_wait()
+                        if st['retry'] is not None:
+                            due.append(st['retry'])
+                    if bot.socket is not None:
+                        when = bot._flush()
+                        if when is not None:
+                            due.append(when)
+                        # watched for room to write while lines are left over
+                        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if bot._wbuffer else 0)
+                        if events != st['events'] and st['socket'] is bot.socket:
+                            selector.modify(bot.socket, events, bot)
+                            st['events'] = events
+                if not state:
+                    break
+
+                timeout = max(0.0, min(due) - monotonic()) if due else None
+                for key, mask in selector.select(timeout):
+                    bot = key.data
+                    if bot is None:
+                        try:
+                            while wake_r.recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                    elif bot not in state:
+                        continue
+                    elif key.fileobj is state[bot]['connecting']:
+                        opened(bot)
+                    elif bot.socket is key.fileobj:
+                        if mask & selectors.EVENT_WRITE:
+                            step(bot, bot._flush_writes)
+                        if mask & selectors.EVENT_READ and bot.socket is key.fileobj:
+                            step(bot, lambda: bot._process(bot._recv()))
+                for bot in state:
+                    if bot.queued:
+                        step(bot, bot._run_queued)
+        finally:
+            for bot in bots:
+                bot._wakeup = None
+                if bot in state:
+                    abandon(bot)
+            resolver.shutdown(wait=False)
+            selector.close()
+            wake_r.close()
+            wake_w.close()
+
     def close(self):
         """ TODO: Documentation """
         if not self._quitting:
@@ -1217,7 +2238,8 @@ class BotGroup(object):
                 bot['instance'].close()
             if self.monitor:
                 self.monitor.cancel()
-            print('Waiting for threads to close...')
+            self.scheduler.shutdown()
+            log.logger.info('Waiting for threads to close...')
 
 
 T_Group = TypeVar('T_Group', bound=BotGroup)
@@ -1231,6 +2253,8 @@ def console(bot: Optional[Union[T_Base, T_Group]]=None, **kwargs) -> None:
     Params:
     -bot = Instance of the bot/botgroup you wish to control via console.
     -kwargs = dict of global variables defined in the __main__ module give the console access to.
+
+    eg. `bot.profile(30)` profiles a lagging bot for 30 seconds.
     """
 
     if kwargs:
@@ -1285,3 +2309,8 @@ def modload(*modlist) -> None:
             # If not exists, import
             sys.modules[x] = __import__(x)
             print(x + ' has been loaded.')
+
+
+# imported last since the asyncio backend builds on Base
+from . import aio
+from .aio import AsyncBase
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import logging
+from functools import partial
+from typing import Callable, Optional
+
+from . import Base, hooks, log
+
+
+class _Protocol(asyncio.BufferedProtocol):
+    """
+    Feeds received bytes straight into the bot's receive buffer.
+    """
+    def __init__(self, bot: 'AsyncBase') -> None:
+        self._bot = bot
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self._bot._transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._bot._recv_view()
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._bot._run_guarded(self._bot._process, self._bot._frame(nbytes))
+
+    def eof_received(self) -> bool:
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._bot._transport = None
+        if not self._bot._closed.done():
+            self._bot._closed.set_result(exc)
+
+
+class AsyncBase(Base):
+    """
+    Base running on an asyncio event loop instead of a thread of its own.
+
+    `connect()` is a coroutine, so any number of bots can share one loop
+    (see `run()`). Listeners and hooks are the same synchronous functions
+    used with Base and run on the loop; functions queued from other threads
+    with @hooks.queue (e.g. by interval hooks) are handed to the loop.
+    Queued outgoing lines are written from loop timers.
+    """
+    def __init__(self, host: str, **kwargs) -> None:
+        super(AsyncBase, self).__init__(host, **kwargs)
+        self._loop = None
+        self._loop_thread = None
+        self._transport = None
+        self._closed = None
+        self._error = None
+        self._stopped = False
+        self._shared_loop = True
+        self._flushing = None
+        if not hasattr(self, '_hooks'):
+            self.load_hooks()
+
+    async def connect(self) -> None:
+        '''
+        Connects to the IRC server with the options defined in `config`,
+        reconnecting until closed if `reconnect` is set.
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped = False
+        self._start_log()
+        while not self._stopped:
+            self.isupport = {}
+            self.state.reset()
+            self._inlength = 0
+            self._error = None
+            try:
+                await self._connect()
+                exc = await self._closed
+                if self._error is not None:
+                    exc = self._error
+                if exc is not None and not self._quitting:
+                    raise exc
+            except asyncio.CancelledError:
+                self._close()
+                raise
+            except Exception:
+                self._log_exception()
+            finally:
+                self._outbound.clear()
+                self._wbuffer.clear()
+                self._not_before = 0.0
+
+            if self._stopped or self._quitting or not self.config['reconnect']:
+                break
+            wait = self._reconnect_wait()
+            self.log.info("(%s: %s) Waiting %s seconds to reconnect...",
+                          self.config['name'], self.config['host'], wait)
+            await asyncio.sleep(wait)
+        self._quitting = False
+
+    async def _connect(self) -> None:
+        """
+        Opens the connection, giving up after config['connect_timeout']
+        seconds, and negotiates capabilites and registration
+        """
+        self._closed = self._loop.create_future()
+        await asyncio.wait_for(
+            self._loop.create_connection(
+                partial(_Protocol, self),
+                self.config['host'],
+                self.config['port']
+            ),
+            self.config['connect_timeout']
+        )
+        self.log.info("(%s: %s) Connection successful", self.config['name'], self.config['host'])
+        self._register()
+        while self.queued:
+            func, args, kwargs = self.queued.pop(0)
+            self.queue(func, *args, **kwargs)
+
+    def _run_guarded(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Calls func on the loop. An exception drops the connection and is
+        raised from connect(), where it is logged before reconnecting.
+        """
+        try:
+            self._running = True
+            func(*args, **kwargs)
+        except Exception as exc:
+            if self._error is None:
+                self._error = exc
+            if self._transport:
+                self._transport.close()
+        finally:
+            self._running = False
+        self._flush_writes()
+
+    def queue(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Runs func on the bot's loop, from whichever thread it is called.
+        """
+        if self._loop is None or self._loop.is_closed():
+            self.queued.append((func, args, kwargs))
+        else:
+            self._loop.call_soon_threadsafe(
+                partial(self._run_guarded, func, *args, **kwargs))
+
+    def _raw_cmd(self, raw_line: str, priority: bool=False) -> None:
+        if threading.get_ident() != self._loop_thread:
+            self.queue(self._raw_cmd, raw_line, priority)
+            return
+        if self.log.isEnabledFor(logging.DEBUG):
+            log.traffic(self.log, "(%s: %s) >> %s", self.config['name'], self.config['host'], raw_line)
+        self._send((raw_line+"\r\n").encode(self.config['encoding']), priority)
+
+    def _flush_writes(self) -> None:
+        # the transport takes care of short writes
+        if self._wbuffer and self._transport:
+            self._transport.write(bytes(self._wbuffer))
+        self._wbuffer.clear()
+
+    def _schedule_flush(self) -> None:
+        if self._flushing is None:
+            self._flushing = self._loop.call_soon(self._flush)
+
+    def _flush(self) -> None:
+        # the loop's default clock is time.monotonic, as used by Base._send
+        self._flushing = None
+        due = super(AsyncBase, self)._flush()
+        if due is not None:
+            self._flushing = self._loop.call_at(due, self._flush)
+
+    def _close(self, runhooks: bool=True) -> None:
+        """
+        Stops interval hooks and closes the connection, writing out the
+        held back lines flood control allows first (see Base._drain).
+        """
+        if self.scheduler:
+            self.scheduler.cancel(self)
+        if self._flushing:
+            self._flushing.cancel()
+            self._flushing = None
+        if self._transport:
+            self._drain()
+            self._flush_writes()
+            self._transport.close()
+        capture = self._capture
+        if capture is not None:
+            capture.flush()
+        if runhooks:
+            self._run_hooks('close')
+
+    @hooks.queue()
+    def reconnect(self) -> None:
+        """
+        Drops the connection; connect() opens a new one after the usual wait.
+        """
+        if self._transport:
+            self._close(False)
+            self.log.info("(%s: %s) Connection closed.", self.config['name'], self.config['host'])
+            self._run_hooks('disconnect')
+
+    @hooks.queue()
+    def close(self) -> None:
+        """
+        Closes the connection and ends connect() without reconnecting.
+        """
+        self.log.info("Closing connection for %s:%s", self.config['name'], self.config['host'])
+        self._stopped = True
+        if self.pool:
+            self.pool.shutdown()
+        self._close()
+
+
+def run(*bots: AsyncBase) -> None:
+    """
+    Connects every bot on one event loop and runs it until all have closed.
+    """
+    async def main():
+        await asyncio.gather(*(bot.connect() for bot in bots))
+    asyncio.run(main())
@@ -0,0 +1,529 @@
+"""
+Benchmarks for the hot paths of pIRC.
+
+Run with `python -m pIRC.bench`. Lines are either read from a recorded
+log (one raw IRC line per line of the file) or generated synthetically.
+
+By default the replay suite runs: each scenario (a busy channel, a
+netsplit, a NAMES burst, IRCv3 tagged traffic and any --log given) is
+fed through parsing, Base._run_listeners and Base._run_hooks of a bot
+with hooks, reporting lines/sec, per-line latency percentiles and peak
+memory. With --json the results are written as JSON, and --baseline
+compares them to an earlier run, exiting with status 1 on a regression.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tracemalloc
+from time import perf_counter, perf_counter_ns
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import Base, hooks
+from .parse import Parser, Message, parse_many
+
+_nicks = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi',
+          'ivan', 'judy', 'mallory', 'niaj', 'olivia', 'peggy', 'rupert', 'sybil']
+_words = ['the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog',
+          'irc', 'bot', 'hello', 'world', 'lol', 'ok', 'yes', 'no']
+
+
+class FakeSocket(object):
+    """
+    Socket stand-in that discards everything sent to it.
+    """
+    def __init__(self) -> None:
+        self.sent = 0
+
+    def send(self, data: bytes) -> int:
+        self.sent += 1
+        return len(data)
+
+    def sendall(self, data: bytes) -> None:
+        self.sent += 1
+
+    def settimeout(self, timeout: float) -> None:
+        pass
+
+    def shutdown(self, how: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def busy_channel(count: int, seed: int = 0) -> List[str]:
+    """
+    Generates a busy-channel log: mostly PRIVMSG with some JOIN/PART/QUIT,
+    NOTICE, MODE and PING traffic mixed in.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        nick = rng.choice(_nicks)
+        source = f":{nick}!{nick}@host-{rng.randint(1, 50)}.example.net"
+        roll = rng.random()
+        if roll < 0.80:
+            text = ' '.join(rng.choice(_words) for _ in range(rng.randint(1, 12)))
+            if rng.random() < 0.05:
+                text = '!' + text
+            lines.append(f"{source} PRIVMSG #busy :{text}")
+        elif roll < 0.85:
+            lines.append(f"{source} JOIN #busy")
+        elif roll < 0.90:
+            lines.append(f"{source} PART #busy :bye")
+        elif roll < 0.93:
+            lines.append(f"{source} QUIT :Quit: leaving")
+        elif roll < 0.96:
+            lines.append(f"{source} NOTICE #busy :notice")
+        elif roll < 0.98:
+            lines.append(f"{source} MODE #busy +v {rng.choice(_nicks)}")
+        else:
+            lines.append("PING :irc.example.net")
+    return lines
+
+
+def names_burst(members: int, channels: int = 5, seed: int = 0, nick: str = 'pIRCBot') -> List[str]:
+    """
+    Generates the ISUPPORT line and the NAMES replies (353/366) received by
+    `nick` on joining `channels` channels holding `members` memberships in
+    all. Nicks are shared between channels and some members are opped or
+    voiced.
+    """
+    rng = random.Random(seed)
+    pool = [f"{rng.choice(_nicks)}{n}" for n in range(max(1, members // 2))]
+    lines = [":irc.example.net 005 bench PREFIX=(ov)@+ CHANTYPES=# :are supported"]
+    per_channel = members // channels
+    for c in range(channels):
+        channel = f"#chan{c}"
+        names = [nick]
+        for member in rng.sample(pool, min(per_channel, len(pool))):
+            roll = rng.random()
+            names.append(('@' if roll < 0.02 else '+' if roll < 0.10 else '') + member)
+        head = f":irc.example.net 353 bench = {channel} :"
+        line = []
+        for name in names:
+            if len(head) + sum(len(x) + 1 for x in line) + len(name) > 400:
+                lines.append(head + ' '.join(line))
+                line = []
+            line.append(name)
+        if line:
+            lines.append(head + ' '.join(line))
+        lines.append(f":irc.example.net 366 bench {channel} :End of /NAMES list.")
+    return lines
+
+
+def netsplit(users: int, channels: int = 5, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """
+    Generates a netsplit: the JOINs of `users` users spread over `channels`
+    channels, then the QUIT storm as all of them split off at once. Returns
+    the JOINs, to be loaded first, and the QUITs.
+    """
+    rng = random.Random(seed)
+    joins = []
+    quits = []
+    for n in range(users):
+        nick = f"{rng.choice(_nicks)}{n}"
+        source = f":{nick}!{nick}@host-{n}.example.net"
+        for c in rng.sample(range(channels), rng.randint(1, channels)):
+            joins.append(f"{source} JOIN #chan{c}")
+        quits.append(f"{source} QUIT :irc.example.net hub.example.net")
+    return joins, quits
+
+
+def tagged(count: int, seed: int = 0) -> List[str]:
+    """
+    Generates IRCv3 tagged traffic: busy-channel lines carrying server-time,
+    msgid and account tags, some with client-only tags and escaped values.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for n, line in enumerate(busy_channel(count, seed)):
+        nick = line[1:line.find('!')] if line.startswith(':') else 'server'
+        tags = (f"@time=2024-01-01T00:{n // 60 % 60:02d}:{n % 60:02d}.{n % 1000:03d}Z"
+                f";msgid={n:08x}{rng.getrandbits(32):08x};account={nick}")
+        if rng.random() < 0.2:
+            tags += f";+draft/reply={rng.getrandbits(32):08x};+example/note=a\\sb\\:c"
+        lines.append(f"{tags} {line}")
+    return lines
+
+
+def read_log(path: str) -> List[str]:
+    """
+    Reads a recorded log of raw lines, skipping blanks.
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return [x.rstrip('\r\n') for x in f if x.strip()]
+
+
+class HookBot(Base):
+    """
+    Bot with a few cheap hooks of the common kinds, so the benchmarks
+    cover hook matching as well as dispatch.
+    """
+
+    @hooks.command(re.compile(r'^(?:quick|ping)\b'))
+    def command(self, info):
+        self.message(info['target'], 'pong')
+
+    @hooks.channel(re.compile(r'\bfox\b'))
+    def fox(self, info):
+        pass
+
+    @hooks.raw(re.compile(r'^\S+ NOTICE '))
+    def notices(self, info):
+        pass
+
+    @hooks.join()
+    def joined(self, info):
+        pass
+
+    @hooks.quit()
+    def quitted(self, info):
+        pass
+
+
+def make_bot(extra_listeners: int = 0, hooked: bool = False) -> Base:
+    """
+    Builds a quiet Base (or, if `hooked`, HookBot) attached to a FakeSocket,
+    optionally padded with listeners on verbs that never appear in the
+    benchmark traffic.
+    """
+    if hooked:
+        bot = HookBot('bench.invalid', nick='pIRCBot', verbose=False, flood_rate=0)
+        bot.load_hooks()
+    else:
+        bot = Base('bench.invalid', verbose=False)
+    bot.socket = FakeSocket()
+    for n in range(extra_listeners):
+        bot.on_verb(f"X-UNUSED-{n}", lambda info: None)
+    return bot
+
+
+def bench_dispatch(lines: Iterable[str], extra_listeners: int = 0, rounds: int = 3) -> float:
+    """
+    Feeds every line through Base._run_listeners and returns the best
+    lines/sec over the given number of rounds.
+    """
+    lines = list(lines)
+    best = 0.0
+    for _ in range(rounds):
+        bot = make_bot(extra_listeners)
+        start = perf_counter()
+        for line in lines:
+            bot._run_listeners(line)
+        elapsed = perf_counter() - start
+        best = max(best, len(lines) / elapsed)
+    return best
+
+
+def bench_parse(lines: Iterable[str], parser: Callable, rounds: int = 3) -> tuple:
+    """
+    Parses every line and reads its verb, the common case for dispatch.
+    Returns the best lines/sec and the bytes held by the parsed lines when
+    all of them are kept alive.
+    """
+    lines = list(lines)
+    best = 0.0
+    for _ in range(rounds):
+        start = perf_counter()
+        for line in lines:
+            parser(line)['verb']
+        best = max(best, len(lines) / (perf_counter() - start))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [parser(line) for line in lines]
+    for x in kept:
+        x['verb']
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return best, size
+
+
+def bench_parse_many(lines: Iterable[str], chunk: int = 500, rounds: int = 3) -> float:
+    """
+    Parses the lines as received chunks of the given number of lines each,
+    the way a netsplit or join burst arrives. Returns the best lines/sec.
+    """
+    lines = list(lines)
+    chunks = ['\r\n'.join(lines[i:i + chunk]) + '\r\n' for i in range(0, len(lines), chunk)]
+    best = 0.0
+    for _ in range(rounds):
+        start = perf_counter()
+        for data in chunks:
+            for x in parse_many(data)[0]:
+                x['verb']
+        best = max(best, len(lines) / (perf_counter() - start))
+    return best
+
+
+def _rss() -> Optional[int]:
+    # resident set size in bytes, where /proc is available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def bench_names(lines: Iterable[str], chunk: int = 500, rounds: int = 3) -> tuple:
+    """
+    Loads a NAMES burst (see names_burst) into a fresh bot's channel state.
+    Returns the best load time in seconds, the resident memory added by
+    the loaded state (None without /proc), the bytes it holds as traced by
+    tracemalloc, and the number of memberships loaded.
+    """
+    lines = list(lines)
+    chunks = ['\r\n'.join(lines[i:i + chunk]) + '\r\n' for i in range(0, len(lines), chunk)]
+    best = None
+    rss = None
+    for _ in range(rounds):
+        bot = make_bot()
+        gc.collect()
+        before = _rss()
+        start = perf_counter()
+        for data in chunks:
+            bot._process(parse_many(data)[0])
+        elapsed = perf_counter() - start
+        gc.collect()
+        after = _rss()
+        if best is None or elapsed < best:
+            best = elapsed
+        if rss is None and before is not None and after is not None:
+            # first round only, later ones reuse the memory freed before
+            rss = after - before
+        del bot
+
+    bot = make_bot()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for data in chunks:
+        bot._process(parse_many(data)[0])
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    memberships = sum(len(bot.state.members(x)) for x in list(bot.state.channels))
+    return best, rss, size, memberships
+
+
+def _latency(samples: List[int]) -> Dict[str, float]:
+    # percentiles of per-line times in nanoseconds, as microseconds
+    samples = sorted(samples)
+    if not samples:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    def at(p: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))] / 1000
+    return {'p50': at(50), 'p90': at(90), 'p99': at(99), 'max': samples[-1] / 1000}
+
+
+def _discard(elapsed: int) -> None:
+    pass
+
+
+def _replay(setup: List[str], lines: List[str], stage: str,
+            keep: bool = True, held: Optional[list] = None) -> Tuple[int, float, List[int]]:
+    """
+    Feeds the lines through one stage once, after loading `setup` into a
+    fresh bot. Returns the number of calls timed, the total time they took
+    and, if `keep`, the time of each in nanoseconds. The parsed messages,
+    or the bot, are added to `held` if given, to outlive the call.
+    """
+    times = []
+    record = times.append if keep else _discard
+    if stage == 'parse':
+        start = perf_counter()
+        for line in lines:
+            t = perf_counter_ns()
+            x = Message(line)
+            x['verb'], x['tags'], x['source'], x['args']
+            record(perf_counter_ns() - t)
+            if held is not None:
+                held.append(x)
+        return len(lines), perf_counter() - start, times
+
+    bot = make_bot(hooked=True)
+    if held is not None:
+        held.append(bot)
+    for line in setup:
+        bot._run_listeners(line)
+    if stage == 'listeners':
+        run = bot._run_listeners
+        start = perf_counter()
+        for line in lines:
+            t = perf_counter_ns()
+            run(line)
+            record(perf_counter_ns() - t)
+        return len(lines), perf_counter() - start, times
+
+    # hooks: every _run_hooks call made while dispatching the lines
+    run_hooks = bot._run_hooks
+
+    def timed(*args, **kwargs):
+        t = perf_counter_ns()
+        try:
+            return run_hooks(*args, **kwargs)
+        finally:
+            record(perf_counter_ns() - t)
+    bot._run_hooks = timed
+    for line in lines:
+        bot._run_listeners(line)
+    return len(times), sum(times) / 1e9, times
+
+
+def _peak(setup: List[str], lines: List[str], stage: str) -> int:
+    # bytes allocated at the peak of one replay, as traced by tracemalloc,
+    # read while the messages parsed (or the bot loaded) are still alive
+    held = []
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        _replay(setup, lines, stage, keep=False, held=held)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+        del held[:]
+
+
+def bench_replay(setup: List[str], lines: List[str], rounds: int = 3,
+                 stages: Iterable[str] = ('parse', 'listeners', 'hooks')) -> Dict[str, dict]:
+    """
+    Replays the lines through each stage (Message parsing,
+    Base._run_listeners and Base._run_hooks of a HookBot, with `setup`
+    loaded first), keeping the fastest of the given number of rounds.
+
+    Returns, per stage, the calls timed, their rate per second, latency
+    percentiles in microseconds and the peak bytes allocated, with the
+    stage's parsed messages (or its bot and channel state) kept alive.
+    """
+    results = {}
+    for stage in stages:
+        best = None
+        for _ in range(rounds):
+            calls, elapsed, times = _replay(setup, lines, stage)
+            if best is None or elapsed < best[1]:
+                best = (calls, elapsed, times)
+        calls, elapsed, times = best
+        results[stage] = {
+            'calls': calls,
+            'per_sec': calls / elapsed if elapsed else 0.0,
+            'latency_us': _latency(times),
+            'peak_bytes': _peak(setup, lines, stage)
+        }
+    return results
+
+
+def scenarios(lines: int, members: int, log: Optional[str] = None) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    The replay scenarios by name, as (setup, lines) pairs
+    """
+    names = names_burst(members)
+    result = {
+        'privmsg': ([], busy_channel(lines)),
+        'netsplit': netsplit(max(1, lines // 3)),
+        'names': (names[:1], names[1:]),
+        'tagged': ([], tagged(lines))
+    }
+    if log:
+        result['log'] = ([], read_log(log))
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    The stages of each scenario whose rate fell more than `tolerance` (a
+    fraction) below the baseline's
+    """
+    slower = []
+    for scenario, stages in results['scenarios'].items():
+        for stage, result in stages.items():
+            try:
+                before = baseline['scenarios'][scenario][stage]['per_sec']
+            except KeyError:
+                continue
+            if before and result['per_sec'] < before * (1 - tolerance):
+                slower.append(f"{scenario}/{stage}: {result['per_sec']:,.0f}/sec, "
+                              f"was {before:,.0f}/sec ({result['per_sec'] / before - 1:+.1%})")
+    return slower
+
+
+def _micro(args: argparse.Namespace) -> None:
+    lines = read_log(args.log) if args.log else busy_channel(args.lines)
+    for name, parser in (('Parser', Parser), ('Message', Message)):
+        rate, size = bench_parse(lines, parser, args.rounds)
+        print(f"parse ({name}): {rate:,.0f} lines/sec, {size / len(lines):,.0f} bytes/line held")
+    rate = bench_parse_many(lines, rounds=args.rounds)
+    print(f"parse (parse_many): {rate:,.0f} lines/sec")
+    rate = bench_dispatch(lines, args.listeners, args.rounds)
+    print(f"dispatch: {len(lines)} lines, {args.listeners} extra listeners: {rate:,.0f} lines/sec")
+    elapsed, rss, size, memberships = bench_names(names_burst(args.members), rounds=args.rounds)
+    print(f"names: {memberships:,} memberships loaded in {elapsed:.3f} sec, "
+          f"{size / memberships:,.0f} bytes/membership held"
+          + (f", {rss / 2**20:,.1f} MiB resident" if rss is not None else ""))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m pIRC.bench')
+    parser.add_argument('--log', help='recorded log of raw IRC lines to replay')
+    parser.add_argument('--lines', type=int, default=100000,
+                        help='number of synthetic lines when no log is given')
+    parser.add_argument('--listeners', type=int, default=20,
+                        help='extra listeners to register on each bot (--micro)')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--members', type=int, default=100000,
+                        help='memberships in the synthetic NAMES burst')
+    parser.add_argument('--micro', action='store_true',
+                        help='run the parse/dispatch/names micro benchmarks instead')
+    parser.add_argument('--json', metavar='PATH',
+                        help="write the replay results as JSON ('-' for stdout)")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='slowdown against --baseline counted as a regression')
+    args = parser.parse_args(argv)
+
+    if args.micro:
+        _micro(args)
+        return
+
+    results = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'scenarios': {}
+    }
+    for name, (setup, lines) in scenarios(args.lines, args.members, args.log).items():
+        results['scenarios'][name] = stages = bench_replay(setup, lines, args.rounds)
+        if args.json != '-':
+            for stage, result in stages.items():
+                latency = result['latency_us']
+                print(f"{name:>8} {stage:<9} {result['calls']:>8,} calls "
+                      f"{result['per_sec']:>12,.0f}/sec  p50 {latency['p50']:7.1f}us "
+                      f"p90 {latency['p90']:7.1f}us p99 {latency['p99']:8.1f}us "
+                      f"max {latency['max']:9.1f}us  peak {result['peak_bytes'] / 2**20:7.1f} MiB")
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for x in slower:
+            print(f"regression: {x}", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
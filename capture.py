@@ -0,0 +1,209 @@
+"""
+Capture files: every line a bot received and sent, with the time it was
+received or written out, for replaying real traffic later.
+
+A capture file starts with MAGIC and is only ever appended to. Each
+record is a header (see _record) of the monotonic time in microseconds,
+the direction (IN, OUT or MARK) and the length of the line that
+follows, without its line ending. Every capture started on a file
+begins with a MARK record holding the wall clock time and a label, and
+times only compare within one capture.
+
+Run `python -m pIRC.capture FILE` to replay a file through a bot, or
+with --dump to print it.
+"""
+import argparse
+import mmap
+import struct
+import threading
+from time import monotonic, monotonic_ns, perf_counter, sleep, time
+from typing import Iterator, List, Optional, Tuple
+
+from .parse import decode
+
+MAGIC = b'pIRCcap\x01'
+IN, OUT, MARK = 0, 1, 2
+_record = struct.Struct('<QBI')
+
+# most seconds between writes to disk of what's been captured
+FLUSH_INTERVAL = 1.0
+
+
+class Capture(object):
+    """
+    Appends the lines of a bot to a capture file. Safe to use from any
+    thread; lines are buffered and written out every FLUSH_INTERVAL.
+    """
+
+    def __init__(self, path: str, label: str = '') -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab', buffering=1 << 16)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise Exception(f"{path} is not a capture file")
+        self._flushed = monotonic()
+        self.record(MARK, f"{time():.6f} {label}".encode('utf-8'))
+
+    def record(self, direction: int, line: bytes) -> None:
+        """
+        Records a line without its line ending; does nothing once closed
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(_record.pack(monotonic_ns() // 1000, direction, len(line)))
+            self._file.write(line)
+
+    def inbound(self, data: bytes) -> None:
+        """
+        Records the complete lines received together, eg. by one read, as
+        the bytes they came in; does nothing once closed
+        """
+        stamp = monotonic_ns() // 1000
+        lines = bytes(data).split(b'\n')
+        with self._lock:
+            if self._file.closed:
+                return
+            for line in lines:
+                if line.endswith(b'\r'):
+                    line = line[:-1]
+                if line:
+                    self._file.write(_record.pack(stamp, IN, len(line)))
+                    self._file.write(line)
+
+    def outbound(self, data: bytes) -> None:
+        """
+        Records an encoded line as it's written out
+        """
+        self.record(OUT, data.rstrip(b'\r\n'))
+
+    def flush(self, force: bool = True) -> None:
+        """
+        Writes out what's buffered; unless forced, only once a
+        FLUSH_INTERVAL has passed since the last time
+        """
+        now = monotonic()
+        if force or now - self._flushed >= FLUSH_INTERVAL:
+            with self._lock:
+                self._flushed = now
+                if not self._file.closed:
+                    self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Replay(object):
+    """
+    Reads a capture file through a memory map, so files of any size are
+    replayed without loading them. Iterating gives (seconds, direction,
+    line) for each record, `line` as bytes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise Exception(f"{path} is not a capture file")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise Exception(f"{path} is not a capture file")
+
+    def __iter__(self) -> Iterator[Tuple[float, int, bytes]]:
+        data = self._map
+        unpack = _record.unpack_from
+        header = _record.size
+        offset = len(MAGIC)
+        end = len(data)
+        while offset + header <= end:
+            stamp, direction, length = unpack(data, offset)
+            offset += header
+            if offset + length > end:
+                break  # cut short while being written
+            yield stamp / 1000000, direction, data[offset:offset + length]
+            offset += length
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'Replay':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def replay(bot, path: str, speed: Optional[float] = None) -> Tuple[int, float]:
+    """
+    Feeds the lines received in a capture file through bot._run_listeners,
+    at `speed` times their original pace, or as fast as possible if None.
+    Lines are decoded the way the bot decodes what it receives.
+    Gaps between captures appended to the same file are skipped. The bot
+    needs a socket (eg. bench.FakeSocket) for anything it sends.
+
+    Returns the number of lines replayed and the seconds it took.
+    """
+    count = 0
+    encoding = bot.config['encoding']
+    fallback = bot.config['fallback_encoding']
+    start = perf_counter()
+    # capture time of the last line, and how far into the replay it fell
+    last = None
+    due = 0.0
+    with Replay(path) as records:
+        for stamp, direction, line in records:
+            if direction == MARK:
+                last = None
+                continue
+            if direction != IN:
+                continue
+            if speed:
+                if last is not None:
+                    due += max(0.0, stamp - last) / speed
+                last = stamp
+                wait = start + due - perf_counter()
+                if wait > 0:
+                    sleep(wait)
+            bot._run_listeners(decode(line, encoding, fallback))
+            count += 1
+    bot._flush_writes()
+    return count, perf_counter() - start
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m pIRC.capture')
+    parser.add_argument('path', help='capture file')
+    parser.add_argument('--speed', type=float,
+                        help='replay at this multiple of the original pace (default: as fast as possible)')
+    parser.add_argument('--dump', action='store_true',
+                        help='print the records instead of replaying them')
+    args = parser.parse_args(argv)
+
+    if args.dump:
+        with Replay(args.path) as records:
+            names = {IN: '<<', OUT: '>>', MARK: '=='}
+            for stamp, direction, line in records:
+                print(f"{stamp:.6f} {names.get(direction, '??')} "
+                      f"{line.decode('utf-8', 'replace')}")
+        return
+
+    from .bench import make_bot
+    bot = make_bot()
+    count, elapsed = replay(bot, args.path, args.speed)
+    print(f"{count:,} lines replayed in {elapsed:.3f} sec ({count / elapsed if elapsed else 0:,.0f} lines/sec)")
+    for name, result in list(bot.hook_stats().items())[:10]:
+        print(f"  {name}: {result['count']:,} calls, {result['total']:.1f} ms, p99 {result['p99']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
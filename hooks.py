@@ -1,7 +1,6 @@
 from functools import wraps
 import re
 from typing import Optional, Callable, Union, Pattern, Any
-from .threads import JobThread
 
 # utility functions for doing dynamic replacements in matches
 _replace_format = re.compile(r':(\w*):')
@@ -16,12 +15,199 @@ def _replace_match(self, match) -> str:
     else:
         return ''
 
-def _replace(self, original: Union[Pattern, str]) -> str:
+def _replace_values(self) -> tuple:
+    # The current value of every token, callables included
+    return tuple((k, str(v(self)) if callable(v) else str(v))
+                 for k, v in self.config['replace'].items())
+
+def _check_replace(self) -> None:
+    # Drops the cached substitutions once any token's value has changed,
+    # be it config['replace'] itself or what a callable returns (e.g. the
+    # bot's nick)
+    values = _replace_values(self)
+    if values != self._replace_values:
+        self._replace_cache.clear()
+        self._replace_values = values
+
+def _replace(self, original: Union[Pattern, str]) -> Union[Pattern, str]:
+    # Substituted (and compiled) results are cached per bot, as long as the
+    # token values are those _check_replace last saw
+    try:
+        return self._replace_cache[original]
+    except KeyError:
+        pass
+    replace_match = lambda match: _replace_match(self, match)
     if isinstance(original, Pattern):
-        matcher = re.sub(_replace_format, self._replace_match, original.pattern)
-        return re.compile(matcher)
+        matcher = re.sub(_replace_format, replace_match, original.pattern)
+        result = re.compile(matcher, original.flags)
     else:
-        return re.sub(_replace_format, self._replace_match, original)
+        result = re.sub(_replace_format, replace_match, original)
+    self._replace_cache[original] = result
+    return result
+
+# utility functions for scanning a line once against every raw hook pattern
+_backref_format = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=|\(\?\(')
+_global_flags_format = re.compile(r'\(\?[aiLmsux]+\)')
+_scoped_flags = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'))
+
+def _combinable(pattern: Pattern) -> Optional[str]:
+    # Source of the pattern ready to be embedded in a combined matcher,
+    # or None if it has to be matched on its own.
+    source = pattern.pattern
+    if not isinstance(source, str) or pattern.groupindex:
+        return None
+    if _backref_format.search(source) or _global_flags_format.match(source):
+        return None
+    flags = pattern.flags & ~re.UNICODE
+    scoped = ''
+    for flag, letter in _scoped_flags:
+        if flags & flag:
+            scoped += letter
+            flags &= ~flag
+    if flags:
+        return None
+    if scoped:
+        source = '(?{}:{})'.format(scoped, source)
+    try:
+        re.compile(source)
+    except re.error:
+        return None
+    return source
+
+# where a bot's combined raw matcher is cached, see _raw_matcher
+_raw_key = ('RAW',)
+
+def _raw_matcher(self, funcs: list) -> tuple:
+    # Combined matcher for the raw hooks in funcs, cached alongside the
+    # substituted patterns. Every combinable pattern is wrapped in an
+    # optional lookahead at the start of the line, so a single match()
+    # evaluates each of them exactly as pattern.match(line) would and the
+    # named group of each one that matched is set.
+    # The hooks list itself is cached on: it only shrinks (as once hooks
+    # are removed) until load_hooks() builds a new one and clears the cache.
+    cached = self._replace_cache.get(_raw_key)
+    if cached is not None and cached[0] is funcs and cached[1] == len(funcs):
+        return cached[2]
+    parts = []
+    names = {}
+    for func in funcs:
+        match = getattr(func, '_match', {}).get('raw')
+        if not isinstance(match, Pattern):
+            continue
+        pattern = _replace(self, match)
+        source = _combinable(pattern)
+        if source is None:
+            continue
+        name = '_h{}'.format(len(names))
+        parts.append('(?:(?=(?P<{}>{})))?'.format(name, source))
+        names[name] = (func, pattern)
+    combined = re.compile(''.join(parts)) if parts else None
+    result = (combined, [(combined.groupindex[name], func, pattern)
+                         for name, (func, pattern) in names.items()])
+    self._replace_cache[_raw_key] = (funcs, len(funcs), result)
+    return result
+
+def _raw_scan(self, funcs: list, line: str) -> dict:
+    # Maps each combinable raw hook in funcs to its match of the line
+    # (see _Scanned), or None if its pattern didn't match. Hooks missing
+    # from the result need to be compared directly.
+    combined, groups = _raw_matcher(self, funcs)
+    if combined is None:
+        return {}
+    found = combined.match(line)
+    start = found.start
+    return {
+        func: _Scanned(pattern, found, index) if start(index) >= 0 else None
+        for index, func, pattern in groups
+    }
+
+class _Scanned(object):
+    """
+    A raw hook's match of a line, read off the combined match of every raw
+    pattern (see _raw_scan), so the hook doesn't match its pattern again.
+    Stands in for pattern.match(line): groups are numbered as in the
+    hook's own pattern (combinable patterns have no named groups).
+    """
+    __slots__ = ('re', '_found', '_base')
+
+    def __init__(self, pattern: Pattern, found: Any, base: int) -> None:
+        self.re = pattern
+        self._found = found
+        # the combined group holding the hook's whole match
+        self._base = base
+
+    @property
+    def string(self) -> str:
+        return self._found.string
+
+    @property
+    def pos(self) -> int:
+        return self._found.pos
+
+    @property
+    def endpos(self) -> int:
+        return self._found.endpos
+
+    def _index(self, group: int) -> int:
+        if isinstance(group, int) and 0 <= group <= self.re.groups:
+            return self._base + group
+        raise IndexError('no such group')
+
+    def group(self, *groups: int) -> Any:
+        if len(groups) <= 1:
+            return self._found.group(self._index(groups[0] if groups else 0))
+        return tuple(self._found.group(self._index(x)) for x in groups)
+
+    def __getitem__(self, group: int) -> Optional[str]:
+        return self.group(group)
+
+    def groups(self, default: Any = None) -> tuple:
+        found = self._found
+        return tuple(
+            default if x is None else x
+            for x in (found.group(self._base + n) for n in range(1, self.re.groups + 1))
+        )
+
+    def groupdict(self, default: Any = None) -> dict:
+        return {}
+
+    def start(self, group: int = 0) -> int:
+        return self._found.start(self._index(group))
+
+    def end(self, group: int = 0) -> int:
+        return self._found.end(self._index(group))
+
+    def span(self, group: int = 0) -> tuple:
+        return self._found.span(self._index(group))
+
+    def __repr__(self) -> str:
+        return '<pIRC match; span={}, match={!r}>'.format(self.span(), self.group())
+
+def _replace_fields(self, func: Callable) -> dict:
+    # Match fields of a hook with the regex values run through _replace,
+    # cached per hook alongside the substituted patterns. A value of True
+    # (e.g. a raw hook without a pattern) matches anything.
+    try:
+        return self._replace_cache[func]
+    except KeyError:
+        pass
+    fields = self._replace_cache[func] = {
+        k: _replace(self, v) if isinstance(v, Pattern) else v
+        for k, v in func._match.items() if v is not True
+    }
+    return fields
+
+
+def _options(func: Callable, timeout: Optional[float], executor: Optional[str]) -> Callable:
+    # Sets how a message hook is run, as given to its decorator: `timeout`
+    # seconds on a worker before it is given up on (config['hook_timeout']
+    # if None), and where it runs, None for the bot's own thread (or its
+    # worker pool) or 'process' for the shared process pool
+    if executor not in (None, 'process'):
+        raise Exception(f"Invalid hook executor: {executor}")
+    func._timeout = timeout
+    func._executor = executor
+    return func
 
 
 
@@ -92,7 +278,7 @@ def disconnect():
 
 ### Hooks that trigger on common verbs
 
-def ping():
+def ping(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -101,11 +287,11 @@ def ping():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'PING'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
-def pong():
+def pong(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -114,11 +300,11 @@ def pong():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'PONG'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
-def join():
+def join(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -127,11 +313,11 @@ def join():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'JOIN'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
-def nick():
+def nick(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -140,11 +326,11 @@ def nick():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'NICK'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
-def part():
+def part(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -153,11 +339,11 @@ def part():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'PART'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
-def quit():
+def quit(timeout: Optional[float]=None, executor: Optional[str]=None):
     """ 
     TODO: Documentation 
     """
@@ -166,7 +352,7 @@ def quit():
         def wrapped_command(_self, info):
             return func(_self, info)
         wrapped_command._type = 'QUIT'
-        return wrapped_command
+        return _options(wrapped_command, timeout, executor)
     return wrapped
 
 
@@ -176,8 +362,11 @@ class command(object):
     """ 
     TODO: Documentation 
     """
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func: Callable):
         # Default the command's name to an exact match of the function's name.
@@ -193,15 +382,18 @@ class command(object):
             return func(_self, info)
         wrapped_command._type = 'COMMAND'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class chancommand(object):
     """ 
     TODO: Documentation 
     """
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func: Callable):
         # Default the command's name to an exact match of the function's name.
@@ -217,15 +409,18 @@ class chancommand(object):
             return func(_self, info)
         wrapped_command._type = 'CHANCOMMAND'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class privcommand(object):
     """ 
     TODO: Documentation 
     """
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func: Callable):
         # Default the command's name to an exact match of the function's name.
@@ -241,7 +436,7 @@ class privcommand(object):
             return func(_self, info)
         wrapped_command._type = 'PRIVCOMMAND'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class privmsg(object):
@@ -250,8 +445,11 @@ class privmsg(object):
     """
     # verb - PRIVMSG
     # Matches both direct and channel messages
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func):
         # Default the command's name to an exact match of the function's name.
@@ -267,7 +465,7 @@ class privmsg(object):
             return func(_self, info)
         wrapped_command._type = 'PRIVMSG'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class channel(object):
@@ -276,8 +474,11 @@ class channel(object):
     """
     # verb - PRIVMSG
     # args[0] - starts with # or &
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func):
         # Default the command's name to an exact match of the function's name.
@@ -293,7 +494,7 @@ class channel(object):
             return func(_self, info)
         wrapped_command._type = 'CHANNEL'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class private(object):
@@ -302,8 +503,11 @@ class private(object):
     """
     # verb - PRIVMSG
     # args[0] - does /not/ start with a # or &
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func):
         # Default the command's name to an exact match of the function's name.
@@ -319,7 +523,7 @@ class private(object):
             return func(_self, info)
         wrapped_command._type = 'PRIVATE'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 
 class action(object):
@@ -328,8 +532,11 @@ class action(object):
     """
     # verb - PRIVMSG
     # args[1] - ACTION
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func):
         # Default the command's name to an exact match of the function's name.
@@ -345,7 +552,7 @@ class action(object):
             return func(_self, info)
         wrapped_command._type = 'ACTION'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 ### Hooks that trigger on the NOTICE verb, custom match against the message
 
@@ -354,8 +561,11 @@ class notice(object):
     TODO: Documentation 
     """
     # verb - NOTICE
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func):
         # Default the command's name to an exact match of the function's name.
@@ -371,7 +581,7 @@ class notice(object):
             return func(_self, info)
         wrapped_command._type = 'NOTICE'
         wrapped_command._match = {'message': message}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
         
 ### Hooks that trigger on a numeric verb
 
@@ -380,12 +590,15 @@ class code(object):
     TODO: Documentation 
     """
     # verb - 3 digit number
-    def __init__(self, code: int):
+    def __init__(self, code: int, timeout: Optional[float]=None,
+                 executor: Optional[str]=None):
         if code > 999:
             raise Exception(
                 "Numeric code must be an integer less than 999 for a code hook."
             )
         self._code = code
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func: Callable):
         @wraps(func)
@@ -393,7 +606,7 @@ class code(object):
             return func(_self, info)
         wrapped_command._type = 'CODE'
         wrapped_command._match = {'verb': '{:03d}'.format(self._code)}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
 ### Hooks that trigger for each incoming line, custom match against the whole line
 
@@ -402,8 +615,11 @@ class raw(object):
     TODO: Documentation 
     """
     # Runs against unparsed line
-    def __init__(self, match: Optional[Union[str, Pattern]]=None):
+    def __init__(self, match: Optional[Union[str, Pattern]]=None,
+                 timeout: Optional[float]=None, executor: Optional[str]=None):
         self._match = match
+        self._timeout = timeout
+        self._executor = executor
 
     def __call__(self, func: Callable):
         match = self._match
@@ -413,26 +629,43 @@ class raw(object):
         @wraps(func)
         def wrapped_command(_self, info):
             if isinstance(match, Pattern):
-                info['match'] = _replace(_self, match).match(info['raw'])
+                pattern = _replace(_self, match)
+                found = info.get('match')
+                # the bot's scan of every raw pattern may have matched it already
+                if not isinstance(found, _Scanned) or found.re is not pattern:
+                    info['match'] = pattern.match(info['raw'])
             return func(_self, info)
         wrapped_command._type = 'RAW'
         wrapped_command._match = {'raw': match}
-        return wrapped_command
+        return _options(wrapped_command, self._timeout, self._executor)
 
-### Hooks that trigger on a specific interval or interval range in seconds, specify the min and max wait time
+### Hooks that trigger on a specific interval or interval range in milliseconds, specify the min and max wait time
 
-def interval(min: int, max: Optional[int]=None):
+def interval(min: int, max: Optional[int]=None, delay: Optional[int]=None,
+             align: bool=False, missed: str='skip'):
     """ 
-    TODO: Documentation 
+    Runs the function every `min` milliseconds, or a random time between
+    `min` and `max` milliseconds, while the bot is connected.
+
+    delay   - milliseconds before the first run (with align, the first
+              aligned time after it); one interval by default
+    align   - run on multiples of `min` on the wall clock (eg. 60000 for the
+              top of every minute), with `max` adding random jitter
+    missed  - 'skip' drops ticks missed while the previous run was still
+              going, 'catchup' runs them straight away
     """
+    if missed not in ('skip', 'catchup'):
+        raise Exception(f"Invalid missed tick policy: {missed}")
     def wrapped(func):
         @wraps(func)
         def wrapped_command(*args, **kwargs):
             return func(*args, **kwargs)
         wrapped_command._type = 'INTERVAL'
-        wrapped_command._thread = JobThread
         wrapped_command._min = min
         wrapped_command._max = max
+        wrapped_command._delay = delay
+        wrapped_command._align = align
+        wrapped_command._missed = missed
         return wrapped_command
     return wrapped
 
@@ -450,8 +683,8 @@ def once():
     TODO: Documentation 
     """
     def wrapped(func: Callable):
-        if hasattr(func, '_type') and not hasattr(func, '_thread'):
-            # only declare once on existing hooked functions that aren't threads
+        if hasattr(func, '_type') and func._type != 'INTERVAL':
+            # only declare once on existing hooked functions that aren't intervals
             func._once = True
         return func
     return wrapped
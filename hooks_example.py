@@ -52,7 +52,10 @@ hooks.command(regex)
     
 hooks.interval(int)
     This hook executes the wrapped function every given number of milliseconds
-    (1000 milliseconds is 1 second)
+    (1000 milliseconds is 1 second) once the bot has connected.
+    Optional: a max for a random interval, a first-run delay, align=True to
+    run on wall-clock multiples of the interval, and missed='catchup' to run
+    ticks missed by a slow run instead of skipping them.
     FUNCTION ARGUMENTS:
     1 - The executing bot's instance reference as self
 """
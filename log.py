@@ -0,0 +1,153 @@
+"""
+Logging for pIRC, through the standard logging module.
+
+Each bot logs to a logger of its own, named `pIRC.<name>.<host>` after
+its config['name'] and host with their dots replaced by underscores, so
+how much is logged can be set per bot, or per network of a bot, eg.
+
+    logging.getLogger('pIRC.MyBot').setLevel(logging.INFO)
+    logging.getLogger('pIRC.MyBot.irc_libera_chat').setLevel(logging.DEBUG)
+
+Every line received and sent is logged at DEBUG, connections and hook
+loading at INFO, slow or timed out hooks and reconnects at WARNING, and
+exceptions at ERROR. A bot with config['verbose'] set logs at DEBUG and
+calls start() when it first connects, as verbose bots used to print
+everything. Nothing is started just by importing pIRC or creating a bot.
+
+Records are only queued by the thread logging them: formatting and
+writing them out happen on a background thread (see start()), and
+levels that are turned off cost a level check. Lines of traffic (see
+traffic()) don't even have their records made until then.
+"""
+import atexit
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from time import time
+from typing import Optional
+
+logger = logging.getLogger('pIRC')
+
+_listener = None
+_records = None
+_lock = threading.Lock()
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Queues records as they are, leaving their formatting to the listener
+    thread (QueueHandler formats them in the logging thread). pIRC only
+    logs strings and numbers, which can't change in the meantime.
+
+    Records logged on the listener thread itself, such as those of lines
+    made there, are handled right away instead of going round the queue.
+    """
+
+    def __init__(self, records: queue.SimpleQueue, listener: '_QueueListener') -> None:
+        super().__init__(records)
+        self.listener = listener
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if threading.get_ident() == self.listener.ident:
+            self.listener.handle(record)
+        else:
+            super().emit(record)
+
+
+class _QueueListener(QueueListener):
+    """
+    Makes the records of lines queued by traffic() and logs them through
+    the logger they were meant for, its handlers and filters included
+    """
+
+    ident = None
+
+    def handle(self, record) -> None:
+        if not isinstance(record, tuple):
+            super().handle(record)
+            return
+        self.ident = threading.get_ident()
+        source, msg, args, created, ident, thread = record
+        record = source.makeRecord(source.name, logging.DEBUG, '', 0, msg, args, None)
+        # as if made when the line was logged
+        record.relativeCreated += (created - record.created) * 1000
+        record.created = created
+        record.msecs = int((created - int(created)) * 1000) + 0.0
+        record.thread = ident
+        record.threadName = thread
+        source.handle(record)
+
+
+def traffic(source: logging.Logger, msg: str, *args) -> None:
+    """
+    Logs a line received or sent at DEBUG, for callers that checked
+    source.isEnabledFor(logging.DEBUG). Once started, the record is made
+    and logged on the background thread, which leaves the caller a small
+    fraction of the cost of source.debug().
+    """
+    records = _records
+    if records is not None:
+        records.put((source, msg, args, time(), threading.get_ident(),
+                     threading.current_thread().name))
+    else:
+        source.debug(msg, *args)
+
+
+def start(handler: Optional[logging.Handler] = None) -> None:
+    """
+    Hands pIRC's records to `handler` on a background thread, by default
+    printing their messages to stdout.
+
+    Without a handler, nothing is done if the application has set up
+    logging of its own (the root logger has handlers), so pIRC's records
+    go wherever it sends them. Does nothing if already started.
+
+    pIRC's records still propagate to the root logger too, so handlers
+    an application adds there later also see them.
+    """
+    global _listener, _records
+    with _lock:
+        if _listener is not None:
+            return
+        if handler is None:
+            if logging.getLogger().handlers:
+                return
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+        records = queue.SimpleQueue()
+        _listener = _QueueListener(records, handler, respect_handler_level=True)
+        logger.addHandler(_QueueHandler(records, _listener))
+        _listener.start()
+        _records = records
+    atexit.register(stop)
+
+
+def stop() -> None:
+    """
+    Writes out whatever is still queued and stops the background thread
+    """
+    global _listener, _records
+    with _lock:
+        if _listener is None:
+            return
+        _records = None
+        _listener.stop()
+        _listener = None
+        for handler in list(logger.handlers):
+            if isinstance(handler, _QueueHandler):
+                logger.removeHandler(handler)
+
+
+def for_bot(name: str, host: str) -> logging.Logger:
+    """
+    The logger of the bot `name` connecting to host, so bots sharing a
+    network don't share a log level. Dots would make a deeper hierarchy
+    of loggers (one for 'pIRC.Bot.irc', one for 'pIRC.Bot.irc.libera',
+    ...), so they're replaced.
+    """
+    return logging.getLogger("pIRC.{}.{}".format(name.replace('.', '_'), host.replace('.', '_')))
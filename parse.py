@@ -1,13 +1,57 @@
 
 import re
-from typing import Optional, Any, Union, Callable, Pattern
+from collections.abc import MutableMapping
+from functools import lru_cache
+from sys import intern
+from typing import Optional, Any, Union, Callable, Pattern, Iterator, List, Tuple
 
 
+# str.translate tables for the ISUPPORT CASEMAPPING values: ascii folds A-Z,
+# rfc1459 also takes []\~ as the upper case of {}|^, strict-rfc1459 all but ~
+# (bytes tables translate ASCII names several times faster than str ones)
+_upper = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_casemaps = {
+    name: (str.maketrans(upper, lower), bytes.maketrans(upper.encode(), lower.encode()))
+    for name, upper, lower in (
+        ('ascii', _upper, _upper.lower()),
+        ('rfc1459', _upper + '[]\\~', _upper.lower() + '{}|^'),
+        ('strict-rfc1459', _upper + '[]\\', _upper.lower() + '{}|'),
+    )
+}
+_folders = {}
 
-def _match_check(source: Union[Pattern, tuple, str], target: str) -> bool:
+def folder(casemapping: Optional[str] = 'rfc1459') -> Callable[[str], str]:
+    """
+    Case folding function for nicks and channels under an ISUPPORT
+    CASEMAPPING (rfc1459 when the server doesn't send one, ascii for
+    mappings not listed above). Results are memoized in a bounded cache
+    shared by every bot using the same mapping.
+    """
+    if casemapping is None:
+        casemapping = 'rfc1459'
+    elif casemapping not in _casemaps:
+        casemapping = 'ascii'
+    try:
+        return _folders[casemapping]
+    except KeyError:
+        pass
+    table, ascii_table = _casemaps[casemapping]
+
+    @lru_cache(maxsize=8192)
+    def fold(text: str) -> str:
+        # interned, so keys folded from different lines share one string
+        if text.isascii():
+            return intern(text.encode('ascii').translate(ascii_table).decode('ascii'))
+        return intern(text.translate(table))
+    fold.casemapping = casemapping
+    return _folders.setdefault(casemapping, fold)
+
+
+def _match_check(source: Union[Pattern, tuple, str], target: str,
+                 fold: Optional[Callable] = None) -> bool:
     if isinstance(source, tuple):  # match for any
         for val in source:
-            if _match_check(val, target):
+            if _match_check(val, target, fold):
                 break
         else:
             return False
@@ -18,7 +62,8 @@ def _match_check(source: Union[Pattern, tuple, str], target: str) -> bool:
 
     elif isinstance(source, str):
         if source != target:  # compare by exact
-            return False
+            if fold is None or target is None or fold(source) != fold(target):
+                return False
 
     return True
 
@@ -46,26 +91,109 @@ def _match_tags(source: Union[dict, tuple, str], target: dict) -> bool:
     return True
 
 
-def _match_args(source: list, target: list) -> bool:
+# Positions of the nick and channel args of a verb, the only ones folded
+# when matching with a fold function; text like a message or quit reason
+# is compared as is. Numerics not listed only have the bot's nick first.
+_NAME_ARGS = {
+    'PRIVMSG': (0,), 'NOTICE': (0,), 'TAGMSG': (0,), 'JOIN': (0,),
+    'PART': (0,), 'NICK': (0,), 'MODE': (0,), 'TOPIC': (0,),
+    'KICK': (0, 1), 'INVITE': (0, 1),
+    '311': (0, 1), '315': (0, 1), '318': (0, 1), '319': (0, 1),
+    '324': (0, 1), '329': (0, 1), '332': (0, 1), '333': (0, 1),
+    '341': (0, 1, 2), '352': (0, 1, 5), '353': (0, 2), '366': (0, 1),
+    '401': (0, 1), '403': (0, 1), '404': (0, 1), '433': (0, 1),
+    '441': (0, 1, 2), '442': (0, 1), '443': (0, 1, 2), '471': (0, 1),
+    '473': (0, 1), '474': (0, 1), '475': (0, 1), '482': (0, 1),
+}
+
+
+def _name_args(verb: str) -> Tuple[int, ...]:
+    names = _NAME_ARGS.get(verb)
+    if names is None:
+        names = (0,) if verb.isdigit() else ()
+    return names
+
+
+def _match_args(source: list, target: list, fold: Optional[Callable] = None,
+                names: Tuple[int, ...] = ()) -> bool:
     for i, x in enumerate(source):
         if i + 1 > len(target):
             break
-        y = source[i]
+        y, x = x, target[i]
         if y is None:
             continue  # skip current argument index
+        by = fold if i in names else None
         if isinstance(y, tuple):
             for z in y:
-                if _match_check(z, x):
+                if _match_check(z, x, by):
                     break
             else:
                 return False
 
-        elif not _match_check(y, x):
+        elif not _match_check(y, x, by):
             return False
 
     return True
 
 
+def _compare(data, kwargs, fold: Optional[Callable] = None) -> bool:
+    """
+    Checks a parsed line (any mapping with the Parser keys) against the
+    match fields of a listener or hook. With a `fold` function (see
+    folder()), exact matches on the target, source nick and the nick and
+    channel args (see _NAME_ARGS) ignore case the way the server does.
+    """
+    for k, v in kwargs.items():
+        if k == 'tags':  # data[k] is a dynamic dict
+            if isinstance(v, dict) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
+                if isinstance(v, tuple):  # keys only, convert to dict
+                    v = {x: True for x in v}
+                elif isinstance(v, str):  # key only, convert to dict
+                    v = {v: True}
+                if not _match_tags(v, data[k]):
+                    return False
+            else:
+                raise Exception(f"Invalid type for {k}: {type(v)}")
+
+        elif k == 'source': # data[k] is a limited dict
+            if isinstance(v, Pattern) or isinstance(v, tuple) or isinstance(v, str): # raw source match
+                if not _match_check(v, data[k]['raw']):
+                    return False
+
+            elif isinstance(v, dict): # match against fields
+                for o in ['raw', 'host', 'user', 'nick']:
+                    if o not in v:
+                        continue
+                    if isinstance(v[o], Pattern) or isinstance(v[o], tuple) or isinstance(v[o], str):
+                        if not _match_check(v[o], data[k][o], fold if o == 'nick' else None):
+                            return False
+                    else:
+                        raise Exception(
+                            "Invalid type for {}[{}]: {}".format(k, o, type(v)))
+            else:
+                raise Exception(f"Invalid type for {k}: {type(v)}")
+
+
+        elif k == 'args':  # data[k] is an array
+            if isinstance(v, list) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
+                if not isinstance(v, list):
+                    v = [v]
+                names = _name_args(data['verb']) if fold is not None else ()
+                if not _match_args(v, data[k], fold, names):
+                    return False
+            else:
+                raise Exception(f"Invalid type for {k}: {type(v)}")
+
+        # data[k] is a string
+        else:
+            if isinstance(v, Pattern) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
+                if not _match_check(v, data[k], fold if k == 'target' else None):
+                    return False
+            else:
+                raise Exception(f"Invalid type for {k}: {type(v)}")
+    return True
+
+
 class Parser:
     """ 
     TODO: Documentation 
@@ -138,53 +266,229 @@ class Parser:
                 break
         self.data['args'] = args
 
-    def compare(self, kwargs) -> bool:
+    def compare(self, kwargs, fold: Optional[Callable] = None) -> bool:
         """ 
         TODO: Documentation 
         """
-        for k, v in kwargs.items():
-            if k == 'tags':  # self.data[k] is a dynamic dict
-                if isinstance(v, dict) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
-                    if isinstance(v, tuple):  # keys only, convert to dict
-                        v = {x: True for x in v}
-                    elif isinstance(v, str):  # key only, convert to dict
-                        v = {v: True}
-                    if not _match_tags(v, self.data[k]):
-                        return False
-                else:
-                    raise Exception(f"Invalid type for {k}: {type(v)}")
-
-            elif k == 'source': # self.data[k] is a limited dict
-                if isinstance(v, Pattern) or isinstance(v, tuple) or isinstance(v, str): # raw source match
-                    if not _match_check(v, self.data[k]['raw']):
-                        return False
-
-                elif isinstance(v, dict): # match against fields
-                    for o in ['raw', 'host', 'user', 'nick']:
-                        if isinstance(v[o], Pattern) or isinstance(v[o], tuple) or isinstance(v[o], str):
-                            if o in v and not _match_check(v[o], self.data[k][o]):
-                                return False
-                        else:
-                            raise Exception(
-                                "Invalid type for {}[{}]: {}".format(k, o, type(v)))
-                else:
-                    raise Exception(f"Invalid type for {k}: {type(v)}")
-
-
-            elif k == 'args':  # self.data[k] is an array
-                if isinstance(v, list) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
-                    if not isinstance(v, list):
-                        v = [v]
-                    if not _match_args(v, self.data[k]):
-                        return False
-                else:
-                    raise Exception(f"Invalid type for {k}: {type(v)}")
-
-            # self.data[k] is a string
+        return _compare(self.data, kwargs, fold)
+
+
+def _parse_tags(raw: str) -> dict:
+    tags = {}
+    for x in raw.split(';'):
+        if len(x):
+            y = tuple(x.split('='))
+            if len(y) == 1:
+                y += (True,)
+            if len(y[0]) > 0:
+                tags[y[0]] = y[1]
+    return tags
+
+
+def _parse_source(raw: str) -> dict:
+    user = nick = host = None
+    if raw.find('@') > -1:
+        front, host = tuple(raw.split('@', 1))
+        if len(front):
+            if front.find('!') > -1:
+                nick, user = tuple(front.split('!', 1))
+            else:
+                nick = front
+    else:
+        host = raw
+    return {'raw': raw, 'host': host, 'user': user, 'nick': nick}
+
+
+class Message(MutableMapping):
+    """
+    Compact parsed line, produces the same keys as Parser.data.
+
+    Only the verb is split out up front. Tags, source and args are parsed
+    the first time they are read, so lines that are dispatched on their verb
+    alone never pay for them. Keys added by listeners and hooks ('target',
+    'message', 'match') live in slots, anything else in a small side dict.
+    """
+    __slots__ = ('raw', 'verb', '_tags', '_source', '_args', '_rest',
+                 'target', 'message', 'match', '_extra')
+
+    _lazy = {'tags': '_tags', 'source': '_source', 'args': '_args'}
+    _slots = frozenset(('raw', 'verb', 'target', 'message', 'match'))
+    _unset = object()
+
+    def __init__(self, line: str) -> None:
+        self.raw = line
+        self._tags = self._source = self._extra = None
+        self._args = self._unset
+        pos = 0
+        if line.startswith('@'):
+            end = line.find(' ')
+            end = len(line) if end < 0 else end
+            self._tags = line[1:end]
+            pos = end + 1
+        if line.startswith(':', pos):
+            end = line.find(' ', pos)
+            end = len(line) if end < 0 else end
+            self._source = line[pos + 1:end]
+            pos = end + 1
+        end = line.find(' ', pos)
+        if end < 0:
+            self.verb = line[pos:]
+            self._rest = None
+        else:
+            self.verb = line[pos:end]
+            self._rest = line[end + 1:]
+
+    @property
+    def data(self) -> 'Message':
+        """
+        The message itself, for code written against Parser.data.
+        """
+        return self
+
+    @property
+    def tags(self) -> Optional[dict]:
+        if isinstance(self._tags, str):
+            self._tags = _parse_tags(self._tags)
+        return self._tags
+
+    @property
+    def source(self) -> Optional[dict]:
+        if isinstance(self._source, str):
+            self._source = _parse_source(self._source)
+        return self._source
+
+    @property
+    def args(self) -> list:
+        if self._args is self._unset:
+            if self._rest is None:
+                args = []
+            else:
+                args = self._rest.split(' ')
+                for i, arg in enumerate(args):
+                    if arg.startswith(':'): #process trailing arg
+                        args = args[:i] + [' '.join(args[i:]).lstrip(':')]
+                        break
+            self._args = args
+        return self._args
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._lazy:
+            return getattr(self, key)
+        if key in self._slots:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._lazy:
+            setattr(self, self._lazy[key], value)
+        elif key in self._slots:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._lazy or key in ('raw', 'verb'):
+            raise KeyError(f"{key} can not be removed")
+        if key in self._slots:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from ('raw', 'tags', 'source', 'verb', 'args')
+        for key in ('target', 'message', 'match'):
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Message({self.raw!r})"
+
+    def copy(self) -> 'Message':
+        """
+        Copy for a hook run on another thread, which may set keys like
+        'match' or change the args, tags and source without racing the
+        hooks that share the original. Anything not parsed yet is still
+        parsed on first use.
+        """
+        other = Message.__new__(Message)
+        for key in self.__slots__:
+            try:
+                setattr(other, key, getattr(self, key))
+            except AttributeError:
+                pass
+        if type(self._args) is list:
+            other._args = list(self._args)
+        if type(self._tags) is dict:
+            other._tags = dict(self._tags)
+        if type(self._source) is dict:
+            other._source = dict(self._source)
+        if self._extra is not None:
+            other._extra = dict(self._extra)
+        return other
+
+    def compare(self, kwargs, fold: Optional[Callable] = None) -> bool:
+        """
+        Checks the message against the match fields of a listener or hook.
+        """
+        return _compare(self, kwargs, fold)
+
+
+def parse_many(buffer: str) -> Tuple[List[Message], str]:
+    """
+    Parses every complete line in a received chunk.
+
+    Returns the parsed messages and the trailing partial line, which should
+    be prepended to the next chunk. Lines may end in \r\n or just \n, since
+    some IRC daemons disregard the RFC; empty lines are skipped.
+    """
+    if '\r' in buffer:
+        buffer = buffer.replace('\r\n', '\n')
+    lines = buffer.split('\n')
+    rest = lines.pop()
+    if '\r' in buffer:
+        # stray carriage returns left at the end of a line
+        return [Message(x.rstrip('\r')) for x in lines if x.rstrip('\r')], rest
+    return [Message(x) for x in lines if x], rest
+
+
+def decode(data: Union[bytes, bytearray, memoryview], encoding: str = 'utf-8',
+           fallback: Optional[str] = 'latin-1') -> str:
+    """
+    Decodes a run of complete lines.
+
+    The whole run is decoded at once. If it isn't valid in `encoding`, each
+    line is decoded on its own and the invalid ones use `fallback` instead,
+    so a single legacy client can't garble or drop the lines around it.
+    Without a fallback, invalid bytes are replaced.
+    """
+    try:
+        return str(data, encoding)
+    except UnicodeDecodeError:
+        pass
+    lines = []
+    for line in bytes(data).split(b'\n'):
+        try:
+            lines.append(line.decode(encoding))
+        except UnicodeDecodeError:
+            if fallback:
+                lines.append(line.decode(fallback, 'replace'))
             else:
-                if isinstance(v, Pattern) or isinstance(v, tuple) or isinstance(v, str):  # allowed types
-                    if not _match_check(v, self.data[k]):
-                        return False
-                else:
-                    raise Exception(f"Invalid type for {k}: {type(v)}")
-        return True
+                lines.append(line.decode(encoding, 'replace'))
+    return '\n'.join(lines)
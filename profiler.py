@@ -0,0 +1,100 @@
+import sys
+import cProfile
+import threading
+from collections import Counter
+from os.path import basename
+from typing import Dict, Optional
+
+from . import stats
+
+
+class Tracer(object):
+    """
+    cProfile of the thread it's started on, dumped as pstats
+    """
+
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def dump(self, path: str) -> None:
+        self._profile.dump_stats(path)
+
+
+class Sampler(object):
+    """
+    Statistical profiler: a thread of its own takes the stack of the
+    profiled thread every `interval` seconds, which costs the profiled
+    thread next to nothing. Dumped as collapsed stacks, one
+    `outer;...;inner count` line per distinct stack, as read by flame
+    graph tools.
+
+    Calls made through Base._call are shown by the name of the hook or
+    listener called (see stats.name) in brackets.
+    """
+
+    def __init__(self, ident: Optional[int]=None, interval: float=0.005) -> None:
+        self.ident = ident if ident is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(None, self._run, name='sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            if frame is None:
+                continue
+            self._stacks[self._collapse(frame)] += 1
+            self.samples += 1
+
+    def _collapse(self, frame) -> str:
+        from . import Base  # not at import time, the package imports this
+        call = Base._call.__code__
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            if code is call:
+                func = frame.f_locals.get('func')
+                labels.append(f"[{stats.name(func)}]" if func is not None else self._label(frame))
+            else:
+                labels.append(self._label(frame))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get('__name__') or basename(code.co_filename)
+            label = self._labels[code] = '{}.{}'.format(
+                module, getattr(code, 'co_qualname', code.co_name))
+        return label
+
+    def stacks(self) -> Dict[str, int]:
+        """
+        Samples taken of each collapsed stack, most first
+        """
+        counts = dict(self._stacks)  # a copy, while samples are still taken
+        return dict(sorted(counts.items(), key=lambda x: -x[1]))
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w') as file:
+            for stack, count in self.stacks().items():
+                file.write(f"{stack} {count}\n")
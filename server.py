@@ -0,0 +1,720 @@
+"""
+Stand-in IRC server for load testing bots on the local machine.
+
+It speaks enough of the protocol for Base: CAP LS/REQ/END, registration
+with 001/005/376, JOIN/PART/NAMES, PING/PONG, NICK, QUIT and PRIVMSG or
+NOTICE fan-out. Channels can be filled with simulated users that only
+exist on the server, and flooded with their messages at a given rate.
+
+Some of the flood's messages are probes (by default `!ping <token>`);
+the time until each bot in the channel sends back a message carrying the
+token is its reply latency. The server also PINGs every client every
+`ping_interval` seconds and times the PONGs. See Server.report().
+
+Run with `python -m pIRC.server`, which can also start a BotGroup of
+LoadBot instances to test against, one per loopback address
+(127.0.0.1, 127.0.0.2, ...; other platforms than Linux may need those
+aliased).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import threading
+from concurrent.futures import Future
+from time import gmtime, monotonic, sleep, strftime, time
+from typing import Callable, Dict, List, Optional
+
+from . import Base, BotGroup, hooks
+from .parse import Message, folder
+
+_probe_token = re.compile(r'probe(\d+)')
+_words = ['the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog',
+          'irc', 'bot', 'hello', 'world', 'lol', 'ok', 'yes', 'no']
+
+
+def _percentiles(values: List[float]) -> dict:
+    # nearest rank percentiles of times in seconds, as milliseconds
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+
+    def at(p: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+    return {'count': len(values), 'p50': at(50), 'p90': at(90), 'p99': at(99), 'max': values[-1] * 1000}
+
+
+class Client(object):
+    """
+    A connection to the server, and what was measured of it
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.nick = None
+        self.user = None
+        self.host = writer.get_extra_info('peername', ('unknown',))[0]
+        self.caps = set()
+        self.negotiating = False
+        self.registered = False
+        self.channels = set()
+        self.received = 0
+        self.sent = 0
+        self.buffered = 0
+        # PINGs waiting for their PONG, by token
+        self.pings = {}
+        self.pong_times = []
+        self.reply_times = []
+        # probes sent to and answered by this client
+        self.probes = 0
+        self.replied = set()
+
+    @property
+    def prefix(self) -> str:
+        return f"{self.nick}!{self.user}@{self.host}"
+
+    def send(self, line: str) -> None:
+        if self.writer.is_closing():
+            return
+        if 'server-time' in self.caps:
+            now = time()
+            line = '@time={}.{:03d}Z {}'.format(
+                strftime('%Y-%m-%dT%H:%M:%S', gmtime(now)), int(now * 1000) % 1000, line)
+        self.writer.write((line + '\r\n').encode('utf-8'))
+        self.received += 1
+        buffered = self.writer.transport.get_write_buffer_size()
+        if buffered > self.buffered:
+            self.buffered = buffered
+
+
+class Server(object):
+    """
+    The server, run on an event loop of its own by start(), or awaited
+    with serve() on a running one.
+
+    The public methods may be called from any thread.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6667,
+                 hosts: Optional[List[str]] = None, name: str = 'irc.local',
+                 ping_interval: float = 30, caps: tuple = ('multi-prefix', 'server-time'),
+                 isupport: str = 'PREFIX=(ov)@+ CHANTYPES=# CHANMODES=beI,k,l,imnpst '
+                                 'CASEMAPPING=rfc1459 NICKLEN=30 TARGMAX=PRIVMSG:4,NOTICE:4',
+                 probe: str = '!ping {token}') -> None:
+        self.hosts = [host] + [x for x in hosts or [] if x != host]
+        self.port = port
+        self.name = name
+        self.ping_interval = ping_interval
+        self.caps = caps
+        self.isupport = isupport
+        self.probe = probe
+        self.fold = folder('rfc1459')
+        self.clients = {}
+        # channel members by folded name: nick -> Client, or None for
+        # simulated users; and the ops among them
+        self.channels = {}
+        self.ops = {}
+        self._names = {}
+        self._probes = {}
+        self._probe_count = 0
+        self._floods = []
+        # the task serving each connection, and its writer
+        self._handlers = {}
+        self._started = None
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+        self._error = None
+
+    # running
+
+    def start(self) -> 'Server':
+        """
+        Runs the server on a thread of its own, returning once it listens
+        """
+        ready = threading.Event()
+        self._thread = threading.Thread(None, self._run, name='irc-server', args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self, ready: threading.Event) -> None:
+        try:
+            asyncio.run(self.serve(ready))
+        except Exception as e:
+            self._error = e
+            ready.set()
+
+    async def serve(self, ready: Optional[threading.Event] = None) -> None:
+        """
+        Listens until stop() is called
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        servers = []
+        for host in self.hosts:
+            server = await asyncio.start_server(self._client, host, self.port)
+            # the others listen on the port picked for the first one
+            self.port = server.sockets[0].getsockname()[1]
+            servers.append(server)
+        self._started = monotonic()
+        if ready is not None:
+            ready.set()
+        pinger = asyncio.ensure_future(self._pinger())
+        try:
+            await self._stopped.wait()
+        finally:
+            pinger.cancel()
+            for task in self._floods:
+                task.cancel()
+            for server in servers:
+                server.close()
+            # closing their connections ends the handlers reading them
+            for writer in list(self._handlers.values()):
+                writer.close()
+            if self._handlers:
+                await asyncio.wait(list(self._handlers), timeout=5)
+            for server in servers:
+                await server.wait_closed()
+
+    def stop(self) -> None:
+        """
+        Disconnects everyone and stops listening
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _sync(self, func: Callable, *args):
+        # runs func on the server's loop and waits for what it returns
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                return func(*args)
+        except RuntimeError:
+            pass  # no loop in this thread
+        future = Future()
+
+        def call():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self._loop.call_soon_threadsafe(call)
+        return future.result()
+
+    # scripting
+
+    def users(self, channel: str, count: int, prefix: str = 'user') -> None:
+        """
+        Adds `count` simulated users to channel, creating it if needed
+        """
+        self._sync(self._add_users, channel, count, prefix)
+
+    def _add_users(self, channel: str, count: int, prefix: str) -> None:
+        members = self._channel(channel)
+        start = len(members)
+        for n in range(start, start + count):
+            nick = f"{prefix}{n}"
+            members[self.fold(nick)] = None
+            self._names[self.fold(nick)] = nick
+            self._to_channel(channel, f":{nick}!{nick}@sim.{self.name} JOIN {channel}")
+
+    def flood(self, channel: str, rate: float, seconds: Optional[float] = None,
+              probes: float = 0.01, seed: int = 0) -> None:
+        """
+        Sends `rate` messages per second from the channel's simulated users
+        for `seconds` (or until stop_flood()), a `probes` share of them
+        probes bots are expected to answer
+        """
+        self._sync(self._start_flood, channel, rate, seconds, probes, seed)
+
+    def _start_flood(self, channel: str, rate: float, seconds: Optional[float],
+                     probes: float, seed: int) -> None:
+        self._floods.append(asyncio.ensure_future(self._flood(channel, rate, seconds, probes, seed)))
+
+    def stop_flood(self) -> None:
+        """
+        Stops every flood() still running
+        """
+        self._sync(self._stop_flood)
+
+    def _stop_flood(self) -> None:
+        for task in self._floods:
+            task.cancel()
+        self._floods = []
+
+    def broadcast(self, line: str) -> None:
+        """
+        Sends a raw line to every registered client
+        """
+        self._sync(self._broadcast, line)
+
+    def _broadcast(self, line: str) -> None:
+        for client in self.clients.values():
+            if client.registered:
+                client.send(line)
+
+    def joined(self, channel: str) -> int:
+        """
+        The clients (not simulated users) in channel
+        """
+        return self._sync(
+            lambda: sum(1 for x in self.channels.get(self.fold(channel), {}).values() if x is not None))
+
+    def report(self, reset: bool = False) -> dict:
+        """
+        What was measured of each client by nick: lines it was sent and
+        sent, probes it was sent and answered (`missed` the rest), its
+        reply and PONG latencies in milliseconds, PINGs still unanswered
+        after ping_interval, and the most bytes left buffered for it.
+        'all' merges the clients' figures.
+        """
+        return self._sync(self._report, reset)
+
+    def _report(self, reset: bool) -> dict:
+        now = monotonic()
+        clients = {}
+        replies = []
+        pongs = []
+        for client in self.clients.values():
+            if not client.registered:
+                continue
+            late = sum(1 for sent in client.pings.values() if now - sent > self.ping_interval)
+            clients[client.nick] = {
+                'received': client.received,
+                'sent': client.sent,
+                'probes': client.probes,
+                'missed': client.probes - len(client.replied),
+                'reply_ms': _percentiles(client.reply_times),
+                'pong_ms': _percentiles(client.pong_times),
+                'late_pongs': late,
+                'buffered_max': client.buffered
+            }
+            replies += client.reply_times
+            pongs += client.pong_times
+            if reset:
+                client.received = client.sent = client.probes = client.buffered = 0
+                client.replied = set()
+                client.reply_times = []
+                client.pong_times = []
+        result = {
+            'seconds': now - self._started,
+            'clients': clients,
+            'all': {
+                'clients': len(clients),
+                'received': sum(x['received'] for x in clients.values()),
+                'sent': sum(x['sent'] for x in clients.values()),
+                'probes': sum(x['probes'] for x in clients.values()),
+                'missed': sum(x['missed'] for x in clients.values()),
+                'reply_ms': _percentiles(replies),
+                'pong_ms': _percentiles(pongs),
+                'late_pongs': sum(x['late_pongs'] for x in clients.values())
+            }
+        }
+        if reset:
+            self._started = now
+        return result
+
+    # traffic
+
+    async def _flood(self, channel: str, rate: float, seconds: Optional[float],
+                     probes: float, seed: int) -> None:
+        rng = random.Random(seed)
+        members = self._channel(channel)
+        start = last = monotonic()
+        due = 0.0
+        while seconds is None or monotonic() - start < seconds:
+            # sent in ticks, catching up on however long the last one took
+            await asyncio.sleep(0.01)
+            now = monotonic()
+            due += (now - last) * rate
+            last = now
+            senders = [nick for nick, client in members.items() if client is None]
+            if not senders:
+                continue
+            while due >= 1:
+                due -= 1
+                nick = self._names[rng.choice(senders)]
+                if rng.random() < probes:
+                    text = self._new_probe(channel)
+                else:
+                    text = ' '.join(rng.choice(_words) for _ in range(rng.randint(1, 12)))
+                self._to_channel(channel, f":{nick}!{nick}@sim.{self.name} PRIVMSG {channel} :{text}")
+
+    def _new_probe(self, channel: str) -> str:
+        self._probe_count += 1
+        token = f"probe{self._probe_count}"
+        self._probes[self._probe_count] = monotonic()
+        for client in self.channels[self.fold(channel)].values():
+            if client is not None:
+                client.probes += 1
+        return self.probe.format(token=token)
+
+    def _answered(self, client: Client, text: str) -> None:
+        for match in _probe_token.finditer(text):
+            n = int(match.group(1))
+            sent = self._probes.get(n)
+            if sent is not None and n not in client.replied:
+                client.replied.add(n)
+                client.reply_times.append(monotonic() - sent)
+
+    async def _pinger(self) -> None:
+        count = 0
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            for client in list(self.clients.values()):
+                if client.registered:
+                    count += 1
+                    token = f"ping{count}"
+                    client.pings[token] = monotonic()
+                    client.send(f"PING :{token}")
+
+    # protocol
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = Client(writer)
+        reason = 'Connection closed'
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8', 'replace').rstrip('\r\n')
+                if line:
+                    client.sent += 1
+                    if self._handle(client, Message(line)) is False:
+                        reason = 'Quit'
+                        break
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            reason = str(e) or e.__class__.__name__
+        except asyncio.CancelledError:
+            # the loop is closing with the connection still open
+            reason = 'Server closing'
+        finally:
+            self._handlers.pop(task, None)
+            self._quit(client, reason)
+            writer.close()
+
+    def _handle(self, client: Client, info: Message) -> Optional[bool]:
+        verb = info['verb'].upper()
+        args = info['args']
+        handler = getattr(self, f"_on_{verb.lower()}", None)
+        if handler is None:
+            if client.registered:
+                self._reply(client, '421', verb, 'Unknown command')
+            return None
+        if not client.registered and verb not in ('CAP', 'NICK', 'USER', 'PASS', 'PING', 'PONG', 'QUIT'):
+            self._reply(client, '451', 'You have not registered')
+            return None
+        return handler(client, args)
+
+    def _reply(self, client: Client, code: str, *args: str) -> None:
+        args = list(args)
+        args[-1] = ':' + args[-1]
+        client.send(' '.join([f":{self.name}", code, client.nick or '*'] + args))
+
+    def _on_cap(self, client: Client, args: list) -> None:
+        sub = args[0].upper() if args else ''
+        if sub == 'LS':
+            client.negotiating = True
+            client.send(f":{self.name} CAP {client.nick or '*'} LS :{' '.join(self.caps)}")
+        elif sub == 'REQ':
+            client.negotiating = True
+            wanted = (args[1] if len(args) > 1 else '').split()
+            if all(x.lstrip('-') in self.caps for x in wanted):
+                for cap in wanted:
+                    if cap.startswith('-'):
+                        client.caps.discard(cap[1:])
+                    else:
+                        client.caps.add(cap)
+                client.send(f":{self.name} CAP {client.nick or '*'} ACK :{' '.join(wanted)}")
+            else:
+                client.send(f":{self.name} CAP {client.nick or '*'} NAK :{' '.join(wanted)}")
+        elif sub == 'END':
+            client.negotiating = False
+            self._welcome(client)
+
+    def _on_pass(self, client: Client, args: list) -> None:
+        pass
+
+    def _on_nick(self, client: Client, args: list) -> None:
+        if not args:
+            self._reply(client, '431', 'No nickname given')
+            return
+        nick = args[0]
+        key = self.fold(nick)
+        if key in self.clients and self.clients[key] is not client or key in self._names:
+            self._reply(client, '433', nick, 'Nickname is already in use')
+            return
+        if client.registered:
+            old = self.fold(client.nick)
+            line = f":{client.prefix} NICK :{nick}"
+            for other in self._shared(client):
+                other.send(line)
+            del self.clients[old]
+            for channel in client.channels:
+                members = self.channels[channel]
+                members[key] = members.pop(old)
+                if old in self.ops[channel]:
+                    self.ops[channel].discard(old)
+                    self.ops[channel].add(key)
+        elif client.nick is not None:
+            self.clients.pop(self.fold(client.nick), None)
+        client.nick = nick
+        self.clients[key] = client
+        self._welcome(client)
+
+    def _on_user(self, client: Client, args: list) -> None:
+        if client.registered:
+            self._reply(client, '462', 'You may not reregister')
+            return
+        client.user = args[0] if args else 'user'
+        self._welcome(client)
+
+    def _welcome(self, client: Client) -> None:
+        if client.registered or client.negotiating or client.nick is None or client.user is None:
+            return
+        client.registered = True
+        self._reply(client, '001', f"Welcome to the stand-in network {client.prefix}")
+        self._reply(client, '002', f"Your host is {self.name}")
+        self._reply(client, '004', self.name, 'pIRC-server', 'io', 'beIklmnopstv')
+        self._reply(client, '005', *self.isupport.split(), 'are supported by this server')
+        self._reply(client, '375', f"- {self.name} Message of the day -")
+        self._reply(client, '372', '- Load testing in progress')
+        self._reply(client, '376', 'End of /MOTD command.')
+
+    def _on_ping(self, client: Client, args: list) -> None:
+        client.send(f":{self.name} PONG {self.name} :{args[-1] if args else ''}")
+
+    def _on_pong(self, client: Client, args: list) -> None:
+        sent = client.pings.pop(args[-1] if args else '', None)
+        if sent is not None:
+            client.pong_times.append(monotonic() - sent)
+
+    def _on_join(self, client: Client, args: list) -> None:
+        if not args:
+            self._reply(client, '461', 'JOIN', 'Not enough parameters')
+            return
+        if args[0] == '0':
+            for channel in list(client.channels):
+                self._part(client, channel, 'Left all channels')
+            return
+        for channel in args[0].split(','):
+            if not channel.startswith('#'):
+                self._reply(client, '403', channel, 'No such channel')
+                continue
+            key = self.fold(channel)
+            if key in client.channels:
+                continue
+            members = self._channel(channel)
+            if not members:
+                self.ops[key].add(self.fold(client.nick))
+            members[self.fold(client.nick)] = client
+            client.channels.add(key)
+            self._to_channel(channel, f":{client.prefix} JOIN {channel}")
+            self._names_reply(client, channel)
+
+    def _on_names(self, client: Client, args: list) -> None:
+        for channel in (args[0] if args else '').split(','):
+            if channel:
+                self._names_reply(client, channel)
+
+    def _names_reply(self, client: Client, channel: str) -> None:
+        key = self.fold(channel)
+        members = self.channels.get(key, {})
+        ops = self.ops.get(key, set())
+        head = f":{self.name} 353 {client.nick} = {channel} :"
+        line = []
+        size = len(head)
+        for nick, member in members.items():
+            name = ('@' if nick in ops else '') + (member.nick if member is not None else self._names[nick])
+            if size + len(name) > 400 and line:
+                client.send(head + ' '.join(line))
+                line = []
+                size = len(head)
+            line.append(name)
+            size += len(name) + 1
+        if line:
+            client.send(head + ' '.join(line))
+        self._reply(client, '366', channel, 'End of /NAMES list.')
+
+    def _on_part(self, client: Client, args: list) -> None:
+        if not args:
+            self._reply(client, '461', 'PART', 'Not enough parameters')
+            return
+        for channel in args[0].split(','):
+            if self.fold(channel) not in client.channels:
+                self._reply(client, '442', channel, "You're not on that channel")
+                continue
+            self._part(client, channel, args[1] if len(args) > 1 else None)
+
+    def _part(self, client: Client, channel: str, reason: Optional[str]) -> None:
+        key = self.fold(channel)
+        self._to_channel(channel, f":{client.prefix} PART {channel}" + (f" :{reason}" if reason else ''))
+        self.channels[key].pop(self.fold(client.nick), None)
+        self.ops[key].discard(self.fold(client.nick))
+        client.channels.discard(key)
+
+    def _on_mode(self, client: Client, args: list) -> None:
+        if args and args[0].startswith('#') and len(args) == 1:
+            self._reply(client, '324', args[0], '+nt')
+
+    def _on_privmsg(self, client: Client, args: list, verb: str = 'PRIVMSG') -> None:
+        if len(args) < 2:
+            self._reply(client, '412', 'No text to send')
+            return
+        text = args[-1]
+        self._answered(client, text)
+        for target in args[0].split(','):
+            line = f":{client.prefix} {verb} {target} :{text}"
+            key = self.fold(target)
+            if target.startswith('#'):
+                if key not in self.channels:
+                    self._reply(client, '403', target, 'No such channel')
+                    continue
+                self._to_channel(target, line, client)
+            elif key in self.clients:
+                self.clients[key].send(line)
+            elif key not in self._names and verb == 'PRIVMSG':
+                self._reply(client, '401', target, 'No such nick/channel')
+
+    def _on_notice(self, client: Client, args: list) -> None:
+        self._on_privmsg(client, args, 'NOTICE')
+
+    def _on_quit(self, client: Client, args: list) -> bool:
+        client.send(f"ERROR :Closing link ({args[-1] if args else 'Quit'})")
+        return False
+
+    def _quit(self, client: Client, reason: str) -> None:
+        if client.nick is None or self.clients.get(self.fold(client.nick)) is not client:
+            return
+        line = f":{client.prefix} QUIT :{reason}"
+        for other in self._shared(client):
+            other.send(line)
+        key = self.fold(client.nick)
+        for channel in client.channels:
+            self.channels[channel].pop(key, None)
+            self.ops[channel].discard(key)
+        client.channels = set()
+        del self.clients[key]
+
+    # helpers
+
+    def _channel(self, channel: str) -> Dict[str, Optional[Client]]:
+        key = self.fold(channel)
+        if key not in self.channels:
+            self.channels[key] = {}
+            self.ops[key] = set()
+        return self.channels[key]
+
+    def _to_channel(self, channel: str, line: str, skip: Optional[Client] = None) -> None:
+        for member in self.channels.get(self.fold(channel), {}).values():
+            if member is not None and member is not skip:
+                member.send(line)
+
+    def _shared(self, client: Client) -> List[Client]:
+        # everyone sharing a channel with client, itself included
+        shared = {client.nick: client}
+        for channel in client.channels:
+            for member in self.channels[channel].values():
+                if member is not None:
+                    shared[member.nick] = member
+        return list(shared.values())
+
+
+class LoadBot(Base):
+    """
+    Bot answering the server's probes, to load test against
+    """
+
+    @hooks.command(re.compile(r'^ping (\S+)'))
+    def probe(self, info):
+        self.message(info['target'], 'pong ' + info['match'].group(1))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m pIRC.server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--bots', type=int, default=4,
+                        help='LoadBot instances to start in a BotGroup, one per loopback address')
+    parser.add_argument('--multiplex', action='store_true',
+                        help='run the bots on one selector thread')
+    parser.add_argument('--expect', type=int,
+                        help='clients to wait for in the channel before flooding (default --bots)')
+    parser.add_argument('--channel', default='#load')
+    parser.add_argument('--users', type=int, default=200,
+                        help='simulated users in the channel')
+    parser.add_argument('--rate', type=float, default=100,
+                        help='messages per second sent to the channel')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--probes', type=float, default=0.05,
+                        help='share of the messages bots are expected to answer')
+    parser.add_argument('--ping-interval', type=float, default=5)
+    parser.add_argument('--flood-rate', type=float, default=0,
+                        help="the bots' flood_rate; 0 for no flood control")
+    parser.add_argument('--json', metavar='PATH', help="write the report as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    hosts = [f"127.0.0.{n + 1}" for n in range(args.bots)]
+    server = Server(args.host, args.port, hosts=hosts, ping_interval=args.ping_interval).start()
+    server.users(args.channel, args.users)
+    print(f"Listening on port {server.port}", file=sys.stderr)
+
+    group = None
+    if args.bots:
+        group = BotGroup(LoadBot, multiplex=args.multiplex)
+        for n, host in enumerate(hosts):
+            group.network(host, nick=f"load{n}", port=server.port, channels=[args.channel],
+                          verbose=False, reconnect=False, flood_rate=args.flood_rate)
+        group.load_hooks()
+        group.connect()
+
+    expect = args.expect if args.expect is not None else args.bots
+    try:
+        waited = monotonic()
+        while server.joined(args.channel) < expect:
+            if args.bots and monotonic() - waited > 30:
+                raise SystemExit(f"Only {server.joined(args.channel)} of {expect} bots joined")
+            sleep(0.1)
+        server.flood(args.channel, args.rate, args.duration, args.probes)
+        sleep(args.duration + 1)  # and a second for the last replies
+        report = server.report()
+        if group is not None:
+            report['hooks'] = group.hook_stats()
+    finally:
+        if group is not None:
+            group.close()
+            # let the bots hang up before the server does
+            waited = monotonic()
+            while server.joined(args.channel) and monotonic() - waited < 5:
+                sleep(0.05)
+        server.stop()
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    for nick, result in sorted(report['clients'].items()) + [('all', report['all'])]:
+        reply = result['reply_ms']
+        pong = result['pong_ms']
+        print(f"{nick:>8}: {result['received']:>7,} lines in, {result['sent']:>6,} out, "
+              f"{result['probes'] - result['missed']}/{result['probes']} probes answered"
+              + (f", reply p50 {reply['p50']:.1f} p99 {reply['p99']:.1f} max {reply['max']:.1f} ms"
+                 if reply['count'] else '')
+              + (f", pong p50 {pong['p50']:.1f} max {pong['max']:.1f} ms" if pong['count'] else '')
+              + (f", {result['late_pongs']} late pongs" if result['late_pongs'] else ''))
+
+
+if __name__ == '__main__':
+    main()
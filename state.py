@@ -0,0 +1,393 @@
+import threading
+from sys import intern
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .parse import folder
+
+
+class User(object):
+    """
+    A user sharing at least one channel with the bot
+    """
+    __slots__ = ('nick', 'user', 'host', '_in')
+
+    def __init__(self, nick: str, user: Optional[str]=None, host: Optional[str]=None) -> None:
+        self.nick = nick
+        self.user = user
+        self.host = host
+        # the one channel name while there's only one, else a tuple of
+        # them; far smaller than a set for the few channels users share
+        self._in = None
+
+    @property
+    def channels(self) -> Set[str]:
+        """
+        Keys of the user's channels in State.channels
+        """
+        return set(_channels(self))
+
+    def __repr__(self) -> str:
+        return f"User({self.nick!r})"
+
+
+class Channel(object):
+    """
+    A channel the bot is in, with the prefix modes of each member keyed by
+    folded nick, as bitflags (see State.flags)
+    """
+    __slots__ = ('name', 'members')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.members = {}
+
+    def __repr__(self) -> str:
+        return f"Channel({self.name!r})"
+
+
+def _enter(member: User, channel: str) -> None:
+    if member._in is None:
+        member._in = channel
+    elif isinstance(member._in, str):
+        if member._in != channel:
+            member._in = (member._in, channel)
+    elif channel not in member._in:
+        member._in += (channel,)
+
+
+def _channels(member: User) -> Tuple[str, ...]:
+    if member._in is None:
+        return ()
+    if isinstance(member._in, str):
+        return (member._in,)
+    return member._in
+
+
+class State(object):
+    """
+    Users and channels seen by a bot, indexed both ways.
+
+    Updates are made by the bot's own listeners; each one only touches the
+    user and channel(s) involved. Lookups may be made from any thread and
+    return copies, so they can't change while a hook is looking at them.
+
+    Users and channels are keyed by their names folded under the server's
+    CASEMAPPING (see parse.folder), so 'Foo' and 'foo' are the same user.
+    Names and keys are interned, so each is held once however many
+    channels it's seen in. Prefix modes are kept as one bit per mode in
+    ISUPPORT PREFIX order, the highest ranked mode in the highest bit.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self.users = {}
+        self.channels = {}
+        # NAMES replies being collected, by channel
+        self._pending = {}
+        self.fold = folder()
+        self.prefix([('o', '@'), ('v', '+')])
+
+    def reset(self) -> None:
+        """
+        Forgets everything, eg. on reconnecting
+        """
+        with self._lock:
+            self.users = {}
+            self.channels = {}
+            self._pending = {}
+
+    def prefix(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """
+        Sets the (mode, prefix) pairs from ISUPPORT PREFIX, highest first
+        """
+        pairs = list(pairs)
+        with self._lock:
+            self.modebits = {mode: 1 << (len(pairs) - 1 - n) for n, (mode, _) in enumerate(pairs)}
+            self.prefixbits = {prefix: 1 << (len(pairs) - 1 - n) for n, (_, prefix) in enumerate(pairs)}
+            self._modeorder = [(bit, mode) for mode, bit in self.modebits.items()]
+            self._prefixchars = ''.join(self.prefixbits)
+            # bitflags of each run of prefixes seen, eg. '@+' with multi-prefix
+            self._prefixruns = dict(self.prefixbits)
+
+    def flags(self, modes: str) -> int:
+        """
+        Bitflags for a string of prefix modes, eg. 'ov'
+        """
+        bits = 0
+        for mode in modes:
+            bits |= self.modebits.get(mode, 0)
+        return bits
+
+    def letters(self, bits: int) -> str:
+        """
+        The prefix modes set in bitflags, highest first
+        """
+        return ''.join(mode for bit, mode in self._modeorder if bits & bit)
+
+    def casemapping(self, name: Optional[str]) -> None:
+        """
+        Sets the ISUPPORT CASEMAPPING nicks and channels are keyed by,
+        re-keying anything already stored
+        """
+        with self._lock:
+            fold = self.fold = folder(name)
+            keys = {ckey: fold(chan.name) for ckey, chan in self.channels.items()}
+            for chan in self.channels.values():
+                chan.members = {fold(self.users[nkey].nick): bits for nkey, bits in chan.members.items()}
+            self.channels = {keys[ckey]: chan for ckey, chan in self.channels.items()}
+            for member in self.users.values():
+                old, member._in = _channels(member), None
+                for ckey in old:
+                    _enter(member, keys[ckey])
+            self.users = {fold(member.nick): member for member in self.users.values()}
+            self._pending = {}
+
+    # updates
+
+    def join(self, channel: str, nick: str, user: Optional[str]=None,
+             host: Optional[str]=None, bits: int=0) -> None:
+        """
+        Adds nick to channel with the given prefix mode bitflags
+        """
+        with self._lock:
+            ckey = self.fold(channel)
+            chan = self.channels.get(ckey)
+            if chan is None:
+                chan = self.channels[ckey] = Channel(intern(channel))
+            nkey = self.fold(nick)
+            member = self.users.get(nkey)
+            if member is None:
+                member = self.users[nkey] = User(intern(nick), user, host)
+            elif user or host:
+                member.user = user or member.user
+                member.host = host or member.host
+            _enter(member, ckey)
+            chan.members[nkey] = bits
+            pending = self._pending.get(ckey)
+            if pending is not None:
+                members, shown = pending
+                members[nkey] = bits
+                if nick != nkey or user or host:
+                    shown[nkey] = (nick, user, host)
+
+    def names(self, channel: str, names: str) -> None:
+        """
+        Collects the members listed in one NAMES (353) reply, in one pass
+        over the names. They replace the channel's members on commit(),
+        along with any joins, parts, nick and mode changes seen meanwhile.
+        """
+        with self._lock:
+            fold = self.fold
+            ckey = fold(channel)
+            pending = self._pending.get(ckey)
+            if pending is None:
+                pending = self._pending[ckey] = ({}, {})
+            # members by folded nick, and the nicks (with any user and host)
+            # that differ from their key
+            members, shown = pending
+            chars = self._prefixchars
+            runs = self._prefixruns
+            for name in names.split():
+                nick = name.lstrip(chars)
+                if len(nick) == len(name):
+                    bits = 0
+                else:
+                    run = name[:len(name) - len(nick)]
+                    bits = runs.get(run)
+                    if bits is None:
+                        bits = runs[run] = sum(self.prefixbits[x] for x in set(run))
+                if '!' in nick:
+                    # userhost-in-names
+                    nick, _, userhost = nick.partition('!')
+                    nkey = fold(nick)
+                    shown[nkey] = (nick,) + userhost.partition('@')[::2]
+                else:
+                    nkey = fold(nick)
+                    if nkey != nick:
+                        shown[nkey] = (nick, None, None)
+                members[nkey] = bits
+
+    def commit(self, channel: str, nick: str) -> None:
+        """
+        Ends a NAMES reply (366): the members collected for channel replace
+        its old ones all at once. Replies for channels the bot (`nick`)
+        isn't in are dropped.
+        """
+        ckey = self.fold(channel)
+        with self._lock:
+            members, shown = self._pending.pop(ckey, ({}, {}))
+            chan = self.channels.get(ckey)
+            if chan is None:
+                if self.fold(nick) not in members:
+                    return
+                chan = self.channels[ckey] = Channel(intern(channel))
+            users = self.users
+            for nkey in members:
+                member = users.get(nkey)
+                if member is None:
+                    if nkey in shown:
+                        member = User(*shown[nkey])
+                        member.nick = intern(member.nick)
+                    else:
+                        member = User(nkey)
+                    users[nkey] = member
+                _enter(member, ckey)
+            for old in chan.members:
+                if old not in members:
+                    self._leave(ckey, old)
+            chan.members = members
+
+    def part(self, channel: str, nick: str) -> None:
+        """
+        Removes nick from channel, and forgets the user if it was the last
+        channel shared with the bot (also used for KICK)
+        """
+        with self._lock:
+            ckey, nkey = self.fold(channel), self.fold(nick)
+            chan = self.channels.get(ckey)
+            if chan is not None:
+                chan.members.pop(nkey, None)
+            pending = self._pending.get(ckey)
+            if pending is not None:
+                for held in pending:
+                    held.pop(nkey, None)
+            self._leave(ckey, nkey)
+
+    def drop(self, channel: str) -> None:
+        """
+        Forgets a channel the bot itself has left, and any users that were
+        only seen there
+        """
+        with self._lock:
+            ckey = self.fold(channel)
+            self._pending.pop(ckey, None)
+            chan = self.channels.pop(ckey, None)
+            if chan is not None:
+                for nkey in chan.members:
+                    self._leave(ckey, nkey)
+
+    def quit(self, nick: str) -> None:
+        """
+        Removes nick from every channel
+        """
+        with self._lock:
+            nkey = self.fold(nick)
+            for held in self._held():
+                held.pop(nkey, None)
+            member = self.users.pop(nkey, None)
+            if member is not None:
+                for ckey in _channels(member):
+                    self.channels[ckey].members.pop(nkey, None)
+
+    def nick(self, old: str, new: str) -> None:
+        """
+        Renames a user in the indexes
+        """
+        with self._lock:
+            okey, nkey = self.fold(old), self.fold(new)
+            for members, shown in self._pending.values():
+                if okey in members:
+                    members[nkey] = members.pop(okey)
+                    user, host = shown.pop(okey, (None, None, None))[1:]
+                    if new != nkey or user or host:
+                        shown[nkey] = (new, user, host)
+            member = self.users.pop(okey, None)
+            if member is None:
+                return
+            member.nick = intern(new)
+            self.users[nkey] = member
+            for ckey in _channels(member):
+                members = self.channels[ckey].members
+                members[nkey] = members.pop(okey, 0)
+
+    def mode(self, channel: str, nick: str, mode: str, add: bool=True) -> None:
+        """
+        Sets or unsets a prefix mode of nick in channel
+        """
+        with self._lock:
+            ckey, nkey = self.fold(channel), self.fold(nick)
+            bit = self.modebits.get(mode, 0)
+            for members in (getattr(self.channels.get(ckey), 'members', None),
+                            self._pending.get(ckey, (None,))[0]):
+                if members is None or nkey not in members:
+                    continue
+                if add:
+                    members[nkey] |= bit
+                else:
+                    members[nkey] &= ~bit
+
+    def _held(self) -> Iterable[dict]:
+        # the members and shown dicts of every NAMES reply being collected
+        for pending in self._pending.values():
+            yield from pending
+
+    def _leave(self, ckey: str, nkey: str) -> None:
+        member = self.users.get(nkey)
+        if member is None:
+            return
+        if isinstance(member._in, str):
+            if member._in == ckey:
+                member._in = None
+        elif member._in is not None:
+            rest = tuple(x for x in member._in if x != ckey)
+            member._in = rest[0] if len(rest) == 1 else rest or None
+        if member._in is None:
+            del self.users[nkey]
+
+    # lookups
+
+    def members(self, channel: str) -> Dict[str, str]:
+        """
+        The nicks in channel, mapped to their prefix modes (eg. 'o')
+        """
+        with self._lock:
+            chan = self.channels.get(self.fold(channel))
+            if chan is None:
+                return {}
+            users = self.users
+            return {users[nkey].nick: self.letters(bits) for nkey, bits in chan.members.items()}
+
+    def channels_of(self, nick: str) -> Set[str]:
+        """
+        The channels nick shares with the bot
+        """
+        with self._lock:
+            member = self.users.get(self.fold(nick))
+            if member is None:
+                return set()
+            return {self.channels[ckey].name for ckey in _channels(member)}
+
+    def bits(self, channel: str, nick: str) -> Optional[int]:
+        """
+        The prefix mode bitflags of nick in channel, or None if they aren't
+        in it. Compare with `modebits`, eg. to check for op or higher.
+        """
+        with self._lock:
+            chan = self.channels.get(self.fold(channel))
+            return chan.members.get(self.fold(nick)) if chan is not None else None
+
+    def modes(self, channel: str, nick: str) -> Optional[str]:
+        """
+        The prefix modes of nick in channel, or None if they aren't in it
+        """
+        bits = self.bits(channel, nick)
+        return self.letters(bits) if bits is not None else None
+
+    def has_mode(self, channel: str, nick: str, mode: str) -> bool:
+        """
+        Whether nick is in channel with the given prefix mode (eg. 'o')
+        """
+        return bool((self.bits(channel, nick) or 0) & self.modebits.get(mode, 0))
+
+    def is_on(self, channel: str, nick: str) -> bool:
+        """
+        Whether nick is in channel
+        """
+        return self.bits(channel, nick) is not None
+
+    def user(self, nick: str) -> Optional[User]:
+        """
+        The User for nick, if the bot shares a channel with them
+        """
+        with self._lock:
+            return self.users.get(self.fold(nick))
@@ -0,0 +1,139 @@
+import threading
+from typing import Callable, Dict, Iterable
+
+# Call times are counted in power of two buckets of microseconds: bucket n
+# holds times of [2**(n-1), 2**n) us, the last one anything longer.
+_buckets = 32
+
+
+def name(func: Callable) -> str:
+    """
+    Name a hook or listener is recorded under
+    """
+    func = getattr(func, '__func__', func)  # bound methods
+    return '{}.{}'.format(
+        getattr(func, '__module__', None) or '?',
+        getattr(func, '__qualname__', None) or repr(func)
+    )
+
+
+def _name(func: Callable) -> str:
+    """
+    name(), remembered on the function where it can be
+    """
+    key = name(func)
+    try:
+        getattr(func, '__func__', func)._stats_name = key
+    except AttributeError:
+        pass  # builtins and the like
+    return key
+
+
+class Timing(object):
+    """
+    Call count, errors and a histogram of call times of one function
+    """
+    __slots__ = ('count', 'errors', 'total', 'max', 'buckets')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0]*_buckets
+
+    def record(self, elapsed: float, failed: bool=False) -> None:
+        self.count += 1
+        self.errors += failed
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[min(int(elapsed*1000000).bit_length(), _buckets - 1)] += 1
+
+    def merge(self, other: 'Timing') -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [x + y for x, y in zip(self.buckets, other.buckets)]
+
+    def percentile(self, p: float) -> float:
+        """
+        Approximate call time in seconds below which p percent of calls
+        took, interpolated within its bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count*p/100
+        seen = 0
+        for n, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low = 2**(n - 1) if n else 0
+                high = 2**n
+                return min(self.max, (low + (high - low)*(rank - seen)/count)/1000000)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> dict:
+        """
+        The figures as a dict, times in milliseconds
+        """
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total': self.total*1000,
+            'mean': self.total*1000/self.count if self.count else 0.0,
+            'p50': self.percentile(50)*1000,
+            'p90': self.percentile(90)*1000,
+            'p99': self.percentile(99)*1000,
+            'max': self.max*1000
+        }
+
+
+class Stats(object):
+    """
+    Timings of every hook and listener of a bot, by name. Recorded from the
+    socket thread, workers and the scheduler alike, under one lock.
+    """
+
+    def __init__(self) -> None:
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, func: Callable, elapsed: float, failed: bool=False) -> None:
+        # read through bound methods too
+        key = getattr(func, '_stats_name', None) or _name(func)
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = Timing()
+            timing.record(elapsed, failed)
+
+    def timings(self, reset: bool=False) -> Dict[str, Timing]:
+        """
+        Copies of the timings, optionally starting over
+        """
+        with self._lock:
+            timings = self._timings
+            if reset:
+                self._timings = {}
+            copies = {}
+            for key, timing in timings.items():
+                copies[key] = Timing()
+                copies[key].merge(timing)
+        return copies
+
+
+def report(timings: Iterable[Dict[str, Timing]]) -> Dict[str, dict]:
+    """
+    Merges timings (eg. of several bots) into snapshots by name, slowest
+    in total first
+    """
+    merged = {}
+    for group in timings:
+        for key, timing in group.items():
+            merged.setdefault(key, Timing()).merge(timing)
+    return {
+        key: timing.snapshot()
+        for key, timing in sorted(merged.items(), key=lambda x: -x[1].total)
+    }
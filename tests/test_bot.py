@@ -0,0 +1,175 @@
+from .. import Base, _split_text, log
+from ..bench import FakeSocket
+
+
+class Socket(FakeSocket):
+    """
+    Keeps what's sent, as lines
+    """
+    def __init__(self):
+        super().__init__()
+        self.data = b''
+
+    def send(self, data):
+        self.data += bytes(data)
+        return super().send(data)
+
+    def sendall(self, data):
+        self.data += bytes(data)
+        super().sendall(data)
+
+    @property
+    def lines(self):
+        return self.data.decode().splitlines()
+
+
+def make_bot(**config):
+    config.setdefault('verbose', False)
+    bot = Base('test.invalid', nick='bot', **config)
+    bot.socket = Socket()
+    return bot
+
+
+def test_flood_control_holds_lines_back():
+    bot = make_bot(flood_burst=2, flood_rate=1)
+    for n in range(4):
+        bot._cmd('PRIVMSG', '#c', str(n))
+    assert bot.socket.lines == ['PRIVMSG #c 0', 'PRIVMSG #c 1']
+    assert len(bot._outbound) == 2
+
+
+def test_priority_lines_take_no_token():
+    bot = make_bot(flood_burst=1, flood_rate=1)
+    bot._cmd('PRIVMSG', '#c', 'first')
+    bot._cmd('PRIVMSG', '#c', 'held')
+    tokens = bot._tokens
+    for _ in range(5):
+        bot._cmd('PONG', 'token', priority=True)
+    assert bot.socket.lines == ['PRIVMSG #c first'] + ['PONG token']*5
+    assert bot._tokens >= tokens
+    # the held back line goes out as soon as a token is back
+    bot._tokens = 1.0
+    bot._flush()
+    assert bot.socket.lines[-1] == 'PRIVMSG #c held'
+
+
+def test_quit_waits_for_held_back_lines():
+    bot = make_bot(flood_burst=1, flood_rate=1)
+    bot._cmd('PRIVMSG', '#c', 'first')
+    bot._cmd('PRIVMSG', '#c', 'held')
+    socket = bot.socket
+    bot.quit('bye')
+    bot._run_queued()
+    assert bot.socket is socket
+    assert socket.lines == ['PRIVMSG #c first']
+    bot._tokens = 1.0
+    bot._flush()
+    bot._run_queued()
+    assert socket.lines == ['PRIVMSG #c first', 'PRIVMSG #c held', 'QUIT bye']
+    assert bot.socket is None
+
+
+def test_quit_gives_up_waiting():
+    bot = make_bot(flood_burst=1, flood_rate=0.001, quit_timeout=0.01)
+    bot._cmd('PRIVMSG', '#c', 'first')
+    bot._cmd('PRIVMSG', '#c', 'dropped')
+    socket = bot.socket
+    bot.quit('bye')
+    bot._run_queued()
+    assert bot.socket is socket
+    bot._quit_by -= 1
+    bot._flush()
+    bot._run_queued()
+    assert socket.lines == ['PRIVMSG #c first', 'QUIT bye']
+    assert bot.socket is None
+
+
+def isupport(bot, *tokens):
+    bot._005_compile_isupport({'args': ['bot', *tokens, 'are supported by this server']})
+
+
+def test_pack_targets_targmax():
+    bot = make_bot()
+    isupport(bot, 'TARGMAX=PRIVMSG:2,notice:3,JOIN:')
+    targets = ['#a', '#b', '#c', '#d', '#e']
+    assert bot._pack_targets('PRIVMSG', targets) == ['#a,#b', '#c,#d', '#e']
+    assert bot._pack_targets('NOTICE', targets) == ['#a,#b,#c', '#d,#e']
+    assert bot._pack_targets('JOIN', targets) == ['#a,#b,#c,#d,#e']
+    assert bot._pack_targets('KICK', targets) == targets
+
+
+def test_pack_targets_maxtargets():
+    bot = make_bot()
+    isupport(bot, 'MAXTARGETS=3')
+    targets = ['#a', '#b', '#c', '#d']
+    assert bot._pack_targets('PRIVMSG', targets) == ['#a,#b,#c', '#d']
+    assert bot._pack_targets('NOTICE', targets) == ['#a,#b,#c', '#d']
+    assert bot._pack_targets('JOIN', targets) == targets
+    # TARGMAX wins over MAXTARGETS
+    isupport(bot, 'TARGMAX=PRIVMSG:1')
+    assert bot._pack_targets('PRIVMSG', targets) == targets
+
+
+def test_pack_targets_default():
+    bot = make_bot()
+    assert bot._pack_targets('PRIVMSG', ['#a', '#b']) == ['#a', '#b']
+    assert bot._pack_targets('PRIVMSG', []) == []
+
+
+def test_split_text_at_spaces():
+    assert _split_text('short', 10) == ['short']
+    assert _split_text('aaa bbb ccc ddd', 8) == ['aaa bbb', 'ccc ddd']
+    assert _split_text('aaaaaaaaaaaa', 5) == ['aaaaa', 'aaaaa', 'aa']
+
+
+def test_split_text_counts_bytes():
+    # é is two bytes in utf-8, so at most 2 fit in 5 bytes
+    parts = _split_text('é'*5, 5)
+    assert parts == ['éé', 'éé', 'é']
+    assert ''.join(parts) == 'é'*5
+
+
+def test_split_text_keeps_characters_whole():
+    text = 'a€€€'  # € is three bytes in utf-8
+    parts = _split_text(text, 4)
+    assert parts == ['a€', '€', '€']
+    assert all(len(x.encode()) <= 4 for x in parts)
+    assert _split_text(text, 4, 'cp1252') == [text]
+
+
+def test_deliver_splits_to_line_budget():
+    bot = make_bot()
+    bot._userhost = 'u@h'
+    budget = bot._line_budget('PRIVMSG', '#c')
+    bot._deliver('PRIVMSG', '#c', 'x'*(budget + 10))
+    assert bot.socket.lines == ['PRIVMSG #c ' + 'x'*budget, 'PRIVMSG #c ' + 'x'*10]
+
+
+def test_listeners_track_case_folded_names():
+    bot = make_bot()
+    for line in (':bot!b@h JOIN #Chan', ':srv 353 bot = #chan :@bot Foo[a]',
+                 ':srv 366 BOT #CHAN :End of /NAMES list.', ':foo{A}!u@h NICK Bar',
+                 ':op!u@h MODE #CHAN +o bar'):
+        bot._run_listeners(line)
+    assert bot.state.members('#chan') == {'bot': 'o', 'Bar': 'o'}
+    bot._run_listeners(':BAR!u@h PART #chan')
+    assert bot.state.members('#CHAN') == {'bot': 'o'}
+    bot._run_listeners(':BOT!b@h PART #CHAN')
+    assert bot.state.channels == {}
+
+
+def test_bot_loggers_by_name_and_host():
+    one, two = make_bot(name='one'), make_bot(name='t.wo')
+    assert one.log.name == 'pIRC.one.test_invalid'
+    assert two.log.name == 'pIRC.t_wo.test_invalid'
+
+
+def test_logging_starts_on_connect(monkeypatch):
+    started = []
+    monkeypatch.setattr(log, 'start', lambda *args: started.append(args))
+    bot = make_bot(verbose=True)
+    assert started == []
+    bot._start_log()
+    assert started == [()]
+    make_bot(verbose=False)._start_log()
+    assert len(started) == 1
@@ -0,0 +1,80 @@
+import pytest
+
+from ..capture import IN, MARK, OUT, Capture, Replay, replay
+from .test_bot import make_bot
+
+
+RECEIVED = [
+    ':srv 001 bot :Welcome',
+    ':bot!b@h JOIN #chan',
+    ':srv 353 bot = #chan :@bot Foo',
+    ':srv 366 bot #chan :End of /NAMES list.',
+    ':foo!u@h PRIVMSG #chan :caf\xe9',
+    'PING :token',
+]
+
+
+def receive(bot, data):
+    # as if read from the socket
+    view = bot._recv_view()
+    view[:len(data)] = data
+    bot._process(bot._frame(len(data)))
+
+
+def test_capture_round_trip(tmp_path):
+    path = str(tmp_path / 'bot.cap')
+    bot = make_bot(capture=path)
+    data = ''.join(x + '\r\n' for x in RECEIVED).encode('utf-8')
+    receive(bot, data[:40])
+    receive(bot, data[40:])
+    bot.stop_capture()
+
+    with Replay(path) as records:
+        records = list(records)
+    assert records[0][1] == MARK
+    assert records[0][2].endswith(b' bot test.invalid')
+    assert [line.decode() for _, x, line in records if x == IN] == RECEIVED
+    assert b'PONG token' in [line for _, x, line in records if x == OUT]
+    stamps = [stamp for stamp, _, _ in records]
+    assert stamps == sorted(stamps)
+
+    other = make_bot()
+    count, _ = replay(other, path)
+    assert count == len(RECEIVED)
+    assert other.state.members('#chan') == bot.state.members('#chan') == {'bot': 'o', 'Foo': ''}
+    assert 'PONG token' in other.socket.lines
+
+
+def test_captures_append(tmp_path):
+    path = str(tmp_path / 'bot.cap')
+    for label in ('one', 'two'):
+        cap = Capture(path, label)
+        cap.record(IN, b'PING :' + label.encode())
+        cap.close()
+    with Replay(path) as records:
+        records = [(x, line) for _, x, line in records]
+    assert [line.split()[-1] for x, line in records if x == MARK] == [b'one', b'two']
+    assert [line for x, line in records if x == IN] == [b'PING :one', b'PING :two']
+
+
+def test_replay_stops_at_record_cut_short(tmp_path):
+    path = tmp_path / 'bot.cap'
+    cap = Capture(str(path))
+    cap.record(IN, b'PING :a')
+    cap.record(IN, b'PING :b')
+    cap.close()
+    path.write_bytes(path.read_bytes()[:-3])
+    with Replay(str(path)) as records:
+        assert [line for _, x, line in records if x == IN] == [b'PING :a']
+
+
+def test_not_a_capture_file(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_bytes(b'PING :a\r\n')
+    with pytest.raises(Exception):
+        Replay(str(path))
+    with pytest.raises(Exception):
+        Capture(str(path))
+    (tmp_path / 'empty').write_bytes(b'')
+    with pytest.raises(Exception):
+        Replay(str(tmp_path / 'empty'))
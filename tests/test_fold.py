@@ -0,0 +1,36 @@
+import re
+
+from ..parse import Message, folder
+
+
+def test_folder_casemappings():
+    rfc1459, strict, ascii = folder('rfc1459'), folder('strict-rfc1459'), folder('ascii')
+    assert rfc1459('Nick[]\\~') == 'nick{}|^'
+    assert strict('Nick[]\\~') == 'nick{}|~'
+    assert ascii('Nick[]\\~') == 'nick[]\\~'
+    assert folder(None) is rfc1459
+    assert folder('unknown') is ascii
+    assert folder('rfc1459') is rfc1459
+
+
+def test_folder_non_ascii():
+    assert folder('rfc1459')('ÄNick[') == 'Änick{'
+
+
+def test_compare_folds_names():
+    fold = folder('rfc1459')
+    message = Message(':Nick[a]!user@Host PRIVMSG #Chan :Hello')
+    assert message.compare({'args': ['#chan']}, fold)
+    assert not message.compare({'args': ['#chan']})
+    assert message.compare({'source': {'nick': 'nick{a}'}}, fold)
+    # only names are folded, not the message text or the host
+    assert not message.compare({'args': ['#chan', 'hello']}, fold)
+    assert not message.compare({'source': {'host': 'host'}}, fold)
+    assert message.compare({'args': [re.compile('#C'), 'Hello']}, fold)
+
+
+def test_compare_folds_kick_target():
+    fold = folder('rfc1459')
+    message = Message(':op!u@h KICK #Chan Nick[a] :bye')
+    assert message.compare({'verb': 'KICK', 'args': ['#chan', 'NICK{A}']}, fold)
+    assert not message.compare({'args': ['#chan', 'NICK{A}', 'BYE']}, fold)
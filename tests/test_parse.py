@@ -0,0 +1,107 @@
+import pytest
+
+from ..parse import Message, Parser, decode, parse_many
+
+
+LINES = [
+    'PING :token',
+    ':irc.local 001 bot :Welcome to the network',
+    ':nick!user@host PRIVMSG #chan :hello  there :)',
+    '@time=2024-01-01T00:00:00Z;account=acc;bare :nick!user@host JOIN #chan',
+    ':irc.local 353 bot = #chan :@op +voice plain',
+    ':nick!user@host QUIT',
+    ':server.only NOTICE * :*** Looking up your hostname',
+    'AWAY',
+]
+
+
+@pytest.mark.parametrize('line', LINES)
+def test_message_matches_parser(line):
+    message = Message(line)
+    expected = Parser(line).data
+    assert dict(message) == {k: expected[k] for k in message}
+    for key in ('tags', 'source', 'verb', 'args'):
+        assert message[key] == expected[key]
+
+
+def test_message_parses_lazily():
+    message = Message('@a=1 :nick!user@host PRIVMSG #chan :hi')
+    assert message.verb == 'PRIVMSG'
+    assert message._tags == 'a=1'
+    assert message._source == 'nick!user@host'
+    assert message._args is Message._unset
+    assert message['args'] == ['#chan', 'hi']
+    assert message['source']['nick'] == 'nick'
+    assert message['tags'] == {'a': '1'}
+
+
+def test_message_keys():
+    message = Message(':nick!user@host PRIVMSG #chan :hi')
+    assert 'target' not in message
+    message['target'] = '#chan'
+    message['extra'] = 1
+    assert message['target'] == '#chan'
+    assert list(message)[-2:] == ['target', 'extra']
+    del message['target']
+    del message['extra']
+    assert 'target' not in message and 'extra' not in message
+    with pytest.raises(KeyError):
+        message['missing']
+    with pytest.raises(KeyError):
+        del message['verb']
+
+
+def test_message_copy_is_independent():
+    message = Message('@a=1 :nick!user@host PRIVMSG #chan :hi')
+    message['args'], message['tags'], message['source']
+    message['extra'] = 1
+    copy = message.copy()
+    copy['args'][0] = '#other'
+    copy['tags']['a'] = '2'
+    copy['source']['nick'] = 'other'
+    copy['match'] = 'm'
+    copy['extra'] = 2
+    assert message['args'] == ['#chan', 'hi']
+    assert message['tags'] == {'a': '1'}
+    assert message['source']['nick'] == 'nick'
+    assert 'match' not in message
+    assert message['extra'] == 1
+
+
+def test_message_copy_leaves_unparsed_fields_lazy():
+    copy = Message(':nick!user@host PRIVMSG #chan :hi').copy()
+    assert copy._args is Message._unset
+    assert copy['args'] == ['#chan', 'hi']
+
+
+def test_parse_many_keeps_partial_line():
+    messages, rest = parse_many('PING :a\r\n:n!u@h PRIVMSG #c :hi\r\n:n!u@h PRIV')
+    assert [m.raw for m in messages] == ['PING :a', ':n!u@h PRIVMSG #c :hi']
+    assert rest == ':n!u@h PRIV'
+
+
+def test_parse_many_line_endings():
+    messages, rest = parse_many('PING :a\nPING :b\r\n\r\n\nPING :c\r\r\n')
+    assert [m.raw for m in messages] == ['PING :a', 'PING :b', 'PING :c']
+    assert rest == ''
+
+
+def test_parse_many_partial_only():
+    assert parse_many('PING :a') == ([], 'PING :a')
+    assert parse_many('') == ([], '')
+
+
+def test_decode_valid_run():
+    assert decode(b'PRIVMSG #c :caf\xc3\xa9\r\nPING :a\r\n') == 'PRIVMSG #c :café\r\nPING :a\r\n'
+    assert decode(memoryview(b'PING :a\n')) == 'PING :a\n'
+
+
+def test_decode_falls_back_per_line():
+    data = b'PRIVMSG #c :caf\xc3\xa9\r\nPRIVMSG #c :caf\xe9\r\nPING :a\r\n'
+    assert decode(data) == 'PRIVMSG #c :café\r\nPRIVMSG #c :café\r\nPING :a\r\n'
+    assert decode(data, fallback='cp1252') == 'PRIVMSG #c :café\r\nPRIVMSG #c :café\r\nPING :a\r\n'
+
+
+def test_decode_without_fallback_replaces():
+    data = b'PRIVMSG #c :caf\xc3\xa9\nPRIVMSG #c :caf\xe9\n'
+    assert decode(data, fallback=None) == 'PRIVMSG #c :café\nPRIVMSG #c :caf�\n'
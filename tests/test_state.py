@@ -0,0 +1,93 @@
+from ..state import State
+
+
+def roster(state, names, channel='#chan', nick='bot'):
+    state.names(channel, names)
+    state.commit(channel, nick)
+
+
+def test_names_replace_members_on_commit():
+    state = State()
+    roster(state, '@bot +voice plain')
+    assert state.members('#chan') == {'bot': 'o', 'voice': 'v', 'plain': ''}
+    state.names('#chan', 'bot new')
+    # the old roster stands until the reply ends
+    assert state.members('#chan') == {'bot': 'o', 'voice': 'v', 'plain': ''}
+    state.commit('#chan', 'bot')
+    assert state.members('#chan') == {'bot': '', 'new': ''}
+    assert state.user('voice') is None and state.user('plain') is None
+
+
+def test_names_over_several_replies():
+    state = State()
+    state.names('#chan', '@bot one')
+    state.names('#chan', '+two')
+    state.commit('#chan', 'bot')
+    assert state.members('#chan') == {'bot': 'o', 'one': '', 'two': 'v'}
+    assert state.channels_of('two') == {'#chan'}
+
+
+def test_names_multi_prefix_and_userhost():
+    state = State()
+    roster(state, '@+bot!b@host.one +@Other!o@host.two')
+    assert state.members('#chan') == {'bot': 'ov', 'Other': 'ov'}
+    other = state.user('other')
+    assert (other.nick, other.user, other.host) == ('Other', 'o', 'host.two')
+
+
+def test_names_for_channel_bot_is_not_in_are_dropped():
+    state = State()
+    roster(state, 'someone else')
+    assert state.channels == {} and state.users == {}
+
+
+def test_live_changes_during_names_are_kept():
+    state = State()
+    roster(state, '@bot old stays')
+    state.names('#chan', '@bot old stays renamed voiced')
+    state.join('#chan', 'Joined', 'j', 'host')
+    state.part('#chan', 'old')
+    state.nick('renamed', 'Newnick')
+    state.mode('#chan', 'voiced', 'v')
+    state.commit('#chan', 'bot')
+    assert state.members('#chan') == {
+        'bot': 'o', 'stays': '', 'Newnick': '', 'voiced': 'v', 'Joined': ''}
+    assert state.user('joined').host == 'host'
+    assert state.user('old') is None and state.user('renamed') is None
+
+
+def test_quit_during_names():
+    state = State()
+    roster(state, 'bot gone')
+    state.names('#chan', 'bot gone')
+    state.quit('gone')
+    state.commit('#chan', 'bot')
+    assert state.members('#chan') == {'bot': ''}
+    assert state.user('gone') is None
+
+
+def test_case_folded_updates():
+    state = State()
+    roster(state, '@bot Foo[away]')
+    state.mode('#CHAN', 'FOO{AWAY}', 'o')
+    assert state.modes('#chan', 'foo[away]') == 'o'
+    state.nick('fOO{away}', 'Bar')
+    assert state.members('#Chan') == {'bot': 'o', 'Bar': 'o'}
+    assert state.is_on('#chan', 'BAR')
+    state.mode('#chan', 'bar', 'o', False)
+    assert state.modes('#chan', 'Bar') == ''
+    state.part('#Chan', 'BAR')
+    assert state.members('#chan') == {'bot': 'o'}
+    assert state.user('bar') is None
+
+
+def test_casemapping_rekeys():
+    state = State()
+    roster(state, 'bot Foo[x]', '#Chan[1]')
+    state.casemapping('ascii')
+    assert state.user('foo[x]').nick == 'Foo[x]'
+    assert state.user('foo{x}') is None
+    assert state.members('#chan[1]') == {'bot': '', 'Foo[x]': ''}
+    state.casemapping('rfc1459')
+    assert state.user('FOO{X}').nick == 'Foo[x]'
+    assert state.channels_of('foo{x}') == {'#Chan[1]'}
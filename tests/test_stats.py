@@ -0,0 +1,44 @@
+import threading
+
+from .. import stats
+
+
+def hook():
+    pass
+
+
+def test_record_and_snapshot():
+    recorded = stats.Stats()
+    for elapsed in (0.001, 0.002, 0.003):
+        recorded.record(hook, elapsed)
+    recorded.record(hook, 0.004, True)
+    timing = recorded.timings()[stats.name(hook)]
+    snapshot = timing.snapshot()
+    assert snapshot['count'] == 4 and snapshot['errors'] == 1
+    assert snapshot['total'] == snapshot['mean']*4
+    assert abs(snapshot['total'] - 10) < 1e-9
+    assert abs(snapshot['max'] - 4) < 1e-9
+    assert snapshot['p50'] <= snapshot['p90'] <= snapshot['p99'] <= snapshot['max']
+
+
+def test_timings_reset():
+    recorded = stats.Stats()
+    recorded.record(hook, 0.001)
+    assert recorded.timings(reset=True)[stats.name(hook)].count == 1
+    assert recorded.timings() == {}
+
+
+def test_record_from_threads_keeps_every_count():
+    recorded = stats.Stats()
+
+    def run():
+        for _ in range(20000):
+            recorded.record(hook, 0.000001)
+
+    workers = [threading.Thread(target=run) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    timing = recorded.timings()[stats.name(hook)]
+    assert timing.count == sum(timing.buckets) == 80000
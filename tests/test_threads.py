@@ -0,0 +1,210 @@
+import threading
+from time import monotonic, time
+
+import pytest
+
+from .. import hooks
+from ..threads import Job, Scheduler, WorkerPool
+
+
+def job(*args, **kwargs):
+    return Job(hooks.interval(*args, **kwargs)(lambda bot: None), None)
+
+
+def on_second(at):
+    # whether monotonic time `at` falls on a whole second of the wall clock
+    return abs(round(time() - monotonic() + at) - (time() - monotonic() + at)) < 0.01
+
+
+def test_first_after_one_period():
+    assert job(500).first(100.0) == pytest.approx(100.5)
+    assert 100.5 <= job(500, 1500).first(100.0) <= 101.5
+
+
+def test_first_after_delay():
+    assert job(60000, delay=250).first(100.0) == pytest.approx(100.25)
+    assert job(60000, delay=0).first(100.0) == pytest.approx(100.0)
+
+
+def test_first_aligned():
+    at = monotonic()
+    due = job(1000, align=True).first(at)
+    assert at < due <= at + 1
+    assert on_second(due)
+
+
+def test_first_aligned_after_delay():
+    at = monotonic()
+    due = job(1000, delay=2500, align=True).first(at)
+    assert at + 2.5 < due <= at + 3.5
+    assert on_second(due)
+
+
+def test_next_skips_missed_ticks():
+    skip = job(1000)
+    assert skip.next(10.0, 10.2) == pytest.approx(11.0)
+    # ran 3.5 periods late: the missed ticks are dropped
+    assert skip.next(10.0, 13.5) == pytest.approx(14.5)
+
+
+def test_next_catches_up_missed_ticks():
+    catchup = job(1000, missed='catchup')
+    assert catchup.next(10.0, 10.2) == pytest.approx(11.0)
+    # each missed tick is due right away, one after the other
+    assert catchup.next(10.0, 13.5) == pytest.approx(11.0)
+    assert catchup.next(11.0, 13.6) == pytest.approx(12.0)
+
+
+def test_next_aligned():
+    at = monotonic()
+    skip, catchup = job(1000, align=True), job(1000, align=True, missed='catchup')
+    assert at + 3 < skip.next(at, at + 3) <= at + 4
+    assert at < catchup.next(at, at + 3) <= at + 1
+
+
+class Ref(object):
+    def __init__(self):
+        self.runs = []
+        self.threads = set()
+        self.ran = threading.Event()
+
+    def _call(self, func, bot):
+        self.runs.append(func.__name__)
+        self.threads.add(threading.current_thread())
+        if len(self.runs) >= 4:
+            self.ran.set()
+
+
+def hook(name, ms):
+    def func(bot):
+        pass
+    func.__name__ = name
+    return hooks.interval(ms, delay=0)(func)
+
+
+def test_scheduler_runs_hooks_on_one_thread():
+    scheduler, ref = Scheduler(), Ref()
+    try:
+        scheduler.schedule(ref, [hook('a', 10), hook('b', 10)])
+        assert ref.ran.wait(2)
+    finally:
+        scheduler.shutdown()
+    assert {'a', 'b'} <= set(ref.runs)
+    assert len(ref.threads) == 1
+
+
+def test_scheduler_cancel():
+    scheduler, ref = Scheduler(), Ref()
+    try:
+        scheduler.schedule(ref, [hook('a', 10)])
+        assert ref.ran.wait(2)
+        scheduler.cancel(ref)
+        runs = len(ref.runs)
+        threading.Event().wait(0.05)
+    finally:
+        scheduler.shutdown()
+    assert len(ref.runs) <= runs + 1
+
+
+class Bot(object):
+    """
+    Stands in for the bot a WorkerPool runs hooks for
+    """
+    config = {'name': 'test', 'host': 'test.invalid'}
+
+    def __init__(self):
+        self.errors = 0
+        self.log = self
+        self.warnings = []
+
+    def _call(self, func, *args):
+        return func(*args)
+
+    def _log_exception(self):
+        self.errors += 1
+
+    def warning(self, msg, *args):
+        self.warnings.append(msg % args)
+
+
+def test_pool_runs_calls_in_order_per_key():
+    pool = WorkerPool(Bot(), 4)
+    done = {key: [] for key in 'abc'}
+    finished = threading.Semaphore(0)
+
+    def call(key, n):
+        threading.Event().wait(0.001*((n*7) % 3))
+        done[key].append(n)
+        finished.release()
+
+    for n in range(10):
+        for key in 'abc':
+            pool.submit(call, (key, n), key)
+    for _ in range(30):
+        assert finished.acquire(timeout=2)
+    pool.shutdown()
+    assert done == {key: list(range(10)) for key in 'abc'}
+    stats = pool.stats()
+    assert stats['submitted'] == stats['completed'] == 30
+    assert stats['workers'] <= 4
+
+
+def test_pool_runs_keys_side_by_side():
+    pool = WorkerPool(Bot(), 2)
+    release = threading.Event()
+    ran = threading.Event()
+    pool.submit(release.wait, (2,), 'slow')
+    pool.submit(ran.set, (), 'other')
+    try:
+        assert ran.wait(1)
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_pool_logs_failed_calls():
+    bot = Bot()
+    pool = WorkerPool(bot, 1)
+    ran = threading.Event()
+    pool.submit(lambda: 1/0, (), 'a')
+    pool.submit(ran.set, (), 'a')
+    assert ran.wait(1)
+    pool.shutdown()
+    assert bot.errors == 1
+    assert pool.stats()['failed'] == 1
+
+
+def test_pool_gives_up_on_calls_past_timeout():
+    bot = Bot()
+    pool = WorkerPool(bot, 1, timeout=0.05)
+    release = threading.Event()
+    ran = threading.Event()
+
+    def hang():
+        release.wait(2)
+
+    pool.submit(hang, (), 'a')
+    pool.submit(ran.set, (), 'a')
+    try:
+        # the key's next call goes ahead on a new worker
+        assert ran.wait(1)
+    finally:
+        release.set()
+    pool.shutdown()
+    assert pool.stats()['timeouts'] == 1
+    assert bot.warnings == ['(test: test.invalid) Hook hang timed out after 0.05 seconds']
+
+
+def test_pool_call_timeout_overrides_default():
+    bot = Bot()
+    pool = WorkerPool(bot, 1)
+    release = threading.Event()
+    ran = threading.Event()
+    pool.submit(release.wait, (2,), 'a', timeout=0.05)
+    pool.submit(ran.set, (), 'a')
+    try:
+        assert ran.wait(1)
+    finally:
+        release.set()
+    pool.shutdown()
+    assert pool.stats()['timeouts'] == 1
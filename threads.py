@@ -1,62 +1,496 @@
+import multiprocessing
 import threading
 import sys
-from traceback import print_tb,print_exc
-from random import randint
+from traceback import print_exc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from importlib import import_module
+from heapq import heappush, heappop
+from itertools import count
+from os import cpu_count
+from random import randint, uniform
 from time import ctime as now
+from time import monotonic, time
 
-class JobThread(threading.Thread):
+class Job(object):
     """
-    Thread that executes a job every N milliseconds
+    An interval hook of one bot, as run by the Scheduler
     """
 
     def __init__(self, func, ref):
-        threading.Thread.__init__(self)
-        self._finished  = threading.Event()
         self._func      = func
         self._ref       = ref
         self._error     = False
-        
-    def copy(self):
-        return self.__class__(self._func, self._ref)
+        self.cancelled  = False
+
+    def period(self):
+        """
+        Seconds between runs, picked between the hook's min and max
+        """
+        if self._func._max:
+            return randint(self._func._min, self._func._max)*0.001
+        return self._func._min*0.001
+
+    def first(self, at):
+        """
+        When to run first, after the hook's delay or else one period.
+        An aligned hook runs at the first aligned time after its delay.
+        """
+        if self._func._delay is not None:
+            at += self._func._delay*0.001
+            if not self._func._align:
+                return at
+        if self._func._align:
+            return self._aligned(at)
+        return at + self.period()
+
+    def next(self, last, at):
+        """
+        When to run next, having last been due at `last` and run until `at`.
+        Ticks missed meanwhile are run right away with the 'catchup' policy
+        and dropped with 'skip'.
+        """
+        catchup = self._func._missed == 'catchup'
+        if self._func._align:
+            return self._aligned(last if catchup else at)
+        due = last + self.period()
+        if due <= at and not catchup:
+            due = at + self.period()
+        return due
+
+    def _aligned(self, at):
+        # next multiple of the period on the wall clock, plus any jitter
+        period = self._func._min*0.001
+        wall = time() - monotonic() + at
+        due = (wall // period + 1)*period - wall + at
+        if self._func._max:
+            due += uniform(0, (self._func._max - self._func._min)*0.001)
+        return due
+
+    def run(self):
+        try:
+            self._ref._call(self._func, self._ref)
+            self._error = False
+        except:
+            if not self._error:
+                self._ref.log.error(">>>Exception occured in thread: %s", sys.exc_info()[1],
+                                    exc_info=True)
+                f = open('{0} - ThreadLog.txt'.format(self._ref.config['name']),'a')
+                f.write("\r\n")
+                f.write(now())
+                f.write("\r\nConnection: {0}\r\n".format(self._ref.config['host']))
+                print_exc(None,f)
+                f.write("\r\n")
+                f.close()
+                self._error = True
+
+
+class Scheduler(object):
+    """
+    Runs the interval hooks of one or more bots off a timer heap.
+
+    One thread runs the hooks as they become due, so a slow hook holds up
+    the others. With `workers` above 1, up to that many threads take turns,
+    and a slow hook only holds up the others once every thread is busy.
+    A hook isn't due again until its run is over. Stopped by shutdown(),
+    and started again by the next schedule().
+    """
+
+    def __init__(self, workers=1):
+        self.workers    = workers
+        self._heap      = []
+        self._jobs      = {}
+        self._cond      = threading.Condition()
+        self._seq       = count()
+        # threads of earlier generations stop once they notice
+        self._generation = 0
+        self._threads   = 0
+        self._waiting   = 0
+
+    def schedule(self, ref, funcs):
+        """
+        (Re)schedules the interval hooks of a bot, replacing any it had
+        """
+        with self._cond:
+            self.cancel(ref)
+            at = monotonic()
+            jobs = self._jobs[ref] = [Job(func, ref) for func in funcs]
+            for job in jobs:
+                heappush(self._heap, (job.first(at), next(self._seq), job))
+            if jobs and not self._threads:
+                self._spawn()
+            self._cond.notify()
+
+    def cancel(self, ref):
+        """
+        Stops running the interval hooks of a bot
+        """
+        with self._cond:
+            for job in self._jobs.pop(ref, []):
+                job.cancelled = True
+
+    def shutdown(self):
+        """
+        Stop the scheduler's threads, once any hooks they're running return
+        """
+        with self._cond:
+            self._generation += 1
+            self._threads = self._waiting = 0
+            self._cond.notify_all()
+
+    def _spawn(self):
+        self._threads += 1
+        threading.Thread(None, self._run, name='scheduler', args=(self._generation,), daemon=True).start()
+
+    def _wait(self, generation, timeout=None):
+        self._waiting += 1
+        self._cond.wait(timeout)
+        if generation == self._generation:
+            self._waiting -= 1
+
+    def _run(self, generation):
+        """
+        Run each job when due until it's shutdown
+        """
+        with self._cond:
+            while generation == self._generation:
+                if not self._heap:
+                    if self._threads > 1:
+                        self._threads -= 1  # one is enough to wait
+                        return
+                    self._wait(generation)
+                    continue
+                due, seq, job = self._heap[0]
+                if job.cancelled:
+                    heappop(self._heap)
+                    continue
+                wait = due - monotonic()
+                if wait > 0:
+                    self._wait(generation, wait)
+                    continue
+                heappop(self._heap)
+                if not self._waiting and self._threads < self.workers:
+                    self._spawn()  # to keep time while this one is busy
+                self._cond.release()
+                try:
+                    job.run()
+                finally:
+                    self._cond.acquire()
+                if not job.cancelled:
+                    heappush(self._heap, (job.next(due, monotonic()), next(self._seq), job))
+                    self._cond.notify()
+
+
+class SendThread(threading.Thread):
+    """
+    Thread that writes a bot's queued outgoing lines as they become due
+    """
+
+    def __init__(self, ref):
+        threading.Thread.__init__(self, daemon=True)
+        self._finished  = threading.Event()
+        self._wake      = threading.Event()
+        self._ref       = ref
+
+    def wake(self):
+        """
+        Have the queue checked again, a line was added to it
+        """
+        self._wake.set()
 
     def shutdown(self):
         """
         Stop this thread
         """
         self._finished.set()
-        
-    def is_shutdown(self):
-        """ 
-        Boolean check on the thread's state 
-        """
-        return bool(self._finished.isSet())
+        self._wake.set()
 
     def run(self):
         """
-        Keep running this thread until it's shutdown
-        """
-        self._finished.wait(10)
-        while not self._finished.isSet():
-            try:
-                self._func(self._ref)
-                self._error = False
-            except:
-                if not self._error:
-                    print(" ")
-                    print(">>>Exception occured in thread: {0}".format(sys.exc_info()[1]))
-                    print_tb(sys.exc_info()[2])
-                    print(" ")
-                    f = open('{0} - ThreadLog.txt'.format(self._ref.config['name']),'a')
-                    f.write("\r\n")
-                    f.write(now())
-                    f.write("\r\nConnection: {0}\r\n".format(self._ref.config['host']))
-                    print_exc(None,f)
-                    f.write("\r\n")
-                    f.close()
-                    self._error = True
-            finally:
-                if self._func._max:
-                    self._finished.wait(randint(self._func._min,self._func._max)*0.001)
-                else:
-                    self._finished.wait(self._func._min*0.001)
-            
+        Keep writing due lines until it's shutdown
+        """
+        while not self._finished.is_set():
+            due = self._ref._flush()
+            self._wake.wait(None if due is None else max(0, due - monotonic()))
+            self._wake.clear()
+
+
+class _Call(object):
+    """
+    A hook call waiting in, or run by, a WorkerPool
+    """
+    __slots__ = ('func', 'args', 'key', 'timeout', 'queued', 'deadline', 'abandoned')
+
+    def __init__(self, func, args, key, timeout):
+        self.func       = func
+        self.args       = args
+        self.key        = key
+        self.timeout    = timeout
+        self.queued     = monotonic()
+        self.deadline   = None
+        self.abandoned  = False
+
+
+class WorkerPool(object):
+    """
+    Bounded pool of threads running a bot's matched hooks, so its socket
+    thread only parses and dispatches.
+
+    Calls submitted with the same key (eg. the channel) run one at a time
+    in the order they were submitted. A call running past its timeout is
+    logged and given up on: the rest of its key's calls go ahead and a new
+    worker takes the place of the one it still holds.
+    """
+
+    def __init__(self, ref, size, timeout=None):
+        self._ref       = ref
+        self.size       = size
+        self.timeout    = timeout
+        self._lock      = threading.Lock()
+        self._work      = threading.Condition(self._lock)
+        self._watch     = threading.Condition(self._lock)
+        self._lanes     = {}
+        self._ready     = deque()
+        self._running   = set()
+        self._workers   = 0
+        self._watchdog  = None
+        self._finished  = False
+        self._stats     = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'timeouts': 0,
+            'max_queued': 0, 'waited': 0.0, 'max_waited': 0.0, 'ran': 0.0
+        }
+
+    def submit(self, func, args, key=None, timeout=None):
+        """
+        Queues func(*args) behind the other calls for key
+        """
+        if timeout is None:
+            timeout = self.timeout
+        call = _Call(func, args, key, timeout)
+        with self._lock:
+            if self._finished:
+                return
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = deque()
+                self._ready.append(key)
+            lane.append(call)
+            self._stats['submitted'] += 1
+            self._stats['max_queued'] = max(self._stats['max_queued'], self._queued())
+            if self._workers < self.size and self._workers - len(self._running) < len(self._ready):
+                self._spawn()
+            if timeout is not None and self._watchdog is None:
+                self._watchdog = threading.Thread(
+                    target=self._watch_loop, name='hook watchdog', daemon=True)
+                self._watchdog.start()
+            self._work.notify()
+
+    def stats(self):
+        """
+        Queue depth, worker and timing counters of the pool
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            finished = stats['completed'] + stats['failed'] + stats['timeouts']
+            started = finished + len(self._running)
+            stats.update(
+                workers=self._workers,
+                running=len(self._running),
+                queued=self._queued(),
+                keys=len(self._lanes),
+                avg_waited=stats['waited']/started if started else 0.0,
+                avg_ran=stats['ran']/finished if finished else 0.0
+            )
+        return stats
+
+    def shutdown(self):
+        """
+        Drops the queued calls and stops the workers once they're idle
+        """
+        with self._lock:
+            self._finished = True
+            self._lanes.clear()
+            self._ready.clear()
+            self._work.notify_all()
+            self._watch.notify()
+
+    def _queued(self):
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def _spawn(self):
+        self._workers += 1
+        threading.Thread(target=self._worker, name='hook worker', daemon=True).start()
+
+    def _release(self, key):
+        # let the next call for key go ahead, with the lock held
+        if self._lanes.get(key):
+            self._ready.append(key)
+            self._work.notify()
+        else:
+            self._lanes.pop(key, None)
+
+    def _worker(self):
+        call = None
+        self._lock.acquire()
+        try:
+            while True:
+                while not self._ready and not self._finished:
+                    self._work.wait()
+                if self._finished:
+                    break
+                key = self._ready.popleft()
+                call = self._lanes[key].popleft()
+                started = monotonic()
+                waited = started - call.queued
+                self._stats['waited'] += waited
+                self._stats['max_waited'] = max(self._stats['max_waited'], waited)
+                if call.timeout is not None:
+                    call.deadline = started + call.timeout
+                    self._watch.notify()
+                self._running.add(call)
+                self._lock.release()
+                failed = False
+                try:
+                    self._ref._call(call.func, *call.args)
+                except Exception:
+                    failed = True
+                    self._ref._log_exception()
+                finally:
+                    self._lock.acquire()
+                self._running.discard(call)
+                if call.abandoned:
+                    # the watchdog has already replaced this worker
+                    return
+                self._stats['ran'] += monotonic() - started
+                self._stats['failed' if failed else 'completed'] += 1
+                self._release(key)
+        finally:
+            if call is None or not call.abandoned:
+                self._workers -= 1
+            self._lock.release()
+
+    def _watch_loop(self):
+        with self._lock:
+            while not self._finished:
+                deadlines = [call.deadline for call in self._running if call.deadline is not None]
+                if not deadlines:
+                    self._watch.wait()
+                    continue
+                wait = min(deadlines) - monotonic()
+                if wait > 0:
+                    self._watch.wait(wait)
+                    continue
+                at = monotonic()
+                for call in list(self._running):
+                    if call.deadline is not None and call.deadline <= at:
+                        self._running.discard(call)
+                        call.abandoned = True
+                        self._stats['timeouts'] += 1
+                        self._stats['ran'] += call.timeout
+                        self._ref.log.warning(
+                            "(%s: %s) Hook %s timed out after %s seconds",
+                            self._ref.config['name'],
+                            self._ref.config['host'],
+                            getattr(call.func, '__name__', call.func),
+                            call.timeout
+                        )
+                        self._workers -= 1
+                        self._spawn()
+                        self._release(call.key)
+
+
+class Remote(object):
+    """
+    Stands in for the bot as `self` in a hook run on the process pool.
+
+    It carries a snapshot of the bot's config and isupport. Calls to the
+    bot's methods listed in _calls (message, notice, join, ...) are
+    recorded and made on the real bot once the hook returns; any other
+    attribute raises AttributeError.
+    """
+
+    def __init__(self, config, isupport):
+        self.config     = config
+        self.isupport   = isupport
+        self.calls      = []
+        self._replace_cache = {}
+        self._replace_values = ()
+
+    # the bot's methods a hook may call, made on the bot once it returns
+    _calls = frozenset(('message', 'notice', 'me', 'join', 'part', 'nick',
+                        'ping', 'quit', 'pause', 'ns', 'cs'))
+
+    def __getattr__(self, name):
+        if name not in self._calls:
+            raise AttributeError(name)
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+
+_processes = None
+_processes_size = 0
+_processes_modules = frozenset()
+_processes_funcs = {}
+_processes_lock = threading.Lock()
+
+def process_pool():
+    """
+    The process pool shared by every bot, as last started by
+    start_process_pool (with one process per CPU if it never was)
+    """
+    with _processes_lock:
+        if _processes is None:
+            _start_processes(None, (), ())
+        return _processes
+
+def start_process_pool(size=None, modules=(), funcs=()):
+    """
+    Makes sure the shared process pool can run a bot's process hooks
+    `funcs` with `size` processes (one per CPU if None) that imported the
+    hook `modules`. The pool is started and warmed up right away, and
+    replaced by a new one when it has fewer processes, lacks one of the
+    modules or runs older versions of the hooks (eg. after a reload).
+    Calls already submitted to a replaced pool still run.
+    """
+    with _processes_lock:
+        size = size or cpu_count() or 1
+        stale = any(_processes_funcs.get(_key(func), func) is not func for func in funcs)
+        if _processes is None or stale or size > _processes_size or \
+                not _processes_modules.issuperset(modules):
+            _start_processes(size, modules, funcs)
+        else:
+            _processes_funcs.update((_key(func), func) for func in funcs)
+        return _processes
+
+def _start_processes(size, modules, funcs):
+    # with _processes_lock held
+    global _processes, _processes_size, _processes_modules
+    old = _processes
+    _processes_size = max(size or cpu_count() or 1, _processes_size)
+    _processes_modules = _processes_modules.union(modules)
+    _processes_funcs.update((_key(func), func) for func in funcs)
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except ValueError:
+        context = multiprocessing.get_context('spawn')
+    _processes = ProcessPoolExecutor(
+        _processes_size, mp_context=context, initializer=_load_modules,
+        initargs=(tuple(sorted(_processes_modules)),))
+    if old is not None:
+        old.shutdown(wait=False)
+    # have every process started and the modules imported before any hook
+    # is submitted
+    wait([_processes.submit(int) for _ in range(_processes_size)])
+
+def _key(func):
+    return func.__module__, func.__qualname__
+
+def _load_modules(modules):
+    for module in modules:
+        import_module(module)
+
+def _run_remote(func, remote, info):
+    # runs in a pool process
+    result = func(remote, info)
+    return result, remote.calls